@@ -0,0 +1,214 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from executors import POOLS, PoolSaturatedError
+from job_queue import job_queue
+from metrics import ADMISSION_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MIN_FREE_MB = int(os.getenv("ADMISSION_MIN_FREE_MB", "1024"))
+ADMISSION_MAX_MEMORY_PERCENT = float(os.getenv("ADMISSION_MAX_MEMORY_PERCENT", "90"))
+ADMISSION_MAX_LOAD_PER_CPU = float(os.getenv("ADMISSION_MAX_LOAD_PER_CPU", "2.0"))
+ADMISSION_MAX_QUEUE_FILL = float(os.getenv("ADMISSION_MAX_QUEUE_FILL", "0.8"))
+ADMISSION_CHECK_INTERVAL = float(os.getenv("ADMISSION_CHECK_INTERVAL", "2"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "30"))
+
+# Admission states, from least to most loaded
+READY = "ready"
+THROTTLED = "throttled"      # queued jobs wait; work that would start right away is refused
+OVERLOADED = "overloaded"    # all new work is refused and the instance reports not ready
+
+class ServerOverloadedError(PoolSaturatedError):
+    """Raised when admission control refuses new work"""
+
+    def __init__(self, reasons: List[str], retry_after: int = ADMISSION_RETRY_AFTER):
+        Exception.__init__(self, f"Server busy: {'; '.join(reasons)}, please retry later")
+        self.pool_name = "admission"
+        self.retry_after = retry_after
+        self.reasons = reasons
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _memory_usage() -> Optional[Tuple[int, int]]:
+    """(bytes in use, limit) for the container's cgroup, or the host when unlimited.
+
+    Page cache the kernel can reclaim (inactive_file) is not counted, the same
+    working-set figure the OOM killer is effectively judged against.
+    """
+    # cgroup v2
+    limit, current = _read("/sys/fs/cgroup/memory.max"), _read("/sys/fs/cgroup/memory.current")
+    stat_path = "/sys/fs/cgroup/memory.stat"
+    inactive_key = "inactive_file"
+    if limit is None or current is None:
+        # cgroup v1
+        limit = _read("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+        current = _read("/sys/fs/cgroup/memory/memory.usage_in_bytes")
+        stat_path = "/sys/fs/cgroup/memory/memory.stat"
+        inactive_key = "total_inactive_file"
+    total, available = None, None
+    meminfo = _read("/proc/meminfo") or ""
+    for line in meminfo.splitlines():
+        key, _, value = line.partition(":")
+        if key == "MemTotal":
+            total = int(value.split()[0]) * 1024
+        elif key == "MemAvailable":
+            available = int(value.split()[0]) * 1024
+    if limit and current and limit.isdigit() and total and int(limit) < total:
+        inactive = 0
+        for line in (_read(stat_path) or "").splitlines():
+            key, _, value = line.partition(" ")
+            if key == inactive_key and value.isdigit():
+                inactive = int(value)
+        return max(0, int(current) - inactive), int(limit)
+    if total and available is not None:
+        return total - available, total
+    return None
+
+def _host_cpu_count() -> int:
+    """CPUs on the host.
+
+    The load average counts runnable tasks across the whole host, not just
+    this container, so it is only meaningful against the host's CPU count.
+    Dividing it by a container's CPU quota would make a small container on
+    a busy shared host look permanently overloaded.
+    """
+    return os.cpu_count() or 1
+
+class AdmissionController:
+    """Decides whether new download work is admitted, from current resource pressure.
+
+    Every ADMISSION_CHECK_INTERVAL seconds it samples free space on
+    STORAGE_DIR, memory, CPU load and how full the worker queues are. Low disk
+    or high memory means the next download could fill the disk or get the
+    container OOM-killed, so the state becomes overloaded: every new job is
+    refused with 503 + Retry-After and /health/ready fails so the load
+    balancer routes elsewhere. High CPU load or nearly full queues only
+    throttle: /download jobs are still accepted into the durable queue but
+    the job dispatcher holds off starting them (unless the job queue itself is what
+    is full), and requests that would start work immediately (streams,
+    segments) are refused.
+    """
+
+    def __init__(self, storage_dir: Path, enabled: bool = ADMISSION_ENABLED,
+                 interval: float = ADMISSION_CHECK_INTERVAL):
+        self.storage_dir = Path(storage_dir)
+        self.enabled = enabled
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._snapshot: Dict = {"state": READY, "reasons": [], "hold_jobs": False}
+        self.rejected = 0
+        self.transitions = 0
+
+    def _sample(self) -> Dict:
+        overload: List[str] = []
+        throttle: List[str] = []
+
+        try:
+            free_mb = shutil.disk_usage(self.storage_dir).free // (1024 * 1024)
+        except OSError:
+            free_mb = None
+        if free_mb is not None and free_mb < ADMISSION_MIN_FREE_MB:
+            overload.append(f"low disk space ({free_mb} MB free)")
+
+        memory = _memory_usage()
+        memory_percent = round(memory[0] / memory[1] * 100, 1) if memory and memory[1] else None
+        if memory_percent is not None and memory_percent >= ADMISSION_MAX_MEMORY_PERCENT:
+            overload.append(f"memory at {memory_percent}%")
+
+        try:
+            load_per_cpu = round(os.getloadavg()[0] / _host_cpu_count(), 2)
+        except OSError:
+            load_per_cpu = None
+        if load_per_cpu is not None and load_per_cpu >= ADMISSION_MAX_LOAD_PER_CPU:
+            throttle.append(f"host CPU load {load_per_cpu} per core")
+
+        queues = {name: (pool.stats()["queued"], pool.max_queue) for name, pool in POOLS.items()}
+        jobs = job_queue.stats()
+        queues["job"] = (jobs["queued"], jobs["max_pending"])
+        queue_fill = {name: round(queued / capacity, 2) if capacity else 0.0
+                      for name, (queued, capacity) in queues.items()}
+        for name, fill in queue_fill.items():
+            if fill >= ADMISSION_MAX_QUEUE_FILL and name != "job":
+                throttle.append(f"{name} queue {int(fill * 100)}% full")
+        # Holding workers back relieves the pressure behind a full job queue, not the queue itself
+        hold_jobs = bool(overload or throttle)
+        if queue_fill["job"] >= ADMISSION_MAX_QUEUE_FILL:
+            throttle.append(f"job queue {int(queue_fill['job'] * 100)}% full")
+
+        state = OVERLOADED if overload else THROTTLED if throttle else READY
+        return {
+            "state": state,
+            "reasons": overload + throttle,
+            "hold_jobs": hold_jobs,
+            "free_mb": free_mb,
+            "memory_percent": memory_percent,
+            "load_per_cpu": load_per_cpu,
+            "queue_fill": queue_fill,
+        }
+
+    def snapshot(self) -> Dict:
+        """Latest resource sample, refreshed at most every interval seconds"""
+        if not self.enabled:
+            return {"state": READY, "reasons": [], "hold_jobs": False}
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.interval:
+                previous = self._snapshot["state"]
+                self._snapshot = self._sample()
+                self._checked_at = time.monotonic()
+                if self._snapshot["state"] != previous:
+                    self.transitions += 1
+                    reasons = ", ".join(self._snapshot["reasons"]) or "pressure cleared"
+                    logger.warning(f"Admission state {previous} -> {self._snapshot['state']}: {reasons}")
+            return self._snapshot
+
+    @property
+    def state(self) -> str:
+        return self.snapshot()["state"]
+
+    def is_ready(self) -> bool:
+        """Whether the load balancer should keep sending traffic here"""
+        return self.state != OVERLOADED
+
+    def can_start_job(self) -> bool:
+        """Whether the job dispatcher may start the next queued job"""
+        return not self.snapshot()["hold_jobs"]
+
+    def check(self, immediate: bool = False) -> None:
+        """Admit new work or raise ServerOverloadedError.
+
+        immediate is for work that starts as soon as it is admitted rather than
+        waiting in the job queue; it is refused while throttled as well.
+        """
+        snapshot = self.snapshot()
+        state = snapshot["state"]
+        if state == READY or (state == THROTTLED and not immediate):
+            return
+        with self._lock:
+            self.rejected += 1
+        ADMISSION_REJECTIONS.labels(state=state).inc()
+        raise ServerOverloadedError(snapshot["reasons"])
+
+    def stats(self) -> Dict:
+        """Readiness, the current state and what caused it"""
+        snapshot = dict(self.snapshot())
+        snapshot.update({
+            "enabled": self.enabled,
+            "ready": snapshot["state"] != OVERLOADED,
+            "rejected": self.rejected,
+            "transitions": self.transitions,
+        })
+        return snapshot
@@ -0,0 +1,103 @@
+import os
+import logging
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from ffmpeg_runner import ffmpeg_runner, fraction_progress
+from media_pipeline import probe_codecs
+from metrics import timed_ffmpeg
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+AUDIO_MP3_BITRATE = os.getenv("AUDIO_MP3_BITRATE", "192k")
+AUDIO_AAC_BITRATE = os.getenv("AUDIO_AAC_BITRATE", "192k")
+AUDIO_OPUS_BITRATE = os.getenv("AUDIO_OPUS_BITRATE", "128k")
+
+# Audio output formats: source codecs that are stream-copied, and the encoder used otherwise
+AUDIO_FORMATS = {
+    "mp3": {"copy": {"mp3"}, "encode": ['-c:a', 'libmp3lame', '-b:a', AUDIO_MP3_BITRATE, '-ar', '44100']},
+    "m4a": {"copy": {"aac", "alac"}, "encode": ['-c:a', 'aac', '-b:a', AUDIO_AAC_BITRATE]},
+    "opus": {"copy": {"opus"}, "encode": ['-c:a', 'libopus', '-b:a', AUDIO_OPUS_BITRATE]},
+}
+
+# yt-dlp format selectors preferring a source whose native codec each format can copy
+AUDIO_FORMAT_SELECTORS = {
+    "mp3": "bestaudio/best",
+    "m4a": "bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best",
+    "opus": "bestaudio[acodec=opus]/bestaudio/best",
+}
+
+def is_audio_format(output_format: Optional[str]) -> bool:
+    return output_format in AUDIO_FORMATS
+
+def audio_format_selector(output_format: str) -> str:
+    """yt-dlp format selector for an audio output format"""
+    return AUDIO_FORMAT_SELECTORS[output_format]
+
+def can_passthrough(output_format: str, codec: Optional[str]) -> bool:
+    """Whether the source audio codec can be stream-copied into output_format"""
+    return codec in AUDIO_FORMATS[output_format]["copy"]
+
+def build_audio_command(input_path: str, output_path: str, output_format: str, codec: Optional[str],
+                        start_time: Optional[float] = None, end_time: Optional[float] = None) -> List[str]:
+    """One ffmpeg invocation that cuts the source audio and encodes (or copies) it"""
+    cmd = ['ffmpeg', '-v', 'error']
+    if start_time is not None:
+        cmd += ['-ss', str(start_time)]
+    cmd += ['-i', input_path]
+    if end_time is not None:
+        cmd += ['-t', str(end_time - (start_time or 0))]
+    cmd += ['-map', '0:a:0', '-vn']
+    if can_passthrough(output_format, codec):
+        cmd += ['-c:a', 'copy']
+    else:
+        cmd += AUDIO_FORMATS[output_format]["encode"]
+    if output_format == "m4a":
+        cmd += ['-movflags', '+faststart']
+    return cmd + ['-y', output_path]
+
+@traced("ffmpeg.process_audio")
+@timed_ffmpeg("process_audio")
+async def process_audio_async(input_path: Path, output_path: Path, output_format: str,
+                  start_time: Optional[float] = None, end_time: Optional[float] = None,
+                  progress_callback: Optional[Callable[[float], None]] = None) -> Path:
+    """Turn a downloaded source into the final audio file with a single ffmpeg pass.
+
+    The segment cut and the encode happen in the same invocation, straight from
+    the source audio stream. m4a and opus copy a matching native track with no
+    re-encode, and MP3 sources are copied into MP3. The source file is removed
+    and the path of the finished file is returned.
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    codec = (await probe_codecs(str(input_path))).get("audio")
+    if codec is None:
+        raise RuntimeError(f"No audio stream in {input_path.name}")
+
+    is_cut = start_time is not None or end_time is not None
+    if not is_cut and can_passthrough(output_format, codec) and input_path.suffix == output_path.suffix:
+        os.replace(input_path, output_path)
+        return output_path
+
+    cmd = build_audio_command(str(input_path), str(output_path), output_format, codec, start_time, end_time)
+    mode = "copy" if can_passthrough(output_format, codec) else "encode"
+    logger.info(f"Audio {mode} {codec} -> {output_format}: {input_path.name} -> {output_path.name}")
+    duration = end_time - start_time if start_time is not None and end_time is not None else None
+    result = await ffmpeg_runner.run(cmd, duration, fraction_progress(progress_callback if duration is not None else None))
+    if not result.ok:
+        logger.error(f"ffmpeg audio processing failed: {result.stderr.strip()[-500:]}")
+        output_path.unlink(missing_ok=True)
+        raise RuntimeError(f"Audio processing failed for {input_path.name}")
+    input_path.unlink(missing_ok=True)
+    if progress_callback:
+        progress_callback(1.0)
+    return output_path
+
+def process_audio(input_path: Path, output_path: Path, output_format: str,
+                  start_time: Optional[float] = None, end_time: Optional[float] = None,
+                  progress_callback: Optional[Callable[[float], None]] = None) -> Path:
+    """Blocking process_audio_async for worker threads"""
+    return ffmpeg_runner.call(
+        process_audio_async(input_path, output_path, output_format, start_time, end_time, progress_callback)
+    )
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Hermetic benchmark for /extract, /download (fresh and repeated), /download-segment and /files.
+
+Synthetic clips are generated with ffmpeg (testsrc + sine) and served from a
+local HTTP server that yt-dlp's generic extractor can fetch. The FastAPI app
+from main.py is driven in-process, so no network access is needed.
+
+Usage (from the backend directory):
+    python benchmarks/bench_api.py
+    python benchmarks/bench_api.py --requests 50 --concurrency 8
+    python benchmarks/bench_api.py --compare benchmarks/results/api_<rev>_<time>.json
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import (
+    MediaServer, compare_results, generate_media, load_backend, peak_rss_mb,
+    require_ffmpeg, summarize_latencies, write_results,
+)
+
+SCENARIOS = ["extract_cold", "extract_warm", "download", "download_repeat", "download_segment", "files"]
+
+async def run_load(requests: int, concurrency: int, make_request) -> Dict:
+    """Issue `requests` calls of make_request(i) with bounded concurrency"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await make_request(i)
+            except Exception as e:
+                print(f"   ⚠️ request {i} failed: {e}")
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize_latencies(latencies, time.perf_counter() - wall_start, errors)
+
+async def benchmark(args, main, server: MediaServer, clip_name: str) -> Dict:
+    """Run every selected scenario against the in-process app"""
+    results: Dict[str, Dict] = {}
+    transport = httpx.ASGITransport(app=main.app)
+    # ASGITransport doesn't send lifespan events; run startup (job dispatcher) ourselves
+    async with main.app.router.lifespan_context(main.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        # Unique query strings defeat the metadata caches; the media server ignores them
+        def clip_url(i: int) -> str:
+            return f"{server.url(clip_name)}?n={i}"
+
+        async def extract(i: int, url: str) -> bool:
+            response = await client.post("/extract", json={"url": url})
+            return response.status_code == 200
+
+        async def download(i: int, url: str) -> bool:
+            response = await client.post("/download", json={
+                "url": url, "format_id": "best",
+                "output_format": args.output_format, "device_type": "linux", "wait": True,
+            })
+            return response.status_code == 200
+
+        async def download_segment(i: int) -> bool:
+            response = await client.post("/download-segment", json={
+                "url": clip_url(20_000 + i), "format_id": "best",
+                "output_format": args.output_format, "device_type": "linux",
+                "start_time": args.segment_start, "end_time": args.segment_start + args.segment_length,
+            })
+            if response.status_code != 200:
+                return False
+            progress_id = response.json()["progress_id"]
+            while True:
+                progress = (await client.get(f"/segment-progress/{progress_id}")).json()
+                if progress.get("status") in ("completed", "error"):
+                    return progress.get("status") == "completed"
+                await asyncio.sleep(0.05)
+
+        if "extract_cold" in args.scenarios:
+            print("⏱️  extract_cold")
+            results["extract_cold"] = await run_load(args.requests, args.concurrency, lambda i: extract(i, clip_url(i)))
+        if "extract_warm" in args.scenarios:
+            print("⏱️  extract_warm")
+            await extract(0, server.url(clip_name))
+            results["extract_warm"] = await run_load(args.requests, args.concurrency, lambda i: extract(i, server.url(clip_name)))
+        if "download" in args.scenarios:
+            print("⏱️  download")
+            results["download"] = await run_load(args.download_requests, args.concurrency, lambda i: download(i, clip_url(10_000 + i)))
+        if "download_repeat" in args.scenarios:
+            # The same request again and again: served from the download cache after the first
+            print("⏱️  download_repeat")
+            await download(0, clip_url(15_000))
+            results["download_repeat"] = await run_load(args.requests, args.concurrency, lambda i: download(i, clip_url(15_000)))
+        if "download_segment" in args.scenarios:
+            print("⏱️  download_segment")
+            results["download_segment"] = await run_load(args.download_requests, args.concurrency, download_segment)
+        if "files" in args.scenarios:
+            print("⏱️  files")
+            seed = await client.post("/download", json={
+                "url": clip_url(30_000), "format_id": "best", "output_format": "mp4", "device_type": "linux", "wait": True,
+            })
+            download_url = seed.json()["download_url"]
+
+            async def fetch(i: int) -> bool:
+                response = await client.get(download_url)
+                return response.status_code == 200 and len(response.content) > 0
+
+            results["files"] = await run_load(args.requests, args.concurrency, fetch)
+
+    results["peak_rss"] = peak_rss_mb()
+    return results
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Hermetic API benchmark")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per extract/files scenario")
+    parser.add_argument("--download-requests", type=int, default=5, help="Requests per download scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=60, help="Synthetic clip length in seconds")
+    parser.add_argument("--resolution", default="640x360")
+    parser.add_argument("--output-format", default="mp4", choices=["mp4", "mp3"])
+    parser.add_argument("--segment-start", type=float, default=20)
+    parser.add_argument("--segment-length", type=float, default=10)
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--keep-throttle", action="store_true", help="Keep yt-dlp's sleep intervals")
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    args = parser.parse_args()
+
+    require_ffmpeg()
+    with tempfile.TemporaryDirectory(prefix="bench_api_") as tmp:
+        tmp = Path(tmp)
+        media_dir = tmp / "media"
+        clip_name = f"clip_{int(args.duration)}s_{args.resolution}.mp4"
+        print(f"🎬 Generating {clip_name}")
+        generate_media(media_dir / clip_name, args.duration, args.resolution)
+
+        main = load_backend(tmp / "work", disable_throttle=not args.keep_throttle)
+        with MediaServer(media_dir) as server:
+            results = asyncio.run(benchmark(args, main, server, clip_name))
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    path = write_results("api", results, config, args.output)
+    for scenario, metrics in results.items():
+        print(f"   {scenario:<18} {metrics}")
+    print(f"\n💾 Results written to {path}")
+    if args.compare:
+        compare_results(results, args.compare)
+
+if __name__ == "__main__":
+    main_cli()
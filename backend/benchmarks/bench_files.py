@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for serving downloaded files: the previous plain
+FileResponse path against RangeFileResponse (file_serving.py).
+
+A random file of --file-mb is served by a small app with both responses, and
+each is measured for whole-file downloads, single 206 ranges at random offsets
+(player seeks / resumed downloads) and multi-range requests. Results include
+latency percentiles, MB/s and the CPU time spent per GB served.
+
+By default the app is driven in-process through ASGI, which measures our own
+per-request overhead. With --server uvicorn it runs behind a real uvicorn on
+127.0.0.1, so socket writes are included; the zero-copy sendfile path is only
+taken by servers that offer the http.response.zerocopysend extension.
+
+Usage (from the backend directory):
+    python benchmarks/bench_files.py
+    python benchmarks/bench_files.py --file-mb 500 --requests 20 --server uvicorn
+    python benchmarks/bench_files.py --compare benchmarks/results/files_<rev>_<time>.json
+"""
+
+import os
+import sys
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import FileResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import (
+    BACKEND_DIR, compare_results, measure_resources, peak_rss_mb, summarize_latencies, write_results,
+)
+
+sys.path.insert(0, str(BACKEND_DIR))
+from file_serving import RangeFileResponse
+
+SCENARIOS = ["full", "range", "multirange"]
+PATHS = ["legacy", "range"]
+
+def build_app(directory: Path) -> FastAPI:
+    """Both ways of serving a file, side by side"""
+    app = FastAPI()
+
+    @app.get("/legacy/{filename}")
+    async def legacy(filename: str):
+        return FileResponse(path=str(directory / filename), filename=filename, media_type='application/octet-stream')
+
+    @app.get("/range/{filename}")
+    async def ranged(filename: str):
+        return RangeFileResponse(path=str(directory / filename), filename=filename)
+
+    return app
+
+class UvicornThread:
+    """Run the app under uvicorn on an ephemeral loopback port in a background thread"""
+
+    def __init__(self, app: FastAPI):
+        import uvicorn
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("127.0.0.1", 0))
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="off"))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.socket.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+        self.socket.close()
+
+async def run_load(requests: int, concurrency: int, make_request) -> Dict:
+    """Issue `requests` calls of make_request(i); each returns the body bytes received or -1"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    received = 0
+    errors = 0
+
+    async def one(i: int):
+        nonlocal received, errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                size = await make_request(i)
+            except Exception as e:
+                print(f"   ⚠️ request {i} failed: {e}")
+                size = -1
+            if size >= 0:
+                latencies.append(time.perf_counter() - start)
+                received += size
+            else:
+                errors += 1
+
+    with measure_resources() as usage:
+        await asyncio.gather(*(one(i) for i in range(requests)))
+    summary = summarize_latencies(latencies, usage["wall_s"], errors)
+    summary["mb_per_s"] = round(received / (1024 * 1024) / usage["wall_s"], 2) if usage["wall_s"] > 0 else 0.0
+    summary["cpu_s_per_gb"] = round(usage["cpu_s"] / (received / 1024 ** 3), 3) if received else 0.0
+    return summary
+
+async def benchmark(args, client: httpx.AsyncClient, filename: str, size: int) -> Dict:
+    results: Dict[str, Dict] = {}
+    range_bytes = args.range_kb * 1024
+    rng = random.Random(args.seed)
+
+    for path in args.paths:
+        url = f"/{path}/{filename}"
+
+        async def full(i: int) -> int:
+            received = 0
+            async with client.stream("GET", url) as response:
+                if response.status_code != 200:
+                    return -1
+                async for chunk in response.aiter_raw():
+                    received += len(chunk)
+            return received if received == size else -1
+
+        offsets = [rng.randrange(0, max(1, size - range_bytes)) for _ in range(args.requests * 4)]
+
+        async def ranged(i: int) -> int:
+            start = offsets[i]
+            response = await client.get(url, headers={"Range": f"bytes={start}-{start + range_bytes - 1}"})
+            return len(response.content) if response.status_code == 206 else -1
+
+        async def multirange(i: int) -> int:
+            starts = sorted(offsets[i * 4:i * 4 + 4])
+            spec = ",".join(f"{s}-{s + range_bytes // 4 - 1}" for s in starts)
+            response = await client.get(url, headers={"Range": f"bytes={spec}"})
+            return len(response.content) if response.status_code == 206 else -1
+
+        for scenario, make_request in (("full", full), ("range", ranged), ("multirange", multirange)):
+            if scenario not in args.scenarios:
+                continue
+            name = f"{path}_{scenario}"
+            print(f"⏱️  {name}")
+            results[name] = await run_load(args.requests, args.concurrency, make_request)
+    return results
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="File serving throughput benchmark")
+    parser.add_argument("--file-mb", type=int, default=100, help="Size of the served file")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--range-kb", type=int, default=1024, help="Bytes per range request (split over 4 for multi-range)")
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--paths", nargs="+", default=PATHS, choices=PATHS)
+    parser.add_argument("--server", default="asgi", choices=["asgi", "uvicorn"])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_files_") as tmp:
+        directory = Path(tmp)
+        filename = f"file_{args.file_mb}mb.mp4"
+        print(f"📄 Writing {filename}")
+        with open(directory / filename, "wb") as f:
+            for _ in range(args.file_mb):
+                f.write(os.urandom(1024 * 1024))
+        size = (directory / filename).stat().st_size
+        app = build_app(directory)
+
+        async def run(base_url: str, transport=None) -> Dict:
+            async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=600) as client:
+                return await benchmark(args, client, filename, size)
+
+        if args.server == "uvicorn":
+            try:
+                server = UvicornThread(app)
+            except ImportError:
+                sys.exit("❌ --server uvicorn needs uvicorn installed")
+            with server:
+                results = asyncio.run(run(server.base_url))
+        else:
+            results = asyncio.run(run("http://bench", httpx.ASGITransport(app=app)))
+
+    results["peak_rss"] = peak_rss_mb()
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    path = write_results("files", results, config, args.output)
+    for scenario, metrics in results.items():
+        print(f"   {scenario:<18} {metrics}")
+    print(f"\n💾 Results written to {path}")
+    if args.compare:
+        compare_results(results, args.compare, ("p50_ms", "p95_ms", "mb_per_s", "cpu_s_per_gb"))
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Latency of file operations in a flat STORAGE_DIR against the sharded
+StorageLayout (storage_layout.py) as the file count grows.
+
+For each layout, --files empty files named like real outputs are created through
+the layout. The benchmark reports create latency over the whole run and over the
+last 10% (when the directories are nearly full), then lookups of existing and
+missing names through locate() (what /files does for files the manifest does not
+know), listing the directory a file lives in, and deletes.
+
+Files are created under --dir, which defaults to the current directory, so the
+filesystem being measured is the one STORAGE_DIR would be on (not a tmpfs /tmp).
+Lookups run with a warm dentry cache; drop caches between runs for cold numbers.
+
+Usage (from the backend directory):
+    python benchmarks/bench_layout.py
+    python benchmarks/bench_layout.py --files 100000 --layouts sharded --dir /data
+    python benchmarks/bench_layout.py --compare benchmarks/results/layout_<rev>_<time>.json
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import BACKEND_DIR, compare_results, peak_rss_mb, summarize_latencies, write_results
+
+sys.path.insert(0, str(BACKEND_DIR))
+from storage_layout import StorageLayout
+
+LAYOUTS = ["flat", "sharded"]
+
+def output_names(count: int, seed: int) -> List[str]:
+    """Names shaped like new_base_filename() outputs, with random tokens"""
+    rng = random.Random(seed)
+    return [f"download_linux_20240101_120000_{rng.getrandbits(32):08x}_{i}.mp4" for i in range(count)]
+
+def timed_ops(items, operation: Callable) -> Dict:
+    """Run operation on each item, timing every call"""
+    latencies = array("d")
+    errors = 0
+    started = time.perf_counter()
+    for item in items:
+        start = time.perf_counter()
+        try:
+            operation(item)
+        except OSError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    return summarize_latencies(list(latencies), time.perf_counter() - started, errors)
+
+def benchmark_layout(args, layout: StorageLayout, names: List[str]) -> Dict:
+    results: Dict[str, Dict] = {}
+    rng = random.Random(args.seed)
+
+    def create(name: str) -> None:
+        os.close(os.open(layout.path(name, create=True), os.O_CREAT | os.O_WRONLY | os.O_EXCL, 0o644))
+
+    def locate(name: str) -> None:
+        if layout.locate(name) is None:
+            raise FileNotFoundError(name)
+
+    def locate_missing(name: str) -> None:
+        if layout.locate(name) is not None:
+            raise FileExistsError(name)
+
+    def list_dir(name: str) -> None:
+        with os.scandir(layout.path(name).parent) as entries:
+            for _ in entries:
+                pass
+
+    tail_start = len(names) - max(1, len(names) // 10)
+    print(f"   creating {len(names):,} files")
+    results["create"] = timed_ops(names[:tail_start], create)
+    results["create_last_10pct"] = timed_ops(names[tail_start:], create)
+
+    sample = rng.sample(names, min(args.lookups, len(names)))
+    results["lookup"] = timed_ops(sample, locate)
+    results["lookup_missing"] = timed_ops((f"missing_{i}.mp4" for i in range(len(sample))), locate_missing)
+    results["list_dir"] = timed_ops(sample[:args.listings], list_dir)
+    results["delete"] = timed_ops(sample, lambda name: os.unlink(layout.path(name)))
+    return results
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Flat vs sharded storage layout benchmark")
+    parser.add_argument("--files", type=int, default=1_000_000, help="Files created per layout")
+    parser.add_argument("--lookups", type=int, default=100_000, help="Lookups (and deletes) per layout")
+    parser.add_argument("--listings", type=int, default=20,
+                        help="Directory listings per layout (a flat listing reads every file)")
+    parser.add_argument("--layouts", nargs="+", default=LAYOUTS, choices=LAYOUTS)
+    parser.add_argument("--dir", default=".", help="Where to create the files (the filesystem under test)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    args = parser.parse_args()
+
+    names = output_names(args.files, args.seed)
+    results: Dict[str, Dict] = {}
+    for layout_name in args.layouts:
+        with tempfile.TemporaryDirectory(prefix="bench_layout_", dir=args.dir) as tmp:
+            print(f"⏱️  {layout_name}")
+            layout = StorageLayout(Path(tmp), sharded=layout_name == "sharded")
+            for scenario, metrics in benchmark_layout(args, layout, names).items():
+                results[f"{layout_name}_{scenario}"] = metrics
+            print("   removing files")
+
+    results["peak_rss"] = peak_rss_mb()
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    path = write_results("layout", results, config, args.output)
+    for scenario, metrics in results.items():
+        print(f"   {scenario:<28} {metrics}")
+    print(f"\n💾 Results written to {path}")
+    if args.compare:
+        compare_results(results, args.compare, ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"))
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Hermetic benchmark for the ffmpeg post-processing pipelines: audio_pipeline's
+process_audio (MP3 encode), media_pipeline's process_video (Mac container
+conversion with metadata stripping, and segment cuts) and the segment path of
+_perform_segment_download (ranged yt-dlp download, then cut and mux).
+
+Inputs are generated locally with ffmpeg (testsrc + sine) for every combination
+of --durations, --resolutions and --codecs. Each operation reports the median
+wall time, CPU time (this process plus its ffmpeg children) and bytes written
+over --repeat runs, and segment operations are measured at each --offsets
+fraction of the clip.
+
+Usage (from the backend directory):
+    python benchmarks/bench_media.py
+    python benchmarks/bench_media.py --durations 30 300 --resolutions 1280x720 --codecs h264 hevc vp9
+    python benchmarks/bench_media.py --compare benchmarks/results/media_<rev>_<time>.json --max-regression 15
+"""
+
+import sys
+import shutil
+import asyncio
+import argparse
+import statistics
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_utils import (
+    MediaServer, compare_results, generate_media, load_backend, measure_resources,
+    peak_rss_mb, require_ffmpeg, write_results,
+)
+
+# Codec name -> (video encoder, audio encoder, container)
+CODECS = {
+    "h264": ("libx264", "aac", "mp4"),
+    "hevc": ("libx265", "aac", "mp4"),
+    "vp9": ("libvpx-vp9", "libopus", "webm"),
+}
+
+OPERATIONS = ["process_audio", "process_video", "process_video_segment", "segment_download"]
+
+# Metrics compared against a baseline and checked by --max-regression
+COMPARED_METRICS = ("wall_s", "cpu_s", "output_bytes")
+REGRESSION_METRICS = ("wall_s", "cpu_s")
+
+def summarize_runs(runs: List[Dict]) -> Dict:
+    """Median of each metric over repeated runs, plus the fastest wall time"""
+    summary = {key: round(statistics.median(run[key] for run in runs), 4) for key in runs[0]}
+    summary["wall_s_min"] = min(run["wall_s"] for run in runs)
+    summary["runs"] = len(runs)
+    return summary
+
+def measure(repeat: int, prepare: Callable[[int], None], operation: Callable[[int], int]) -> Dict:
+    """Run operation(i) repeat times; prepare(i) runs first, outside the measurement.
+
+    operation returns the size of the file it produced, or a negative number on failure.
+    """
+    runs = []
+    for i in range(repeat):
+        prepare(i)
+        with measure_resources() as usage:
+            output_bytes = operation(i)
+        if output_bytes < 0:
+            raise RuntimeError("operation failed")
+        usage["output_bytes"] = output_bytes
+        runs.append(usage)
+    return summarize_runs(runs)
+
+def benchmark_clip(args, main, server: MediaServer, clip: Path, clip_id: str, duration: float,
+                   container: str, out_dir: Path) -> Dict:
+    """Every selected operation on one clip"""
+    from audio_pipeline import process_audio
+    from media_pipeline import process_video
+
+    results: Dict[str, Dict] = {}
+    no_prepare = lambda i: None
+    # The pipelines consume their input, so each run starts from a fresh copy
+    source = out_dir / f"source.{container}"
+    copy_source = lambda i: shutil.copyfile(clip, source)
+
+    def output_size(ok, path: Path) -> int:
+        size = path.stat().st_size if ok and path.exists() else -1
+        path.unlink(missing_ok=True)
+        return size
+
+    def record(name: str, prepare: Callable[[int], None], operation: Callable[[int], int]) -> None:
+        print(f"⏱️  {name}")
+        try:
+            results[name] = measure(args.repeat, prepare, operation)
+        except Exception as e:
+            print(f"   ⚠️ {name} failed: {e}")
+            results[name] = {"error": str(e)}
+
+    if "process_audio" in args.operations:
+        mp3_path = out_dir / "audio.mp3"
+        record(f"process_audio/{clip_id}", copy_source,
+               lambda i: output_size(process_audio(source, mp3_path, "mp3"), mp3_path))
+
+    if "process_video" in args.operations:
+        # The Mac profile: MOV with metadata stripped
+        mov_path = out_dir / "video.mov"
+        record(f"process_video/{clip_id}", copy_source,
+               lambda i: output_size(process_video(source, mov_path, strip_metadata=True), mov_path))
+
+    for offset in args.offsets:
+        start = round(max(0.0, min(duration - args.segment_length, duration * offset)), 3)
+        end = round(start + args.segment_length, 3)
+        label = f"{clip_id}@{offset:g}"
+
+        if "process_video_segment" in args.operations:
+            segment_path = out_dir / "segment.mp4"
+            record(f"process_video_segment/{label}", copy_source,
+                   lambda i: output_size(process_video(source, segment_path, start, end), segment_path))
+
+        if "segment_download" in args.operations:
+            def segment_download(i: int) -> int:
+                # A unique query string keeps yt-dlp's extraction cold on every run, as for a new request
+                request = main.DownloadRequest(
+                    url=f"{server.url(clip.name)}?n={i}", format_id="best", output_format="mp4",
+                    device_type="linux", start_time=start, end_time=end,
+                )
+                progress_id = main.new_base_filename("linux", start, end)
+                main.progress_store.create(progress_id)
+                asyncio.run(main._perform_segment_download(progress_id, str(request.url), request, "linux", progress_id))
+                status = main.progress_store.get(progress_id) or {}
+                main.progress_store.delete(progress_id)
+                if status.get("status") != "completed":
+                    print(f"   ⚠️ segment download failed: {status.get('error')}")
+                    return -1
+                return output_size(True, main.storage_layout.path(status["filename"]))
+
+            record(f"segment_download/{label}", no_prepare, segment_download)
+
+    return results
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Hermetic ffmpeg pipeline benchmark")
+    parser.add_argument("--durations", type=float, nargs="+", default=[30, 120], help="Clip lengths in seconds")
+    parser.add_argument("--resolutions", nargs="+", default=["640x360", "1280x720"])
+    parser.add_argument("--codecs", nargs="+", default=["h264", "vp9"], choices=list(CODECS))
+    parser.add_argument("--offsets", type=float, nargs="+", default=[0.0, 0.5, 0.9],
+                        help="Segment start as a fraction of the clip length")
+    parser.add_argument("--segment-length", type=float, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per operation (the median is reported)")
+    parser.add_argument("--operations", nargs="+", default=OPERATIONS, choices=OPERATIONS)
+    parser.add_argument("--keep-throttle", action="store_true", help="Keep yt-dlp's sleep intervals")
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="With --compare, exit 1 if wall or CPU time grew by more than this percent")
+    args = parser.parse_args()
+
+    require_ffmpeg(("ffmpeg", "ffprobe"))
+    results: Dict[str, Dict] = {}
+    with tempfile.TemporaryDirectory(prefix="bench_media_") as tmp:
+        tmp = Path(tmp)
+        media_dir = tmp / "media"
+        out_dir = tmp / "out"
+        out_dir.mkdir()
+
+        main = load_backend(tmp / "work", disable_throttle=not args.keep_throttle)
+        # Measure the pipeline itself, not hard links out of the download cache
+        main.download_cache.enabled = False
+        with MediaServer(media_dir) as server:
+            for codec in args.codecs:
+                video_codec, audio_codec, container = CODECS[codec]
+                for resolution in args.resolutions:
+                    for duration in args.durations:
+                        clip_id = f"{codec}_{resolution}_{int(duration)}s"
+                        print(f"🎬 Generating {clip_id}.{container}")
+                        clip = generate_media(media_dir / f"{clip_id}.{container}", duration, resolution,
+                                              video_codec=video_codec, audio_codec=audio_codec)
+                        results.update(benchmark_clip(args, main, server, clip, clip_id, duration, container, out_dir))
+
+    results["peak_rss"] = peak_rss_mb()
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "compare", "max_regression")}
+    path = write_results("media", results, config, args.output)
+    for scenario, metrics in results.items():
+        print(f"   {scenario:<40} {metrics}")
+    print(f"\n💾 Results written to {path}")
+    if args.compare:
+        changes = compare_results(results, args.compare, COMPARED_METRICS)
+        if args.max_regression is not None:
+            regressions = [(scenario, key, change) for scenario, key, change in changes
+                           if key in REGRESSION_METRICS and change > args.max_regression]
+            for scenario, key, change in regressions:
+                print(f"❌ {scenario} {key} regressed {change:+.1f}%")
+            if regressions:
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
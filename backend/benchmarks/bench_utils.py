@@ -0,0 +1,286 @@
+"""
+Shared helpers for the hermetic benchmarks: synthetic media generation,
+a local HTTP media server, latency and resource statistics and JSON result files.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import subprocess
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+def require_ffmpeg(tools: Iterable[str] = ("ffmpeg",)) -> None:
+    """Exit with a clear message when the given ffmpeg tools are not installed"""
+    missing = [tool for tool in tools if shutil.which(tool) is None]
+    if missing:
+        sys.exit(f"❌ Benchmarks need {', '.join(missing)} on PATH")
+
+def generate_media(output_path: Path, duration: float, resolution: str = "640x360",
+                   video_codec: str = "libx264", audio_codec: str = "aac",
+                   fps: int = 25, gop: int = 50) -> Path:
+    """Generate a synthetic test clip with ffmpeg's testsrc and sine sources"""
+    output_path = Path(output_path)
+    if output_path.exists():
+        return output_path
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    cmd = ['ffmpeg', '-v', 'error',
+           '-f', 'lavfi', '-i', f'testsrc=duration={duration}:size={resolution}:rate={fps}',
+           '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}']
+    if video_codec == "none":
+        cmd += ['-map', '1:a']
+    else:
+        cmd += ['-c:v', video_codec, '-g', str(gop)]
+        if video_codec in ("libx264", "libx265"):
+            cmd += ['-preset', 'ultrafast', '-pix_fmt', 'yuv420p']
+        elif video_codec == "libvpx-vp9":
+            cmd += ['-deadline', 'realtime', '-cpu-used', '8', '-b:v', '1M']
+    cmd += ['-c:a', audio_codec, '-shortest']
+    if output_path.suffix in (".mp4", ".mov", ".m4a"):
+        cmd += ['-movflags', '+faststart']
+    cmd += ['-y', str(output_path)]
+    subprocess.run(cmd, check=True)
+    return output_path
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static file handler with single-range support so seeking downloads work"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        range_header = self.headers.get("Range")
+        path = Path(self.translate_path(self.path))
+        if not range_header or not range_header.startswith("bytes=") or not path.is_file():
+            return super().send_head()
+
+        size = path.stat().st_size
+        start_s, _, end_s = range_header[len("bytes="):].split(",")[0].partition("-")
+        if start_s:
+            start = int(start_s)
+            end = min(int(end_s), size - 1) if end_s else size - 1
+        else:
+            start = max(0, size - int(end_s))
+            end = size - 1
+        if start >= size or start > end:
+            self.send_error(416, "Requested Range Not Satisfiable")
+            return None
+
+        f = open(path, "rb")
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(str(path)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self._range_remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "_range_remaining", None)
+        self._range_remaining = None
+        try:
+            if remaining is None:
+                return super().copyfile(source, outputfile)
+            while remaining > 0:
+                chunk = source.read(min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                outputfile.write(chunk)
+                remaining -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients (yt-dlp, ffmpeg) routinely hang up once they have what they need
+            pass
+
+class MediaServer:
+    """Serve a directory of synthetic media on 127.0.0.1 in a background thread"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        handler = lambda *args, **kwargs: RangeRequestHandler(*args, directory=str(self.directory), **kwargs)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+# yt-dlp options that add deliberate sleeps between requests and downloads
+THROTTLE_OPTS = ("sleep_interval", "max_sleep_interval", "sleep_interval_requests")
+
+def load_backend(workdir: Path, disable_throttle: bool = True):
+    """Import backend/main.py against an isolated working directory.
+
+    Storage, the extraction store and the users file all live under workdir so a
+    run never touches real data. With disable_throttle, yt-dlp's anti-bot sleeps
+    are removed so results measure our own overhead rather than fixed delays.
+    """
+    workdir = Path(workdir)
+    (workdir / "static").mkdir(parents=True, exist_ok=True)
+    os.environ["STORAGE_DIR"] = str(workdir / "downloads")
+    os.environ["EXTRACT_STORE_PATH"] = str(workdir / "extract_cache.db")
+    os.environ["USERS_DB_PATH"] = str(workdir / "users.json")
+    allowed = [d for d in os.environ.get("ALLOWED_DOMAINS", "").split(",") if d]
+    os.environ["ALLOWED_DOMAINS"] = ",".join(allowed + ["127.0.0.1"])
+    os.chdir(workdir)
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+    import main
+
+    if disable_throttle:
+        def unthrottled(get_opts):
+            def wrapper(*args, **kwargs):
+                opts = get_opts(*args, **kwargs)
+                for key in THROTTLE_OPTS:
+                    opts.pop(key, None)
+                return opts
+            return wrapper
+        main.get_ytdl_opts = unthrottled(main.get_ytdl_opts)
+        main.get_download_opts = unthrottled(main.get_download_opts)
+    return main
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def summarize_latencies(latencies: List[float], wall_time: float, errors: int = 0) -> Dict:
+    """Summarize per-request latencies (seconds) into milliseconds and throughput"""
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / wall_time, 3) if wall_time > 0 else 0.0,
+    }
+
+def peak_rss_mb() -> Dict:
+    """Peak resident set size of this process and its finished children in MB"""
+    # ru_maxrss is KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    return {
+        "self_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+@contextmanager
+def measure_resources() -> Iterator[Dict]:
+    """Measure wall time, CPU time and bytes written by a block, ffmpeg children included.
+
+    Child processes are counted once they have been waited for, which the
+    ffmpeg runner does before its calls return. Bytes written come from the
+    kernel's block output counters, so they read 0 on tmpfs.
+    """
+    usage: Dict = {}
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    try:
+        yield usage
+    finally:
+        wall = time.perf_counter() - start
+        self_after = resource.getrusage(resource.RUSAGE_SELF)
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        def delta(field: str) -> Tuple[float, float]:
+            return (getattr(self_after, field) - getattr(self_before, field),
+                    getattr(children_after, field) - getattr(children_before, field))
+
+        self_user, children_user = delta("ru_utime")
+        self_sys, children_sys = delta("ru_stime")
+        self_blocks, children_blocks = delta("ru_oublock")
+        usage.update({
+            "wall_s": round(wall, 4),
+            "cpu_s": round(self_user + self_sys + children_user + children_sys, 4),
+            "cpu_self_s": round(self_user + self_sys, 4),
+            "cpu_children_s": round(children_user + children_sys, 4),
+            "io_write_bytes": (self_blocks + children_blocks) * 512,
+        })
+
+def git_revision() -> Optional[str]:
+    """Current git commit, if the benchmark runs inside a checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def write_results(suite: str, results: Dict, config: Dict, output: Optional[str] = None) -> Path:
+    """Write benchmark results as JSON and return the file path"""
+    revision = git_revision()
+    payload = {
+        "suite": suite,
+        "revision": revision,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+    if output:
+        path = Path(output)
+    else:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = RESULTS_DIR / f"{suite}_{revision or 'norev'}_{stamp}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+    return path
+
+def compare_results(current: Dict, baseline_path: str,
+                    keys: Iterable[str] = ("p50_ms", "p95_ms", "p99_ms")) -> List[Tuple[str, str, float]]:
+    """Print the relative change of each scenario metric against a baseline file.
+
+    Returns (scenario, metric, percent change) for every compared value.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\n📊 Compared with {baseline.get('revision')} ({baseline.get('timestamp')})")
+    changes = []
+    for scenario, metrics in current.items():
+        base = baseline.get("results", {}).get(scenario)
+        if not isinstance(metrics, dict) or not isinstance(base, dict):
+            continue
+        for key in keys:
+            if key in metrics and base.get(key):
+                change = (metrics[key] - base[key]) / base[key] * 100
+                changes.append((scenario, key, change))
+                print(f"   {scenario:<40} {key:<12} {base[key]:>10} → {metrics[key]:>10} ({change:+.1f}%)")
+    return changes
+
+def timed(fn, *args, **kwargs):
+    """Run fn and return (result, wall seconds)"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
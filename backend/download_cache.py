@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DOWNLOAD_CACHE_ENABLED = os.getenv("DOWNLOAD_CACHE_ENABLED", "true").lower() == "true"
+DOWNLOAD_CACHE_DB_PATH = Path(os.getenv("DOWNLOAD_CACHE_DB_PATH", "./download_cache.db"))
+DOWNLOAD_CACHE_DIR = os.getenv("DOWNLOAD_CACHE_DIR", "")  # empty: <storage_dir>/.cache
+DOWNLOAD_CACHE_MAX_MB = int(os.getenv("DOWNLOAD_CACHE_MAX_MB", "2048"))
+DOWNLOAD_CACHE_TTL_HOURS = int(os.getenv("DOWNLOAD_CACHE_TTL_HOURS", "24"))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def make_key(parts: Iterable) -> str:
+    """Stable cache key for a (url, format_id, output_format, device, segment) tuple"""
+    return hashlib.sha256(json.dumps(list(parts), default=str).encode()).hexdigest()
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _link_or_copy(source: Path, dest: Path) -> None:
+    """Hard-link source to dest, copying when the filesystem can't link"""
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+
+class DownloadCache:
+    """Content-addressed cache of finished downloads.
+
+    Outputs are stored once under cache_dir by SHA-256 and indexed in SQLite
+    by request key. A repeat request gets a new hard link to the stored object
+    instead of downloading again. The new link is registered in the file
+    manifest like any other output, so it gets its own expiry time.
+    Entries unused for ttl_hours are dropped and the least recently used are
+    evicted while the cache exceeds max_mb.
+    """
+
+    def __init__(self, storage_dir: Path, db_path: Path = DOWNLOAD_CACHE_DB_PATH, cache_dir: str = DOWNLOAD_CACHE_DIR,
+                 max_mb: int = DOWNLOAD_CACHE_MAX_MB, ttl_hours: int = DOWNLOAD_CACHE_TTL_HOURS,
+                 enabled: bool = DOWNLOAD_CACHE_ENABLED):
+        self.db_path = Path(db_path)
+        # Kept under storage_dir by default so links into it never cross filesystems
+        self.cache_dir = Path(cache_dir) if cache_dir else Path(storage_dir) / ".cache"
+        self.max_bytes = max_mb * 1024 * 1024
+        self.ttl_seconds = ttl_hours * 3600
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._evict_lock = threading.Lock()
+        if not self.enabled:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                cache_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                ext TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_hash ON entries (content_hash)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _object_path(self, content_hash: str, ext: str) -> Path:
+        return self.cache_dir / content_hash[:2] / f"{content_hash}{ext}"
+
+    def lookup(self, cache_key: str) -> Optional[Path]:
+        """Return the stored object for a key and mark it used, or None"""
+        if not self.enabled:
+            return None
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT content_hash, ext FROM entries WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        object_path = self._object_path(*row)
+        if not object_path.exists():
+            conn.execute("DELETE FROM entries WHERE cache_key = ?", (cache_key,))
+            conn.commit()
+            self.misses += 1
+            return None
+        # Recency lives in the index only: the object's inode is shared with every link
+        # already served, and touching it would change their Last-Modified
+        conn.execute("UPDATE entries SET last_used = ? WHERE cache_key = ?", (time.time(), cache_key))
+        conn.commit()
+        self.hits += 1
+        return object_path
+
+    def link(self, cache_key: str, dest_dir: Path, stem: str) -> Optional[Path]:
+        """Hard-link a cached output into dest_dir as stem + original extension"""
+        object_path = self.lookup(cache_key)
+        if object_path is None:
+            return None
+        dest = Path(dest_dir) / f"{stem}{object_path.suffix}"
+        try:
+            if dest.exists():
+                return dest if os.path.samefile(dest, object_path) else None
+            _link_or_copy(object_path, dest)
+        except OSError as e:
+            logger.warning(f"Could not reuse cached download {object_path}: {e}")
+            return None
+        logger.info(f"Reused cached download {object_path.name} as {dest.name}")
+        return dest
+
+    def content_hash(self, cache_key: str) -> Optional[str]:
+        """SHA-256 of the object stored for a key, or None"""
+        if not self.enabled:
+            return None
+        row = self._connect().execute(
+            "SELECT content_hash FROM entries WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def store(self, cache_key: str, path: Path, content_hash: Optional[str] = None) -> None:
+        """Add a finished output to the cache under its content hash (hashed here unless given)"""
+        if not self.enabled:
+            return
+        path = Path(path)
+        content_hash = content_hash or file_sha256(path)
+        object_path = self._object_path(content_hash, path.suffix)
+        # Held so eviction never sees the new object before its index row exists
+        with self._evict_lock:
+            if not object_path.exists():
+                object_path.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    _link_or_copy(path, object_path)
+                except FileExistsError:
+                    pass
+            now = time.time()
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (cache_key, content_hash, ext, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, content_hash, path.suffix, path.stat().st_size, now, now),
+            )
+            conn.commit()
+        if self.total_bytes() > self.max_bytes:
+            self.evict()
+
+    def total_bytes(self) -> int:
+        """Bytes held by distinct cached objects"""
+        if not self.enabled:
+            return 0
+        row = self._connect().execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM entries GROUP BY content_hash)"
+        ).fetchone()
+        return row[0]
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """Drop expired entries, then least recently used ones until under the size cap (or max_bytes)"""
+        if not self.enabled:
+            return 0
+        limit = self.max_bytes if max_bytes is None else min(max_bytes, self.max_bytes)
+        with self._evict_lock:
+            conn = self._connect()
+            cutoff = time.time() - self.ttl_seconds
+            dropped = conn.execute(
+                "SELECT content_hash, ext, size FROM entries WHERE last_used < ?", (cutoff,)
+            ).fetchall()
+            conn.execute("DELETE FROM entries WHERE last_used < ?", (cutoff,))
+            total = self.total_bytes()
+            while total > limit:
+                row = conn.execute(
+                    "SELECT cache_key, content_hash, ext, size FROM entries ORDER BY last_used LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                conn.execute("DELETE FROM entries WHERE cache_key = ?", (row[0],))
+                dropped.append(row[1:])
+                if not self._is_referenced(row[1]):
+                    total -= row[3]
+            conn.commit()
+
+            # Remove the objects of dropped entries that no remaining entry refers to
+            for content_hash, ext in {(content_hash, ext) for content_hash, ext, _ in dropped}:
+                if self._is_referenced(content_hash, ext):
+                    continue
+                object_path = self._object_path(content_hash, ext)
+                try:
+                    object_path.unlink()
+                    if not any(object_path.parent.iterdir()):
+                        object_path.parent.rmdir()
+                except OSError:
+                    pass
+        if dropped:
+            logger.info(f"Evicted {len(dropped)} cached downloads")
+        return len(dropped)
+
+    def _is_referenced(self, content_hash: str, ext: Optional[str] = None) -> bool:
+        """Whether any entry still points at a stored object"""
+        if ext is None:
+            query, params = "SELECT 1 FROM entries WHERE content_hash = ? LIMIT 1", (content_hash,)
+        else:
+            query, params = "SELECT 1 FROM entries WHERE content_hash = ? AND ext = ? LIMIT 1", (content_hash, ext)
+        return self._connect().execute(query, params).fetchone() is not None
+
+    def stats(self) -> Dict:
+        """Entry count, size and hit rate"""
+        if not self.enabled:
+            return {"enabled": False}
+        entries = self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "enabled": True,
+            "entries": entries,
+            "size_mb": round(self.total_bytes() / (1024 * 1024), 1),
+            "max_mb": self.max_bytes // (1024 * 1024),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,144 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Configuration
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
+EXTRACT_QUEUE_SIZE = int(os.getenv("EXTRACT_QUEUE_SIZE", "64"))
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "3"))
+DOWNLOAD_QUEUE_SIZE = int(os.getenv("DOWNLOAD_QUEUE_SIZE", "32"))
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", str(os.cpu_count() or 2)))
+TRANSCODE_QUEUE_SIZE = int(os.getenv("TRANSCODE_QUEUE_SIZE", "32"))
+STORAGE_IO_WORKERS = int(os.getenv("STORAGE_IO_WORKERS", "4"))
+STORAGE_IO_QUEUE_SIZE = int(os.getenv("STORAGE_IO_QUEUE_SIZE", "64"))
+
+# Number of recent wait times kept for percentile stats
+WAIT_SAMPLE_SIZE = 512
+
+class PoolSaturatedError(Exception):
+    """Raised when a pool's queue is full and the job cannot be accepted"""
+
+    def __init__(self, pool_name: str, retry_after: int = 5):
+        super().__init__(f"Server busy: {pool_name} queue is full, please retry shortly")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+class BoundedExecutor:
+    """Thread pool with a bounded queue and queue-depth / wait-time metrics"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = 0  # queued + running
+        self._active = 0
+        self._waits = deque(maxlen=WAIT_SAMPLE_SIZE)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Admit a job into the pool and return its future, raising PoolSaturatedError when full"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturatedError(self.name)
+            self._pending += 1
+            self.submitted += 1
+        return self._start(fn, *args, **kwargs)
+
+    def submit_if_idle(self, fn: Callable, *args, **kwargs) -> Optional[Future]:
+        """Start a job only if a worker is free right now (so it never waits in the queue); None otherwise"""
+        with self._lock:
+            if self._pending >= self.max_workers:
+                return None
+            self._pending += 1
+            self.submitted += 1
+        return self._start(fn, *args, **kwargs)
+
+    def _start(self, fn: Callable, *args, **kwargs) -> Future:
+        """Hand an admitted job to a worker thread"""
+        enqueued_at = time.monotonic()
+        # Carry the caller's context (e.g. the current trace span) into the worker thread
+        context = contextvars.copy_context()
+
+        def job():
+            with self._lock:
+                self._waits.append(time.monotonic() - enqueued_at)
+                self._active += 1
+            self._local.inside = True
+            try:
+                result = context.run(fn, *args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self.failed += 1
+                raise
+            finally:
+                self._local.inside = False
+                with self._lock:
+                    self._active -= 1
+                    self._pending -= 1
+                    self.completed += 1
+            return result
+
+        return self._executor.submit(job)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking function in the pool without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def run_sync(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking function in the pool from another worker thread and wait for it"""
+        if getattr(self._local, "inside", False):
+            # Already on one of this pool's threads; waiting on ourselves could deadlock
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    def is_saturated(self) -> bool:
+        """Whether new jobs would currently be rejected"""
+        with self._lock:
+            return self._pending >= self.max_workers + self.max_queue
+
+    def stats(self) -> Dict:
+        """Get queue depth and wait-time metrics"""
+        with self._lock:
+            waits = sorted(self._waits)
+            queued = max(0, self._pending - self._active)
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "wait_avg_ms": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0.0,
+                "wait_max_ms": round(waits[-1] * 1000, 2) if waits else 0.0,
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting work and release worker threads"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+# Separate pools so slow downloads cannot starve extraction or storage I/O
+# (ffmpeg runs on ffmpeg_runner, which registers itself here as the "transcode" pool)
+extract_pool = BoundedExecutor("extract", EXTRACT_WORKERS, EXTRACT_QUEUE_SIZE)
+download_pool = BoundedExecutor("download", DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE)
+storage_pool = BoundedExecutor("storage", STORAGE_IO_WORKERS, STORAGE_IO_QUEUE_SIZE)
+
+POOLS = {pool.name: pool for pool in (extract_pool, download_pool, storage_pool)}
+
+def get_pool_stats() -> Dict[str, Dict]:
+    """Get metrics for every execution pool"""
+    return {name: pool.stats() for name, pool in POOLS.items()}
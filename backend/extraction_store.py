@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from metadata_cache import normalize_url
+
+# Configuration
+EXTRACT_STORE_PATH = Path(os.getenv("EXTRACT_STORE_PATH", "./extract_cache.db"))
+EXTRACT_STORE_SOFT_TTL_SECONDS = int(os.getenv("EXTRACT_STORE_SOFT_TTL_SECONDS", "1800"))
+EXTRACT_STORE_HARD_TTL_SECONDS = int(os.getenv("EXTRACT_STORE_HARD_TTL_SECONDS", "86400"))
+
+class ExtractionStore:
+    """SQLite (WAL) store of /extract responses that survives restarts.
+
+    Entries younger than the soft TTL are fresh. Entries between the soft and
+    hard TTL are served as stale so the caller can refresh them in the
+    background. Entries past the hard TTL are deleted on read.
+    """
+
+    def __init__(self, db_path: Path = EXTRACT_STORE_PATH,
+                 soft_ttl_seconds: int = EXTRACT_STORE_SOFT_TTL_SECONDS,
+                 hard_ttl_seconds: int = EXTRACT_STORE_HARD_TTL_SECONDS):
+        self.db_path = Path(db_path)
+        self.soft_ttl_seconds = soft_ttl_seconds
+        self.hard_ttl_seconds = max(hard_ttl_seconds, soft_ttl_seconds)
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                url_key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_extractions_created ON extractions (created_at)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, url: str) -> Optional[Tuple[Dict, bool]]:
+        """Return (response, is_stale) for a URL, or None if missing or past the hard TTL"""
+        key = normalize_url(url)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT response, created_at FROM extractions WHERE url_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        response, created_at = row
+        age = time.time() - created_at
+        if age > self.hard_ttl_seconds:
+            conn.execute("DELETE FROM extractions WHERE url_key = ?", (key,))
+            conn.commit()
+            return None
+        try:
+            return json.loads(response), age > self.soft_ttl_seconds
+        except ValueError:
+            return None
+
+    def put(self, url: str, response: Dict) -> None:
+        """Store or replace the response for a URL"""
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO extractions (url_key, response, created_at) VALUES (?, ?, ?)",
+            (normalize_url(url), json.dumps(response), time.time()),
+        )
+        conn.commit()
+
+    def purge_expired(self) -> int:
+        """Delete all entries past the hard TTL and return how many were removed"""
+        conn = self._connect()
+        cursor = conn.execute(
+            "DELETE FROM extractions WHERE created_at < ?", (time.time() - self.hard_ttl_seconds,)
+        )
+        conn.commit()
+        return cursor.rowcount
+
+# Global extraction store instance
+extraction_store = ExtractionStore()
@@ -0,0 +1,308 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+from executors import POOLS, TRANSCODE_QUEUE_SIZE, TRANSCODE_WORKERS, PoolSaturatedError
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "3600"))
+FFMPEG_KILL_GRACE = float(os.getenv("FFMPEG_KILL_GRACE", "5"))
+
+# Only the end of stderr is kept; it is where ffmpeg reports what went wrong
+STDERR_TAIL_BYTES = 64 * 1024
+
+class FFmpegTimeoutError(RuntimeError):
+    """Raised when an ffmpeg/ffprobe process runs past its timeout and is killed"""
+
+def _parse_out_time(block: Dict[str, str]) -> Optional[float]:
+    # out_time_ms is in microseconds too (a long-standing ffmpeg quirk); out_time_us is the newer name
+    for key in ("out_time_us", "out_time_ms"):
+        value = block.get(key, "")
+        if value.lstrip("-").isdigit():
+            return max(0.0, int(value) / 1_000_000)
+    hours, _, rest = block.get("out_time", "").partition(":")
+    minutes, _, seconds = rest.partition(":")
+    try:
+        return max(0.0, int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+    except ValueError:
+        return None
+
+def _parse_speed(value: Optional[str]) -> Optional[float]:
+    try:
+        return float((value or "").rstrip("x"))
+    except ValueError:
+        return None
+
+class ProgressParser:
+    """Incremental parser for ffmpeg's -progress output.
+
+    ffmpeg writes key=value lines and closes each report with progress=continue
+    (or progress=end on exit); feed() returns a snapshot for every closed
+    report. With the expected output duration the snapshot includes the
+    fraction done and an ETA from ffmpeg's speed.
+    """
+
+    def __init__(self, duration: Optional[float] = None):
+        self.duration = duration if duration and duration > 0 else None
+        self._block: Dict[str, str] = {}
+
+    def feed(self, line: str) -> Optional[Dict]:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        if key != "progress":
+            self._block[key] = value.strip()
+            return None
+        block, self._block = self._block, {}
+        done = value.strip() == "end"
+        out_time = _parse_out_time(block)
+        speed = _parse_speed(block.get("speed"))
+        fraction = eta = None
+        if self.duration is not None and out_time is not None:
+            fraction = 1.0 if done else min(1.0, out_time / self.duration)
+            if speed:
+                eta = max(0.0, (self.duration - out_time) / speed)
+        return {"out_time": out_time, "speed": speed, "fraction": fraction, "eta": eta, "done": done}
+
+def fraction_progress(progress_callback: Optional[Callable[[float], None]]) -> Optional[Callable[[Dict], None]]:
+    """Adapt a callback taking the fraction done to run()'s on_progress, or None without one"""
+    if progress_callback is None:
+        return None
+
+    def on_progress(snapshot: Dict) -> None:
+        if snapshot["fraction"] is not None:
+            progress_callback(snapshot["fraction"])
+    return on_progress
+
+class ProcessResult:
+    """Exit code and captured output of one finished process"""
+
+    __slots__ = ("returncode", "stdout", "stderr")
+
+    def __init__(self, returncode: int, stdout: str, stderr: str):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+class FFmpegRunner:
+    """Runs ffmpeg/ffprobe as asyncio subprocesses on one shared event loop.
+
+    Waiting on a process costs no worker thread: pipes are read on a single
+    loop thread, and at most max_workers processes run at once (the rest wait
+    their turn, up to max_queue, as cheap coroutines). Worker threads call the blocking
+    wrappers; async code awaits run() or call_async(). Cancelling the awaiting
+    task, or hitting the timeout, terminates the process. Registered as the
+    "transcode" pool so it shows up in /health and /metrics like the executors.
+    """
+
+    name = "transcode"
+
+    def __init__(self, max_workers: int = TRANSCODE_WORKERS, max_queue: int = TRANSCODE_QUEUE_SIZE):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._active = 0
+        self._waiting = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the runner's event loop thread on first use"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def serve():
+                    asyncio.set_event_loop(loop)
+                    self._slots = asyncio.Semaphore(self.max_workers)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=serve, name="ffmpeg-runner", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def _admit(self, coro: Coroutine) -> None:
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                coro.close()
+                raise PoolSaturatedError(self.name)
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the runner loop; the caller's context (trace span) goes with it"""
+        self._admit(coro)
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def call(self, coro: Coroutine) -> Any:
+        """Run a coroutine (e.g. a multi-step cut) on the runner loop and wait for it from a worker thread"""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("FFmpegRunner.call() would block the runner loop; await the coroutine instead")
+        return self.submit(coro).result()
+
+    async def call_async(self, coro: Coroutine) -> Any:
+        """Await a coroutine on the runner loop from another event loop (cancellation is forwarded)"""
+        if asyncio.get_running_loop() is self._loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def run_sync(self, cmd: List[str], **kwargs) -> ProcessResult:
+        """Blocking form of run() for worker threads"""
+        return self.call(self.run(cmd, **kwargs))
+
+    async def run(self, cmd: List[str], duration: Optional[float] = None,
+                  on_progress: Optional[Callable[[Dict], None]] = None,
+                  timeout: Optional[float] = FFMPEG_TIMEOUT) -> ProcessResult:
+        """Run one process and return its result (awaitable from any event loop).
+
+        With on_progress, ffmpeg is asked for -progress reports on stdout and
+        the callback gets each parsed snapshot (fraction/eta need duration, the
+        expected output length in seconds). Otherwise stdout is captured (for
+        ffprobe). Raises FFmpegTimeoutError after timeout seconds; on timeout
+        or cancellation the process is terminated before returning.
+        """
+        if asyncio.get_running_loop() is not self._loop:
+            return await self.call_async(self.run(cmd, duration, on_progress, timeout))
+        if on_progress is not None:
+            cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+        with self._lock:
+            self.submitted += 1
+            self._waiting += 1
+        acquired = False
+        try:
+            await self._slots.acquire()
+            acquired = True
+            with self._lock:
+                self._waiting -= 1
+                self._active += 1
+            return await self._execute(cmd, duration, on_progress, timeout)
+        except asyncio.CancelledError:
+            with self._lock:
+                self.cancelled += 1
+            raise
+        except FFmpegTimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise
+        finally:
+            with self._lock:
+                if acquired:
+                    self._active -= 1
+                else:
+                    self._waiting -= 1
+            if acquired:
+                self._slots.release()
+
+    async def _execute(self, cmd: List[str], duration: Optional[float],
+                       on_progress: Optional[Callable[[Dict], None]], timeout: Optional[float]) -> ProcessResult:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout_lines: List[str] = []
+        stderr_tail = bytearray()
+
+        async def read_stdout():
+            parser = ProgressParser(duration) if on_progress is not None else None
+            async for raw in process.stdout:
+                line = raw.decode("utf-8", "replace")
+                if parser is None:
+                    stdout_lines.append(line)
+                    continue
+                snapshot = parser.feed(line)
+                if snapshot is not None:
+                    try:
+                        on_progress(snapshot)
+                    except Exception as e:
+                        logger.debug(f"ffmpeg progress callback failed: {e}")
+
+        async def read_stderr():
+            while True:
+                chunk = await process.stderr.read(16384)
+                if not chunk:
+                    return
+                stderr_tail.extend(chunk)
+                del stderr_tail[:-STDERR_TAIL_BYTES]
+
+        async def communicate():
+            await asyncio.gather(read_stdout(), read_stderr())
+            return await process.wait()
+
+        started = time.monotonic()
+        try:
+            returncode = await asyncio.wait_for(communicate(), timeout)
+        except asyncio.TimeoutError:
+            await self._terminate(process)
+            logger.error(f"{cmd[0]} timed out after {time.monotonic() - started:.0f}s and was killed")
+            raise FFmpegTimeoutError(f"{cmd[0]} timed out after {timeout:.0f}s")
+        except BaseException:
+            # Cancelled (client gone, job aborted) or failed reading: don't leave the process running
+            await asyncio.shield(self._terminate(process))
+            raise
+        with self._lock:
+            self.completed += 1
+            if returncode != 0:
+                self.failed += 1
+        return ProcessResult(returncode, "".join(stdout_lines), stderr_tail.decode("utf-8", "replace"))
+
+    @staticmethod
+    async def _terminate(process: asyncio.subprocess.Process) -> None:
+        """SIGTERM, then SIGKILL if the process has not exited within FFMPEG_KILL_GRACE"""
+        if process.returncode is not None:
+            return
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), FFMPEG_KILL_GRACE)
+        except ProcessLookupError:
+            pass
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+    def is_saturated(self) -> bool:
+        """Whether new work would currently be rejected"""
+        with self._lock:
+            return self._waiting >= self.max_queue
+
+    def stats(self) -> Dict:
+        """Process counts in the same shape as the executor pools"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": self._waiting,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "cancelled": self.cancelled,
+            }
+
+# Global ffmpeg runner instance
+ffmpeg_runner = FFmpegRunner()
+POOLS[ffmpeg_runner.name] = ffmpeg_runner
@@ -0,0 +1,238 @@
+import os
+import time
+import sqlite3
+import secrets
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from download_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+FILE_MANIFEST_DB_PATH = Path(os.getenv("FILE_MANIFEST_DB_PATH", "./file_manifest.db"))
+FILE_RETENTION_HOURS = float(os.getenv("FILE_RETENTION_HOURS", os.getenv("CLEANUP_INTERVAL_HOURS", "2")))
+
+# Minimum seconds between last_access writes for one file, so serving it stays read-only
+TOUCH_INTERVAL = 60
+
+def new_base_filename(device_type: str, start_time: Optional[float] = None,
+                      end_time: Optional[float] = None) -> str:
+    """Collision-free output name: timestamp for readability plus a random token"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    segment_suffix = f"_segment_{int(start_time)}_{int(end_time)}" if start_time is not None and end_time is not None else ""
+    return f"download_{device_type}_{timestamp}_{secrets.token_hex(4)}{segment_suffix}"
+
+class OutputRecorder:
+    """yt-dlp hooks that capture the path a download actually ended up at.
+
+    The progress hook sees each finished download and the postprocessor hook
+    sees the file after merging/moving, so the last path recorded is the final
+    one. This replaces globbing STORAGE_DIR for the output.
+    """
+
+    def __init__(self):
+        self.path: Optional[Path] = None
+
+    def progress_hook(self, d: Dict) -> None:
+        if d.get('status') == 'finished' and d.get('filename'):
+            self.path = Path(d['filename'])
+
+    def postprocessor_hook(self, d: Dict) -> None:
+        if d.get('status') == 'finished':
+            filepath = (d.get('info_dict') or {}).get('filepath')
+            if filepath:
+                self.path = Path(filepath)
+
+    def install(self, download_opts: Dict) -> Dict:
+        """Add the hooks to a set of yt-dlp options (keeping any existing hooks)"""
+        download_opts['progress_hooks'] = [*download_opts.get('progress_hooks', []), self.progress_hook]
+        download_opts['postprocessor_hooks'] = [*download_opts.get('postprocessor_hooks', []), self.postprocessor_hook]
+        return download_opts
+
+    @property
+    def final_path(self) -> Optional[Path]:
+        """The recorded output, if it exists on disk"""
+        return self.path if self.path is not None and self.path.exists() else None
+
+class FileManifest:
+    """SQLite index of finished output files by filename and by job id.
+
+    Every file handed to a client is registered with its exact path, so /files,
+    cloud saves and job restarts resolve it with a primary-key lookup instead
+    of scanning STORAGE_DIR. Outputs never change once written, so the SHA-256
+    recorded at registration serves as their ETag for as long as they exist.
+    Each file also gets an expiry time and a last access time, both indexed,
+    so cleanup reads the files that are due (or least recently used) directly.
+    """
+
+    def __init__(self, db_path: Path = FILE_MANIFEST_DB_PATH, retention_hours: float = FILE_RETENTION_HOURS):
+        self.db_path = Path(db_path)
+        self.retention_seconds = retention_hours * 3600
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                filename TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                job_id TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                content_hash TEXT,
+                expires_at REAL,
+                last_access REAL
+            )
+        """)
+        # Manifests from before content hashes and expiry times were recorded
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+        for column in ("content_hash TEXT", "expires_at REAL", "last_access REAL"):
+            if column.split()[0] not in columns:
+                conn.execute(f"ALTER TABLE files ADD COLUMN {column}")
+        conn.execute(
+            "UPDATE files SET expires_at = created_at + ?, last_access = created_at WHERE expires_at IS NULL",
+            (self.retention_seconds,),
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_job_id ON files (job_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_expires_at ON files (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_last_access ON files (last_access)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def register(self, path: Path, job_id: Optional[str] = None, content_hash: Optional[str] = None) -> str:
+        """Record a finished output file and return its SHA-256.
+
+        The file is hashed here unless the hash is passed in or the file was
+        already registered; call from a worker thread for large files.
+        """
+        path = Path(path)
+        size = path.stat().st_size
+        conn = self._connect()
+        if content_hash is None:
+            row = conn.execute(
+                "SELECT content_hash, size FROM files WHERE filename = ?", (path.name,)
+            ).fetchone()
+            content_hash = row[0] if row and row[0] and row[1] == size else file_sha256(path)
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO files "
+            "(filename, path, job_id, size, created_at, content_hash, expires_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path.name, str(path), job_id, size, now, content_hash, now + self.retention_seconds, now),
+        )
+        conn.commit()
+        return content_hash
+
+    def adopt(self, files: Iterable[Tuple[Path, int, float]]) -> int:
+        """Index files found on disk but never registered, as (path, size, mtime); returns how many were new.
+
+        They expire retention after their mtime, like the directory sweep used to
+        treat them, and are hashed only if they are registered again later.
+        """
+        conn = self._connect()
+        cursor = conn.executemany(
+            "INSERT OR IGNORE INTO files (filename, path, size, created_at, expires_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            ((path.name, str(path), size, mtime, mtime + self.retention_seconds, mtime)
+             for path, size, mtime in files),
+        )
+        conn.commit()
+        return cursor.rowcount
+
+    def touch(self, filename: str) -> None:
+        """Record that a file was served, for least-recently-used eviction"""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT last_access FROM files WHERE filename = ?", (filename,)).fetchone()
+        # Most hits are repeats within the interval and need no write lock
+        if row is None or (row[0] or 0) >= now - TOUCH_INTERVAL:
+            return
+        conn.execute("UPDATE files SET last_access = ? WHERE filename = ?", (now, filename))
+        conn.commit()
+
+    def expired(self, limit: int, now: Optional[float] = None) -> List[Tuple[str, str, int]]:
+        """(filename, path, size) of up to limit files past their expiry, soonest first"""
+        return self._connect().execute(
+            "SELECT filename, path, size FROM files WHERE expires_at <= ? ORDER BY expires_at LIMIT ?",
+            (time.time() if now is None else now, limit),
+        ).fetchall()
+
+    def least_recently_used(self, limit: int) -> List[Tuple[str, str, int]]:
+        """(filename, path, size) of the limit files served longest ago"""
+        return self._connect().execute(
+            "SELECT filename, path, size FROM files ORDER BY last_access LIMIT ?", (limit,)
+        ).fetchall()
+
+    def _existing(self, filename: str, path: str) -> Optional[Path]:
+        """Return path if the file is still there, otherwise drop its entry"""
+        if os.path.exists(path):
+            return Path(path)
+        self.remove(filename)
+        return None
+
+    def lookup(self, filename: str) -> Optional[Path]:
+        """Path of a registered output by filename, or None"""
+        row = self._connect().execute(
+            "SELECT path FROM files WHERE filename = ?", (filename,)
+        ).fetchone()
+        return self._existing(filename, row[0]) if row else None
+
+    def lookup_hash(self, filename: str) -> Optional[Tuple[str, int]]:
+        """(SHA-256, size) recorded for an output, or None if it was registered without one"""
+        row = self._connect().execute(
+            "SELECT content_hash, size FROM files WHERE filename = ?", (filename,)
+        ).fetchone()
+        return (row[0], row[1]) if row and row[0] else None
+
+    def lookup_job(self, job_id: str) -> Optional[Path]:
+        """Path of the output a job produced, or None"""
+        row = self._connect().execute(
+            "SELECT filename, path FROM files WHERE job_id = ? ORDER BY created_at DESC LIMIT 1", (job_id,)
+        ).fetchone()
+        return self._existing(*row) if row else None
+
+    def remove(self, filename: str) -> None:
+        """Forget a file (after it was deleted)"""
+        self.remove_many([filename])
+
+    def remove_many(self, filenames: Iterable[str]) -> None:
+        """Forget several files in one transaction"""
+        conn = self._connect()
+        conn.executemany("DELETE FROM files WHERE filename = ?", ((filename,) for filename in filenames))
+        conn.commit()
+
+    def relocate(self, resolve: Callable[[Path], Optional[Path]]) -> int:
+        """Update recorded paths that no longer exist to resolve(old path); returns how many changed"""
+        conn = self._connect()
+        moved = []
+        for filename, path in conn.execute("SELECT filename, path FROM files").fetchall():
+            if os.path.exists(path):
+                continue
+            new_path = resolve(Path(path))
+            if new_path is not None:
+                moved.append((str(new_path), filename))
+        conn.executemany("UPDATE files SET path = ? WHERE filename = ?", moved)
+        conn.commit()
+        return len(moved)
+
+    def stats(self) -> Dict:
+        """Indexed files, their total size and how many are due for removal"""
+        conn = self._connect()
+        files, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+        expired = conn.execute("SELECT COUNT(*) FROM files WHERE expires_at <= ?", (time.time(),)).fetchone()[0]
+        return {"files": files, "size_mb": round(size / (1024 * 1024), 1), "expired": expired}
+
+# Global file manifest instance
+file_manifest = FileManifest()
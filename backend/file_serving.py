@@ -0,0 +1,296 @@
+import os
+import stat
+import secrets
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# Configuration
+FILE_CHUNK_SIZE = int(os.getenv("FILE_CHUNK_SIZE", str(1024 * 1024)))
+FILE_MAX_RANGES = int(os.getenv("FILE_MAX_RANGES", "32"))
+FILE_CACHE_MAX_AGE = int(os.getenv("FILE_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+FILE_OFFLOAD_HEADER = os.getenv("FILE_OFFLOAD_HEADER", "").strip()  # empty | X-Accel-Redirect | X-Sendfile
+FILE_OFFLOAD_PREFIX = os.getenv("FILE_OFFLOAD_PREFIX", "/protected-files/")
+
+# Content types for what we serve; mimetypes does not know all of these on slim images
+MEDIA_TYPES = {
+    ".mp4": "video/mp4",
+    ".m4v": "video/mp4",
+    ".mov": "video/quicktime",
+    ".webm": "video/webm",
+    ".mkv": "video/x-matroska",
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".opus": "audio/ogg",
+    ".ogg": "audio/ogg",
+}
+
+# ASGI extension for handing a file to the server's sendfile()
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+# Headers repeated on a 304 so caches can refresh their stored copy
+NOT_MODIFIED_HEADERS = ("etag", "last-modified", "cache-control", "expires", "vary")
+
+def guess_media_type(path: str) -> str:
+    """Content type from the file extension, falling back to application/octet-stream"""
+    suffix = os.path.splitext(path)[1].lower()
+    return MEDIA_TYPES.get(suffix) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """Byte ranges requested by a Range header, as sorted, merged (start, end) pairs (end inclusive).
+
+    Returns None when the header should be ignored and the whole file sent
+    (missing, malformed, another unit or too many ranges), and an empty list
+    when no range overlaps the file (416).
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    parts = [part.strip() for part in spec.split(",") if part.strip()]
+    if not parts or len(parts) > FILE_MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, dash, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or (first and not first.isdigit()) or (last and not last.isdigit()) or not (first or last):
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length > 0 and size > 0:
+                ranges.append((max(0, size - length), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, min(int(last), size - 1) if last else size - 1))
+
+    # Overlapping or adjacent ranges are sent once, in file order
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _opaque_tag(tag: str) -> str:
+    """An entity tag without its weak prefix, for weak comparison"""
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def content_disposition(filename: str, disposition: str = "attachment") -> str:
+    """Content-Disposition value, with an RFC 5987 filename* for non-ASCII names"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+def immutable_headers(content_hash: Optional[str], max_age: Optional[int] = None) -> Dict[str, str]:
+    """Cache headers for an output that never changes once written, with its content hash as a strong ETag.
+
+    max_age caps the lifetime below FILE_CACHE_MAX_AGE, e.g. to when a signed link expires.
+    """
+    max_age = FILE_CACHE_MAX_AGE if max_age is None else min(max_age, FILE_CACHE_MAX_AGE)
+    headers = {"cache-control": f"public, max-age={max_age}, immutable"}
+    if content_hash:
+        headers["etag"] = f'"{content_hash}"'
+    return headers
+
+def offload_response(path: Path, root: Path, filename: Optional[str] = None,
+                     headers: Optional[Mapping[str, str]] = None) -> Optional[Response]:
+    """Empty response telling the front proxy to send the file itself, or None when offloading is off.
+
+    With FILE_OFFLOAD_HEADER=X-Accel-Redirect (nginx) the file's path under root
+    is appended to FILE_OFFLOAD_PREFIX, an internal location aliased to root;
+    with X-Sendfile (Apache mod_xsendfile, lighttpd) the absolute path is sent.
+    The proxy then handles Range and conditional requests from its own workers.
+    """
+    header = FILE_OFFLOAD_HEADER.lower()
+    if header == "x-accel-redirect":
+        try:
+            relative = Path(path).resolve().relative_to(Path(root).resolve())
+        except ValueError:
+            # Outside the aliased directory; the proxy could not find it
+            return None
+        value = FILE_OFFLOAD_PREFIX.rstrip("/") + "/" + quote(relative.as_posix())
+    elif header == "x-sendfile":
+        value = str(Path(path).resolve())
+    else:
+        return None
+
+    response_headers = {FILE_OFFLOAD_HEADER: value}
+    if filename:
+        response_headers["content-disposition"] = content_disposition(filename)
+    response_headers.update(headers or {})
+    return Response(headers=response_headers, media_type=guess_media_type(filename or str(path)))
+
+class RangeFileResponse(Response):
+    """File response with Range / 206 Partial Content support and zero-copy sending.
+
+    Single ranges are sent with Content-Range; several ranges as a
+    multipart/byteranges body. If-Range is honoured against Last-Modified (and
+    an ETag when the caller supplies one in headers). GET/HEAD requests whose
+    If-None-Match matches the ETag, or whose If-Modified-Since is not older
+    than the file, get 304 Not Modified. When the ASGI server offers the
+    zerocopysend extension, each range is handed to the kernel's sendfile()
+    and never passes through Python; otherwise it is read with pread() in a
+    worker thread in FILE_CHUNK_SIZE pieces.
+    """
+
+    def __init__(self, path: str, filename: Optional[str] = None, media_type: Optional[str] = None,
+                 headers: Optional[Mapping[str, str]] = None, background: Optional[BackgroundTask] = None,
+                 stat_result: Optional[os.stat_result] = None):
+        self.path = str(path)
+        self.filename = filename
+        self.media_type = media_type or guess_media_type(filename or self.path)
+        self.status_code = 200
+        self.background = background
+        self.stat_result = stat_result
+        self.extra_headers: Dict[str, str] = dict(headers or {})
+        self.init_headers(self.extra_headers)
+
+    def _headers(self, stat_result: os.stat_result) -> Dict[str, str]:
+        headers = {
+            "accept-ranges": "bytes",
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        }
+        if self.filename:
+            headers["content-disposition"] = content_disposition(self.filename)
+        headers.update({key.lower(): value for key, value in self.extra_headers.items()})
+        return headers
+
+    def _if_range_matches(self, if_range: str, headers: Dict[str, str], stat_result: os.stat_result) -> bool:
+        """Whether the client's cached copy (by ETag or date) is still this file"""
+        if if_range.startswith(('"', 'W/"')):
+            # Weak validators never match for If-Range
+            return not if_range.startswith("W/") and if_range == headers.get("etag")
+        try:
+            return int(parsedate_to_datetime(if_range).timestamp()) >= int(stat_result.st_mtime)
+        except (TypeError, ValueError):
+            return False
+
+    def _not_modified(self, request_headers: Headers, headers: Dict[str, str], stat_result: os.stat_result) -> bool:
+        """Whether the client's cached copy is current (If-None-Match wins over If-Modified-Since)"""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            etag = headers.get("etag")
+            if not etag:
+                return False
+            tags = {_opaque_tag(tag) for tag in if_none_match.split(",")}
+            return "*" in tags or _opaque_tag(etag) in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if not if_modified_since:
+            return False
+        try:
+            return int(stat_result.st_mtime) <= int(parsedate_to_datetime(if_modified_since).timestamp())
+        except (TypeError, ValueError):
+            return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            stat_result = self.stat_result or await anyio.to_thread.run_sync(os.stat, self.path)
+        except FileNotFoundError:
+            await Response("File not found", status_code=404)(scope, receive, send)
+            return
+        if not stat.S_ISREG(stat_result.st_mode):
+            await Response("File not found", status_code=404)(scope, receive, send)
+            return
+
+        size = stat_result.st_size
+        request_headers = Headers(scope=scope)
+        headers = self._headers(stat_result)
+        if scope.get("method") in ("GET", "HEAD") and self._not_modified(request_headers, headers, stat_result):
+            self.status_code = 304
+            self.raw_headers = [(key.encode("latin-1"), value.encode("latin-1"))
+                                for key, value in headers.items() if key in NOT_MODIFIED_HEADERS]
+            await send({"type": "http.response.start", "status": 304, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        ranges = parse_range_header(request_headers.get("range"), size)
+        if_range = request_headers.get("if-range")
+        if ranges is not None and if_range and not self._if_range_matches(if_range, headers, stat_result):
+            ranges = None
+
+        parts: List[Tuple[bytes, int, int]] = []  # (part header, offset, length)
+        trailer = b""
+        if ranges is None:
+            status_code = 200
+            headers["content-type"] = self.media_type
+            headers["content-length"] = str(size)
+            parts.append((b"", 0, size))
+        elif not ranges:
+            status_code = 416
+            headers = {"content-range": f"bytes */{size}", "content-length": "0"}
+        elif len(ranges) == 1:
+            status_code = 206
+            start, end = ranges[0]
+            headers["content-type"] = self.media_type
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            headers["content-length"] = str(end - start + 1)
+            parts.append((b"", start, end - start + 1))
+        else:
+            status_code = 206
+            boundary = secrets.token_hex(16)
+            headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+            for start, end in ranges:
+                part_header = (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {self.media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+                # Each part after the first starts on a new line
+                parts.append(((b"\r\n" if parts else b"") + part_header, start, end - start + 1))
+            trailer = f"\r\n--{boundary}--\r\n".encode("latin-1")
+            headers["content-length"] = str(sum(len(h) + length for h, _, length in parts) + len(trailer))
+
+        self.status_code = status_code
+        self.init_headers(headers)
+        await send({"type": "http.response.start", "status": status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or not parts:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+            with open(self.path, "rb") as f:
+                for index, (part_header, offset, length) in enumerate(parts):
+                    if part_header:
+                        await send({"type": "http.response.body", "body": part_header, "more_body": True})
+                    last = index == len(parts) - 1 and not trailer
+                    if zerocopy:
+                        await send({"type": ZEROCOPY_EXTENSION, "file": f, "offset": offset,
+                                    "count": length, "more_body": not last})
+                    else:
+                        await self._send_range(send, f.fileno(), offset, length, last)
+                if trailer:
+                    await send({"type": "http.response.body", "body": trailer, "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+    @staticmethod
+    async def _send_range(send: Send, fd: int, offset: int, length: int, last: bool) -> None:
+        """Send length bytes from offset, read off the event loop"""
+        end = offset + length
+        while offset < end:
+            chunk = await anyio.to_thread.run_sync(os.pread, fd, min(FILE_CHUNK_SIZE, end - offset), offset)
+            if not chunk:
+                # Truncated since stat(); the declared length can't be met, so end the body
+                break
+            offset += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": not last or offset < end})
+        if last and offset < end:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif length == 0 and last:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
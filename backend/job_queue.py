@@ -0,0 +1,433 @@
+import os
+import json
+import time
+import secrets
+import sqlite3
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from executors import BoundedExecutor, PoolSaturatedError, download_pool
+from audio_pipeline import is_audio_format
+from progress_events import progress_broker
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+JOB_DB_PATH = Path(os.getenv("JOB_DB_PATH", "./jobs.db"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", os.getenv("CLEANUP_INTERVAL_HOURS", "2")))
+SHORT_SEGMENT_SECONDS = int(os.getenv("SHORT_SEGMENT_SECONDS", "300"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Priority classes (lower runs first)
+PRIORITY_SHORT = 0    # audio and short segments
+PRIORITY_SEGMENT = 1  # long video segments
+PRIORITY_FULL = 2     # full-length video
+
+# Minimum seconds between persisted progress updates for a running job
+PROGRESS_PERSIST_INTERVAL = 2.0
+# Seconds the dispatcher waits before asking again whether it may start a job
+HOLD_RECHECK_INTERVAL = 1.0
+
+def job_priority(output_format: str, start_time: Optional[float], end_time: Optional[float]) -> int:
+    """Pick a priority class: audio and short clips ahead of full-length video"""
+    if is_audio_format(output_format):
+        return PRIORITY_SHORT
+    if start_time is not None and end_time is not None:
+        return PRIORITY_SHORT if end_time - start_time <= SHORT_SEGMENT_SECONDS else PRIORITY_SEGMENT
+    return PRIORITY_FULL
+
+def _hashable(value: Any) -> Hashable:
+    """Turn a dedupe key read back from JSON into the tuple it was stored from"""
+    return tuple(_hashable(v) for v in value) if isinstance(value, list) else value
+
+def new_status() -> Dict:
+    """Initial job status, same shape as /segment-progress"""
+    return {
+        'status': 'queued',
+        'progress': 0.0,
+        'message': 'Queued',
+        'speed': None,
+        'eta': None,
+        'filename': None,
+        'download_url': None,
+        'filesize': None,
+        'error': None,
+    }
+
+class Job:
+    """A persisted unit of download work"""
+
+    def __init__(self, job_id: str, user_key: str, priority: int, payload: Dict,
+                 status: Dict, created_at: float, seq: int):
+        self.job_id = job_id
+        self.user_key = user_key
+        self.priority = priority
+        self.payload = payload
+        self.status = status
+        self.created_at = created_at
+        self.seq = seq
+        self.dedupe_key: Optional[Hashable] = None
+        self.persisted_at = 0.0
+
+class JobQueue:
+    """Durable priority job queue with per-user fair share.
+
+    Jobs are written to SQLite so queued and interrupted jobs are resumed after a
+    restart. Several processes (uvicorn --workers) can share one database:
+    each holds a lease on the jobs it queued or is running and renews it
+    every third of JOB_LEASE_SECONDS. Jobs whose lease has run out belong to a
+    process that stopped, and are claimed by a single UPDATE so exactly one
+    surviving process resumes each of them. Jobs run in the download pool,
+    so they share its limit with the other downloads: when one of its workers
+    is free, it takes the pending job with the lowest (priority class, jobs
+    this user has running, jobs this user has started since going idle,
+    submission order), so one user queueing many downloads cannot starve
+    everyone else.
+    """
+
+    def __init__(self, db_path: Path = JOB_DB_PATH, pool: BoundedExecutor = download_pool,
+                 max_pending: int = JOB_QUEUE_SIZE, lease_seconds: int = JOB_LEASE_SECONDS):
+        self.db_path = Path(db_path)
+        self.pool = pool
+        self.max_pending = max_pending
+        self.lease_seconds = max(3, lease_seconds)
+        # Identifies this process's leases in a shared database
+        self.owner = f"{os.getpid()}-{secrets.token_hex(6)}"
+        self._runner: Optional[Callable[[Job, Callable], Dict]] = None
+        self._can_start: Optional[Callable[[], bool]] = None
+        self._jobs: Dict[str, Job] = {}
+        self._pending: Dict[str, Job] = {}
+        self._running_per_user: Dict[str, int] = {}
+        self._turns_per_user: Dict[str, int] = {}
+        self._dedupe: Dict[Hashable, str] = {}
+        self._waiters: Dict[str, List] = {}
+        self._cond = threading.Condition()
+        self._db_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._stopped = threading.Event()
+        self._seq = 0
+        # Jobs handed to the pool that have not taken a pending job yet
+        self._claiming = 0
+        self._stopping = False
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                user_key TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                state TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT,
+                lease_until REAL,
+                dedupe_key TEXT
+            )
+        """)
+        # Databases from before jobs were leased
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column in ("owner TEXT", "lease_until REAL", "dedupe_key TEXT"):
+            if column.split()[0] not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, updated_at)")
+        self._conn.commit()
+
+    def start(self, runner: Callable[[Job, Callable], Dict],
+              can_start: Optional[Callable[[], bool]] = None) -> None:
+        """Resume persisted jobs and start dispatching them to the pool.
+
+        runner(job, report) does the work and returns the completed status fields;
+        report(progress, message, speed, eta) publishes progress while it runs.
+        While can_start() returns False, queued jobs stay queued.
+        """
+        self._runner = runner
+        self._can_start = can_start
+        self._recover()
+        thread = threading.Thread(target=self._dispatch_loop, name="job-dispatch", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        thread = threading.Thread(target=self._lease_loop, name="job-lease", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Stop starting jobs; running ones finish in the pool"""
+        self._stopped.set()
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def submit(self, payload: Dict, user_key: str, priority: int,
+               dedupe_key: Optional[Hashable] = None) -> str:
+        """Queue a job and return its id, or the id of an identical active job"""
+        with self._cond:
+            if dedupe_key is not None and dedupe_key in self._dedupe:
+                return self._dedupe[dedupe_key]
+            if len(self._pending) >= self.max_pending:
+                raise PoolSaturatedError("job")
+            job_id = secrets.token_hex(12)
+            self._seq += 1
+            job = Job(job_id, user_key, priority, payload, new_status(), time.time(), self._seq)
+            job.dedupe_key = dedupe_key
+            self._jobs[job_id] = job
+            self._pending[job_id] = job
+            if dedupe_key is not None:
+                self._dedupe[dedupe_key] = job_id
+            row = self._persist(job, force=True)
+            self._cond.notify()
+        self._write(row)
+        return job_id
+
+    def add_completed(self, payload: Dict, user_key: str, priority: int, result: Dict) -> str:
+        """Record a job that was satisfied without running, e.g. from the download cache"""
+        with self._cond:
+            job_id = secrets.token_hex(12)
+            self._seq += 1
+            job = Job(job_id, user_key, priority, payload, new_status(), time.time(), self._seq)
+            job.status.update({'status': 'completed', 'progress': 100.0, 'message': 'Ready'})
+            job.status.update(result)
+            self._jobs[job_id] = job
+            row = self._persist(job, force=True)
+        self._write(row)
+        return job_id
+
+    def get_status(self, job_id: str) -> Optional[Dict]:
+        """Current status for a job, falling back to the persisted record"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                status = dict(job.status)
+                if status['status'] == 'queued':
+                    status['queue_position'] = self._queue_position(job)
+                return status
+        with self._db_lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Wait without blocking the event loop until a job completes or fails"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status['status'] in ('completed', 'error'):
+                return self.get_status(job_id)
+            self._waiters.setdefault(job_id, []).append((loop, future))
+        return await asyncio.wait_for(future, timeout)
+
+    def stats(self) -> Dict:
+        """Queue depth and running jobs"""
+        with self._cond:
+            return {
+                "workers": self.pool.max_workers,
+                "queued": len(self._pending),
+                "running": sum(self._running_per_user.values()),
+                "max_pending": self.max_pending,
+            }
+
+    def purge_finished(self, older_than_hours: int = JOB_RETENTION_HOURS) -> int:
+        """Forget finished jobs older than the retention window"""
+        cutoff = time.time() - older_than_hours * 3600
+        with self._cond:
+            for job_id, job in list(self._jobs.items()):
+                if job.status['status'] in ('completed', 'error') and job.persisted_at < cutoff:
+                    self._jobs.pop(job_id, None)
+        with self._db_lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE state IN ('completed', 'error') AND updated_at < ?", (cutoff,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def _queue_position(self, job: Job) -> int:
+        """1-based position of a pending job in dispatch order; caller holds the lock"""
+        order = sorted(self._pending.values(), key=self._dispatch_key)
+        return next((i + 1 for i, pending in enumerate(order) if pending.job_id == job.job_id), 0)
+
+    def _dispatch_key(self, job: Job):
+        return (
+            job.priority,
+            self._running_per_user.get(job.user_key, 0),
+            self._turns_per_user.get(job.user_key, 0),
+            job.seq,
+        )
+
+    def _recover(self) -> None:
+        """Claim queued or running jobs whose owner's lease has expired and requeue them"""
+        now = time.time()
+        with self._db_lock:
+            # One statement, so two processes starting together never claim the same job
+            self._conn.execute(
+                "UPDATE jobs SET owner = ?, lease_until = ? WHERE state IN ('queued', 'running') "
+                "AND (owner IS NULL OR lease_until IS NULL OR lease_until < ?)",
+                (self.owner, now + self.lease_seconds, now),
+            )
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT job_id, user_key, priority, payload, created_at, dedupe_key FROM jobs "
+                "WHERE owner = ? AND state IN ('queued', 'running') ORDER BY created_at",
+                (self.owner,),
+            ).fetchall()
+        writes = []
+        with self._cond:
+            for job_id, user_key, priority, payload, created_at, dedupe_key in rows:
+                if job_id in self._jobs:
+                    continue
+                self._seq += 1
+                job = Job(job_id, user_key, priority, json.loads(payload), new_status(), created_at, self._seq)
+                job.status['message'] = 'Queued (resumed after restart)'
+                if dedupe_key is not None:
+                    job.dedupe_key = _hashable(json.loads(dedupe_key))
+                    self._dedupe.setdefault(job.dedupe_key, job_id)
+                self._jobs[job_id] = job
+                self._pending[job_id] = job
+                writes.append(self._persist(job, force=True))
+            if writes:
+                logger.info(f"Resumed {len(writes)} persisted jobs")
+                self._cond.notify_all()
+        for row in writes:
+            self._write(row)
+
+    def _lease_loop(self) -> None:
+        """Keep this process's leases alive and pick up jobs left by processes that stopped"""
+        while not self._stopped.wait(self.lease_seconds / 3):
+            try:
+                with self._db_lock:
+                    self._conn.execute(
+                        "UPDATE jobs SET lease_until = ? WHERE owner = ? AND state IN ('queued', 'running')",
+                        (time.time() + self.lease_seconds, self.owner),
+                    )
+                    self._conn.commit()
+                self._recover()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not renew job leases: {e}")
+
+    def _dispatch_loop(self) -> None:
+        """Hand pending jobs to the pool whenever one of its workers is free"""
+        while True:
+            with self._cond:
+                while len(self._pending) <= self._claiming and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                self._claiming += 1
+            # Jobs only start on an idle worker, so _run_next picks the job when it really starts
+            future = self.pool.submit_if_idle(self._run_next) if self._can_start is None or self._can_start() else None
+            if future is not None:
+                # Look for the next job once the worker is back in the pool
+                future.add_done_callback(self._worker_freed)
+                continue
+            # Shedding load, or every download worker is busy: queued jobs wait
+            with self._cond:
+                self._claiming -= 1
+                if not self._stopping:
+                    self._cond.wait(HOLD_RECHECK_INTERVAL)
+
+    def _worker_freed(self, future) -> None:
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run_next(self) -> None:
+        """Pool worker: run the pending job that is due next"""
+        with self._cond:
+            self._claiming -= 1
+            if not self._pending:
+                return
+            job = min(self._pending.values(), key=self._dispatch_key)
+            self._pending.pop(job.job_id)
+            self._running_per_user[job.user_key] = self._running_per_user.get(job.user_key, 0) + 1
+            self._turns_per_user[job.user_key] = self._turns_per_user.get(job.user_key, 0) + 1
+            job.status.update({'status': 'running', 'message': 'Starting...'})
+            row = self._persist(job, force=True)
+        self._write(row)
+
+        def report(progress: float, message: Optional[str] = None,
+                   speed: Optional[float] = None, eta: Optional[float] = None):
+            with self._cond:
+                job.status['progress'] = round(max(0.0, min(100.0, progress)), 1)
+                if message:
+                    job.status['message'] = message
+                job.status['speed'] = speed
+                job.status['eta'] = eta
+                row = self._persist(job)
+            self._write(row)
+
+        try:
+            result = self._runner(job, report)
+            final = {'status': 'completed', 'progress': 100.0, 'message': 'Ready', 'speed': None, 'eta': None, 'error': None}
+            final.update(result or {})
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {e}")
+            final = {'status': 'error', 'message': 'Failed', 'speed': None, 'eta': None,
+                     'error': getattr(e, 'detail', None) or str(e)}
+
+        with self._cond:
+            job.status.update(final)
+            count = self._running_per_user.get(job.user_key, 1) - 1
+            if count > 0:
+                self._running_per_user[job.user_key] = count
+            else:
+                self._running_per_user.pop(job.user_key, None)
+                if not any(pending.user_key == job.user_key for pending in self._pending.values()):
+                    # User went idle; their next burst starts with a clean slate
+                    self._turns_per_user.pop(job.user_key, None)
+            if job.dedupe_key is not None and self._dedupe.get(job.dedupe_key) == job.job_id:
+                self._dedupe.pop(job.dedupe_key, None)
+            row = self._persist(job, force=True)
+            waiters = self._waiters.pop(job.job_id, [])
+            status = dict(job.status)
+        self._write(row)
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(self._resolve, future, status)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, status: Dict) -> None:
+        if not future.done():
+            future.set_result(status)
+
+    def _persist(self, job: Job, force: bool = False) -> Optional[Tuple]:
+        """Push a job's status to stream subscribers and return the row to write, or None to skip.
+
+        Progress-only writes are throttled. Called with _cond held; the row is
+        written by _write after it is released, so no one waits on SQLite for it.
+        """
+        progress_broker.publish(job.job_id, job.status)
+        now = time.time()
+        if not force and now - job.persisted_at < PROGRESS_PERSIST_INTERVAL:
+            return None
+        job.persisted_at = now
+        dedupe_key = json.dumps(job.dedupe_key) if job.dedupe_key is not None else None
+        return (job.job_id, job.user_key, job.priority, json.dumps(job.payload), json.dumps(job.status),
+                job.status['status'], job.created_at, now, self.owner, now + self.lease_seconds, dedupe_key)
+
+    def _write(self, row: Optional[Tuple]) -> None:
+        """Write a row from _persist.
+
+        Rows can reach here out of order once the lock is released, so an older
+        status never overwrites a newer one, and a job another process has
+        claimed since is left to that process.
+        """
+        if row is None:
+            return
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, user_key, priority, payload, status, state, created_at, updated_at, "
+                "owner, lease_until, dedupe_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (job_id) DO UPDATE SET status = excluded.status, state = excluded.state, "
+                "updated_at = excluded.updated_at, lease_until = excluded.lease_until "
+                "WHERE jobs.owner = excluded.owner AND jobs.updated_at <= excluded.updated_at",
+                row,
+            )
+            self._conn.commit()
+
+# Global job queue instance
+job_queue = JobQueue()
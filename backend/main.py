@@ -1,4 +1,5 @@
 import os
+import copy
 import json
 import asyncio
 import tempfile
@@ -6,26 +7,53 @@ import shutil
 import hashlib
 import secrets
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Union, Tuple
+from typing import Callable, Dict, List, Optional, Union, Tuple
 import yt_dlp
-import subprocess
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, status, UploadFile, File
+from yt_dlp.utils import download_range_func
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, status, UploadFile, File, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, HttpUrl, EmailStr
 from dotenv import load_dotenv
 import aiofiles
 import logging
 import io
-from storage_manager_simple import storage_manager
 
-# Load environment variables
+# Load environment variables before the local modules read their configuration
 load_dotenv()
 
+from storage_manager_simple import storage_manager
+from metadata_cache import metadata_cache, normalize_url
+from singleflight import extract_flight
+from extraction_store import extraction_store
+from job_queue import job_queue, job_priority
+from media_pipeline import device_container, process_video, process_video_async
+from audio_pipeline import audio_format_selector, is_audio_format, process_audio, process_audio_async
+from media_stream import MEDIA_TYPES, active_streams, build_stream_command, check_stream_capacity, stream_inputs, stream_ffmpeg
+from download_cache import DownloadCache, make_key
+from file_serving import RangeFileResponse, immutable_headers, offload_response
+from file_manifest import OutputRecorder, file_manifest, new_base_filename
+from progress_events import progress_broker
+from progress_store import progress_store
+from storage_cleanup import STORAGE_CHECK_INTERVAL, StorageCleaner
+from storage_layout import StorageLayout, shard_key
+from url_signing import InvalidSignatureError, url_signer
+from metrics import (
+    ACTIVE_STREAMS, DOWNLOAD_FAILURES, EXTRACT_FAILURES, EXTRACT_SECONDS, JOBS_QUEUED, JOBS_RUNNING,
+    POOL_ACTIVE, POOL_QUEUED, READY, STORAGE_DIR_BYTES, STORAGE_DIR_FILES, STORAGE_FREE_BYTES,
+    DirectoryUsage, observe_download, render_metrics, track, url_domain,
+)
+from admission import ADMISSION_RETRY_AFTER, AdmissionController
+from tracing import TracingMiddleware, current_traceparent, tracer
+from executors import (
+    PoolSaturatedError, extract_pool, download_pool, storage_pool, get_pool_stats,
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -43,6 +71,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
 
 # Configuration
 STORAGE_DIR = Path(os.getenv("STORAGE_DIR", "./downloads"))
@@ -50,6 +79,9 @@ CLEANUP_INTERVAL_HOURS = int(os.getenv("CLEANUP_INTERVAL_HOURS", "2"))
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "500"))
 USERS_DB_PATH = Path(os.getenv("USERS_DB_PATH", "./users.json"))
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
+RANGE_DOWNLOADS_ENABLED = os.getenv("RANGE_DOWNLOADS_ENABLED", "true").lower() == "true"
+ALLOWED_DOMAINS = [d.strip() for d in os.getenv("ALLOWED_DOMAINS", "").split(",") if d.strip()]
+HEALTH_STATS_TTL = float(os.getenv("HEALTH_STATS_TTL", "10"))
 
 # Multi-Storage Configuration
 # Storage limits are now managed by the storage_manager
@@ -59,6 +91,13 @@ MAX_FREE_STORAGE_MB = 500
 
 # Create storage directory
 STORAGE_DIR.mkdir(exist_ok=True)
+# Outputs are spread over hashed subdirectories of STORAGE_DIR
+storage_layout = StorageLayout(STORAGE_DIR)
+
+# Components that work on STORAGE_DIR get the resolved path rather than reading it themselves
+download_cache = DownloadCache(STORAGE_DIR)
+storage_cleaner = StorageCleaner(STORAGE_DIR, download_cache)
+admission = AdmissionController(STORAGE_DIR)
 
 # Initialize users database
 if not USERS_DB_PATH.exists():
@@ -78,10 +117,13 @@ class ExtractRequest(BaseModel):
 class DownloadRequest(BaseModel):
     url: HttpUrl
     format_id: str
-    output_format: str  # "mp4" or "mp3"
+    output_format: str  # "mp4", or audio: "mp3", "m4a" or "opus"
     device_type: Optional[str] = "unknown"  # "ios", "android", "mac", "windows", "linux"
     start_time: Optional[float] = None  # Start time in seconds for segment extraction
     end_time: Optional[float] = None    # End time in seconds for segment extraction
+    wait: Optional[bool] = False  # Block until the job finishes and return the file (legacy behaviour)
+    stream: Optional[bool] = False  # Send the media in the response body while it is being downloaded
+    save_copy: Optional[bool] = True  # When streaming, also keep the file in storage for reuse
 
 class UserRegister(BaseModel):
     username: str
@@ -147,6 +189,11 @@ class DownloadResponse(BaseModel):
 class DownloadSegmentStartResponse(BaseModel):
     progress_id: str
 
+class DownloadJobResponse(BaseModel):
+    job_id: str
+    progress_id: str  # Same as job_id; poll /jobs/{job_id} or /segment-progress/{progress_id}
+    status: str
+
 # Authentication utility functions
 def hash_password(password: str) -> str:
     """Hash password using SHA-256 with salt"""
@@ -240,6 +287,14 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+def pool_saturated_error(e: PoolSaturatedError) -> HTTPException:
+    """Build a 503 response telling the client when to retry"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
 # Cloud Storage Functions
 # Multi-storage functions using the new storage_manager
 def get_user_storage_info(user_id: str) -> Dict:
@@ -258,6 +313,13 @@ def list_cloud_files(user_id: str) -> List[Dict]:
     """List user's cloud files using multi-storage system"""
     return storage_manager.list_files(user_id)
 
+def _upload_local_file(file_path: Path, filename: str, user_id: str) -> Tuple[str, str, str]:
+    """Read a file from STORAGE_DIR and upload it to cloud storage"""
+    with tracer.span("storage.read_local", **{"file.bytes": file_path.stat().st_size}):
+        with open(file_path, 'rb') as f:
+            file_content = f.read()
+    return upload_to_cloud(file_content, filename, user_id)
+
 # Utility functions
 def is_valid_domain(url: str) -> bool:
     """Check if the URL domain is allowed"""
@@ -309,6 +371,8 @@ def is_valid_domain(url: str) -> bool:
         "periscope.tv", "www.periscope.tv", "meerkat.tv", "www.meerkat.tv",
         "blab.im", "www.blab.im", "younow.com", "www.younow.com"
     ]
+    # Extra domains from the environment (e.g. a local media server for benchmarks)
+    allowed_domains.extend(ALLOWED_DOMAINS)
     return any(domain in url for domain in allowed_domains)
 
 def get_ytdl_opts() -> Dict:
@@ -398,6 +462,32 @@ def get_ytdl_opts() -> Dict:
         },
     }
 
+def get_video_info(url: str) -> Optional[Dict]:
+    """Get yt-dlp info for a URL, reusing a cached extraction when available"""
+    info = metadata_cache.get(url)
+    if info is not None:
+        logger.info(f"Metadata cache hit for URL: {url}")
+        return info
+    
+    # Concurrent extractions of the same URL share one yt-dlp call
+    return extract_flight.do(normalize_url(url), _extract_and_cache, url)
+
+def _extract_and_cache(url: str) -> Optional[Dict]:
+    """Run yt-dlp extraction for a URL and store the result in the metadata cache"""
+    domain = url_domain(url)
+    with tracer.span("yt_dlp.extract_info", **{"url.domain": domain}) as span, \
+            track(EXTRACT_SECONDS, EXTRACT_FAILURES, domain=domain):
+        with yt_dlp.YoutubeDL(get_ytdl_opts()) as ydl:
+            info = ydl.extract_info(url, download=False)
+        # With ignoreerrors, yt-dlp reports a failed extraction by returning None instead of raising
+        if info is None:
+            span.set_error("yt-dlp returned no info")
+            EXTRACT_FAILURES.labels(domain=domain).inc()
+    
+    if info is not None:
+        metadata_cache.put(url, info)
+    return info
+
 def get_download_opts(output_path: str, format_id: str, device_type: str = "unknown") -> Dict:
     """Get yt-dlp options for downloading with device-specific optimization"""
     base_opts = {
@@ -408,7 +498,6 @@ def get_download_opts(output_path: str, format_id: str, device_type: str = "unkn
         'ignoreerrors': True,
         'no_check_certificate': True,
         'prefer_insecure': True,
-        'merge_output_format': 'mp4',  # Ensure MP4 output
         'format_sort': ['res:1080', 'ext:mp4:m4a'],  # Prefer 1080p+ and MP4
         'format_sort_force': True,  # Force format sorting
         # Enhanced anti-bot detection measures
@@ -485,276 +574,66 @@ def get_download_opts(output_path: str, format_id: str, device_type: str = "unkn
         },
     }
     
-    # Device-specific optimizations
-    if device_type == "ios":
-        # iOS optimization: MP4 format for compatibility
-        base_opts['postprocessors'] = [{
-            'key': 'FFmpegVideoConvertor',
-            'preferedformat': 'mp4',
-        }]
-    elif device_type == "android":
-        # Android optimization: MP4 format
-        base_opts['postprocessors'] = [{
-            'key': 'FFmpegVideoConvertor',
-            'preferedformat': 'mp4',
-        }]
-    elif device_type == "mac":
-        # Mac optimization: MOV format for native QuickTime compatibility
-        base_opts['postprocessors'] = [{
-            'key': 'FFmpegVideoConvertor',
-            'preferedformat': 'mov',
-        }]
+    # Device-specific optimizations. Container conversion (MOV for Mac, MP4 elsewhere)
+    # happens afterwards in media_pipeline, in the same ffmpeg pass as cutting and cleaning.
+    if device_type == "mac":
         # Additional Mac-specific options for better compatibility
         base_opts['writethumbnail'] = False  # Disable thumbnail generation
         base_opts['writesubtitles'] = False  # Disable subtitle files
         base_opts['writeautomaticsub'] = False  # Disable auto-generated subtitles
         base_opts['embedsubtitles'] = False  # Don't embed subtitles
         base_opts['writeinfojson'] = False  # Don't create info JSON files
-    else:
-        # Default optimization for Windows/Linux
-        base_opts['postprocessors'] = [{
-            'key': 'FFmpegVideoConvertor',
-            'preferedformat': 'mp4',
-        }]
     
     return base_opts
 
-def convert_to_mp3(input_path: str, output_path: str) -> bool:
-    """Convert video to MP3 using FFmpeg"""
+def cleanup_old_files():
+    """Remove expired outputs, relieve disk pressure and evict stale cached downloads"""
     try:
-        cmd = [
-            'ffmpeg', '-i', input_path, 
-            '-vn',  # No video
-            '-acodec', 'mp3', 
-            '-ab', '192k',  # Audio bitrate
-            '-ar', '44100',  # Sample rate
-            '-y',  # Overwrite output file
-            output_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return result.returncode == 0
+        # Expired files come off the manifest's expiry index; STORAGE_DIR is not swept
+        storage_cleaner.run()
+        # Cached objects live in their own directory and outlast the links handed to clients
+        download_cache.evict()
     except Exception as e:
-        logger.error(f"FFmpeg conversion error: {e}")
-        return False
-
-def extract_segment(input_path: str, output_path: str, start_time: float, end_time: float, output_format: str = "mp4") -> bool:
-    """Extract a segment from video using FFmpeg with progress tracking"""
-    try:
-        duration = end_time - start_time
-        
-        if output_format == "mp3":
-            # Extract audio segment
-            cmd = [
-                'ffmpeg', '-i', input_path,
-                '-ss', str(start_time),  # Start time
-                '-t', str(duration),     # Duration
-                '-vn',  # No video
-                '-acodec', 'mp3',
-                '-ab', '192k',  # Audio bitrate
-                '-ar', '44100',  # Sample rate
-                '-progress', 'pipe:1',  # Output progress to stdout
-                '-y',  # Overwrite output file
-                output_path
-            ]
-        else:
-            # Extract video segment
-            cmd = [
-                'ffmpeg', '-i', input_path,
-                '-ss', str(start_time),  # Start time
-                '-t', str(duration),     # Duration
-                '-c', 'copy',  # Copy streams without re-encoding for speed
-                '-avoid_negative_ts', 'make_zero',  # Handle timestamp issues
-                '-progress', 'pipe:1',  # Output progress to stdout
-                '-y',  # Overwrite output file
-                output_path
-            ]
-        
-        logger.info(f"Extracting segment: {start_time}s to {end_time}s ({duration}s duration)")
-        
-        # Run FFmpeg with progress tracking
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        
-        # Monitor progress
-        progress_lines = []
-        while True:
-            output = process.stdout.readline()
-            if output == '' and process.poll() is not None:
-                break
-            if output:
-                progress_lines.append(output.strip())
-                # Log progress every 10 lines to avoid spam
-                if len(progress_lines) % 10 == 0:
-                    logger.info(f"Segment extraction progress: {len(progress_lines)} lines processed")
-        
-        # Get the final result
-        stdout, stderr = process.communicate()
-        
-        if process.returncode == 0:
-            logger.info(f"Segment extraction successful: {output_path}")
-            return True
-        else:
-            logger.error(f"Segment extraction failed: {stderr}")
-            return False
-            
-    except subprocess.TimeoutExpired:
-        logger.error("Segment extraction timed out")
-        return False
-    except Exception as e:
-        logger.error(f"Segment extraction error: {e}")
-        return False
+        logger.error(f"Cleanup error: {e}")
 
-def extract_segment_with_progress(input_path: str, output_path: str, start_time: float, end_time: float, output_format: str = "mp4"):
-    """Extract a segment from video using FFmpeg with real-time progress updates"""
-    import time
-    import threading
-    
-    duration = end_time - start_time
-    progress_data = {
-        'status': 'starting',
-        'progress': 0,
-        'time_remaining': 0,
-        'speed': 0,
-        'error': None
-    }
-    
-    def run_extraction():
+async def periodic_storage_check():
+    """Remove files as they expire and watch free space between the hourly cleanups"""
+    while True:
+        await asyncio.sleep(STORAGE_CHECK_INTERVAL)
         try:
-            progress_data['status'] = 'extracting'
-            
-            if output_format == "mp3":
-                cmd = [
-                    'ffmpeg', '-i', input_path,
-                    '-ss', str(start_time),
-                    '-t', str(duration),
-                    '-vn',
-                    '-acodec', 'mp3',
-                    '-ab', '192k',
-                    '-ar', '44100',
-                    '-progress', 'pipe:1',
-                    '-y',
-                    output_path
-                ]
-            else:
-                cmd = [
-                    'ffmpeg', '-i', input_path,
-                    '-ss', str(start_time),
-                    '-t', str(duration),
-                    '-c', 'copy',
-                    '-avoid_negative_ts', 'make_zero',
-                    '-progress', 'pipe:1',
-                    '-y',
-                    output_path
-                ]
-            
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            start_time_actual = time.time()
-            
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    line = output.strip()
-                    # Parse FFmpeg progress
-                    if 'out_time_ms=' in line:
-                        try:
-                            time_ms = int(line.split('out_time_ms=')[1])
-                            time_seconds = time_ms / 1000000
-                            progress = min(100, (time_seconds / duration) * 100)
-                            progress_data['progress'] = progress
-                            
-                            # Calculate time remaining
-                            elapsed = time.time() - start_time_actual
-                            if progress > 0:
-                                total_estimated = elapsed / (progress / 100)
-                                remaining = total_estimated - elapsed
-                                progress_data['time_remaining'] = max(0, remaining)
-                        except:
-                            pass
-                    elif 'speed=' in line:
-                        try:
-                            speed = line.split('speed=')[1].split('x')[0]
-                            progress_data['speed'] = float(speed)
-                        except:
-                            pass
-            
-            stdout, stderr = process.communicate()
-            
-            if process.returncode == 0:
-                progress_data['status'] = 'completed'
-                progress_data['progress'] = 100
-            else:
-                progress_data['status'] = 'error'
-                progress_data['error'] = stderr
-                
+            await asyncio.to_thread(storage_cleaner.check)
         except Exception as e:
-            progress_data['status'] = 'error'
-            progress_data['error'] = str(e)
-    
-    # Start extraction in a separate thread
-    thread = threading.Thread(target=run_extraction)
-    thread.start()
-    
-    return progress_data
-
-def clean_video_for_mac(file_path: str) -> bool:
-    """Clean video metadata to ensure it opens in QuickTime/Photos instead of Subler"""
-    try:
-        # Get file extension and create temp file with same extension
-        file_ext = os.path.splitext(file_path)[1]
-        temp_path = file_path.replace(file_ext, f"_temp{file_ext}")
-        
-        cmd = [
-            'ffmpeg', '-i', file_path, 
-            '-c', 'copy',  # Copy streams without re-encoding
-            '-map_metadata', '-1',  # Remove all metadata
-            '-movflags', '+faststart',  # Optimize for streaming
-            '-y',  # Overwrite output file
-            temp_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-        
-        if result.returncode == 0:
-            # Replace original file with cleaned version
-            os.replace(temp_path, file_path)
-            logger.info(f"Successfully cleaned video metadata for Mac: {file_path}")
-            return True
-        else:
-            logger.error(f"FFmpeg metadata cleaning failed: {result.stderr}")
-            # Clean up temp file if it exists
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            return False
-    except subprocess.TimeoutExpired:
-        logger.error("FFmpeg metadata cleaning timed out")
-        return False
-    except Exception as e:
-        logger.error(f"Error cleaning video metadata: {e}")
-        return False
-
-def cleanup_old_files():
-    """Remove files older than CLEANUP_INTERVAL_HOURS"""
-    try:
-        cutoff_time = datetime.now() - timedelta(hours=CLEANUP_INTERVAL_HOURS)
-        for file_path in STORAGE_DIR.iterdir():
-            if file_path.is_file() and datetime.fromtimestamp(file_path.stat().st_mtime) < cutoff_time:
-                file_path.unlink()
-                logger.info(f"Cleaned up old file: {file_path}")
-    except Exception as e:
-        logger.error(f"Cleanup error: {e}")
+            logger.error(f"Storage check error: {e}")
 
 # Background task for cleanup
 async def periodic_cleanup():
     """Periodic cleanup task"""
     while True:
         await asyncio.sleep(3600)  # Run every hour
-        cleanup_old_files()
+        await asyncio.to_thread(cleanup_old_files)
+        # The purges are SQLite deletes, so they run in the storage pool like other disk work
+        try:
+            purged = await storage_pool.run(extraction_store.purge_expired)
+            if purged:
+                logger.info(f"Purged {purged} expired extractions")
+        except Exception as e:
+            logger.error(f"Extraction store purge error: {e}")
+        try:
+            await storage_pool.run(job_queue.purge_finished)
+        except Exception as e:
+            logger.error(f"Job purge error: {e}")
+        try:
+            await storage_pool.run(progress_store.purge_expired)
+        except Exception as e:
+            logger.error(f"Progress purge error: {e}")
 
 # Startup event
 @app.on_event("startup")
 async def startup_event():
-    """Start background cleanup task"""
+    """Start background cleanup task and the download job dispatcher"""
     asyncio.create_task(periodic_cleanup())
+    asyncio.create_task(periodic_storage_check())
+    job_queue.start(_run_download_job, can_start=admission.can_start_job)
 
 # Authentication Endpoints
 @app.post("/auth/register", response_model=AuthResponse)
@@ -865,7 +744,7 @@ async def logout_user(current_user: Dict = Depends(get_current_user)):
 @app.get("/cloud/storage", response_model=StorageInfo)
 async def get_storage_info(current_user: Dict = Depends(get_current_user)):
     """Get user's storage information"""
-    storage_info = get_user_storage_info(current_user['id'])
+    storage_info = await storage_pool.run(get_user_storage_info, current_user['id'])
     
     return StorageInfo(
         used_mb=storage_info['usage_mb'],
@@ -877,7 +756,7 @@ async def get_storage_info(current_user: Dict = Depends(get_current_user)):
 @app.get("/cloud/files", response_model=List[CloudFile])
 async def get_cloud_files(current_user: Dict = Depends(get_current_user)):
     """Get user's cloud files"""
-    files = list_cloud_files(current_user['id'])
+    files = await storage_pool.run(list_cloud_files, current_user['id'])
     
     return [CloudFile(
         id=file['id'],
@@ -899,7 +778,9 @@ async def upload_to_cloud_storage(
         file_content = await file.read()
         
         # Upload to cloud using multi-storage system
-        download_url, file_id, provider_name = upload_to_cloud(file_content, file.filename, current_user['id'])
+        download_url, file_id, provider_name = await storage_pool.run(
+            upload_to_cloud, file_content, file.filename, current_user['id']
+        )
         
         logger.info(f"File uploaded to {provider_name}: {file.filename} by {current_user['username']}")
         
@@ -910,6 +791,8 @@ async def upload_to_cloud_storage(
             "file_size": len(file_content),
             "provider": provider_name
         }
+    except PoolSaturatedError as e:
+        raise pool_saturated_error(e)
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
@@ -922,18 +805,14 @@ async def save_download_to_cloud(
     """Save a downloaded file to cloud storage"""
     try:
         # Find the downloaded file
-        downloaded_files = list(STORAGE_DIR.glob(f"*{request.filename}"))
-        if not downloaded_files:
+        file_path = await storage_pool.run(_find_output, request.filename)
+        if file_path is None:
             raise HTTPException(status_code=404, detail="Downloaded file not found")
         
-        file_path = downloaded_files[0]
-        
-        # Read file content
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
-        
-        # Upload to cloud using multi-storage system
-        download_url, file_id, provider_name = upload_to_cloud(file_content, request.filename, current_user['id'])
+        # Read and upload off the event loop using multi-storage system
+        download_url, file_id, provider_name = await storage_pool.run(
+            _upload_local_file, file_path, request.filename, current_user['id']
+        )
         
         logger.info(f"Download saved to {provider_name}: {request.filename} by {current_user['username']}")
         
@@ -944,6 +823,8 @@ async def save_download_to_cloud(
             "file_size": request.file_size,
             "provider": provider_name
         }
+    except PoolSaturatedError as e:
+        raise pool_saturated_error(e)
     except Exception as e:
         logger.error(f"Save to cloud failed: {e}")
         raise HTTPException(status_code=500, detail=f"Save to cloud failed: {str(e)}")
@@ -969,7 +850,7 @@ async def watch_ad_for_storage(current_user: Dict = Depends(get_current_user)):
 async def delete_cloud_file(file_id: str, current_user: Dict = Depends(get_current_user)):
     """Delete a file from cloud storage"""
     try:
-        success = delete_from_cloud(file_id, current_user['id'])
+        success = await storage_pool.run(delete_from_cloud, file_id, current_user['id'])
         
         if not success:
             raise HTTPException(status_code=404, detail="File not found or deletion failed")
@@ -981,9 +862,73 @@ async def delete_cloud_file(file_id: str, current_user: Dict = Depends(get_curre
         logger.error(f"Delete file failed: {e}")
         raise HTTPException(status_code=500, detail=f"Delete file failed: {str(e)}")
 
+def build_extract_response(info: Dict) -> ExtractResponse:
+    """Build the /extract response from yt-dlp info"""
+    # Log available qualities
+    available_qualities = []
+    for fmt in info.get('formats', []):
+        if fmt.get('vcodec') != 'none' and fmt.get('resolution'):
+            available_qualities.append(fmt.get('resolution'))
+    
+    if available_qualities:
+        max_quality = max(available_qualities, key=lambda x: int(x.split('x')[1]) if 'x' in x else 0)
+        logger.info(f"Available qualities: {sorted(set(available_qualities), key=lambda x: int(x.split('x')[1]) if 'x' in x else 0, reverse=True)}")
+        logger.info(f"Will download in: {max_quality}")
+    
+    # Filter and format available formats
+    formats = []
+    for fmt in info.get('formats', []):
+        if fmt.get('vcodec') != 'none' or fmt.get('acodec') != 'none':  # Has video or audio
+            format_info = FormatInfo(
+                format_id=fmt['format_id'],
+                ext=fmt.get('ext', 'unknown'),
+                resolution=fmt.get('resolution'),
+                fps=fmt.get('fps'),
+                vcodec=fmt.get('vcodec'),
+                acodec=fmt.get('acodec'),
+                filesize=fmt.get('filesize'),
+                quality=fmt.get('quality')
+            )
+            formats.append(format_info)
+    
+    # Sort formats by quality (resolution first, then filesize)
+    formats.sort(key=lambda x: (
+        -int(x.resolution.split('x')[1]) if x.resolution and 'x' in x.resolution else 0,
+        -(x.filesize or 0)
+    ))
+    
+    # Log the top 5 formats for debugging
+    logger.info(f"Top 5 available formats:")
+    for i, fmt in enumerate(formats[:5]):
+        logger.info(f"  {i+1}. {fmt.format_id} - {fmt.resolution} - {fmt.ext} - {fmt.vcodec}")
+    
+    return ExtractResponse(
+        title=info.get('title', 'Unknown'),
+        thumbnail=info.get('thumbnail'),
+        duration=info.get('duration'),
+        formats=formats
+    )
+
+async def _persist_extraction(url: str, response: ExtractResponse) -> None:
+    """Write an extraction to the persistent store in the storage pool (skipped while it is saturated)"""
+    try:
+        await storage_pool.run(extraction_store.put, url, jsonable_encoder(response))
+    except PoolSaturatedError:
+        logger.warning(f"Storage pool saturated, extraction for {url} not persisted")
+
+async def _refresh_extraction(url: str):
+    """Re-extract a stale URL in the background and update the persistent store"""
+    try:
+        info = await extract_flight.do_async(normalize_url(url), extract_pool.run, _extract_and_cache, url)
+        if info is not None:
+            await _persist_extraction(url, build_extract_response(info))
+            logger.info(f"Refreshed stale extraction for URL: {url}")
+    except Exception as e:
+        logger.warning(f"Background refresh failed for {url}: {e}")
+
 # API Endpoints
 @app.post("/extract", response_model=ExtractResponse)
-async def extract_video_info(request: ExtractRequest):
+async def extract_video_info(request: ExtractRequest, background_tasks: BackgroundTasks):
     """Extract video information and available formats"""
     try:
         url = str(request.url)
@@ -993,61 +938,35 @@ async def extract_video_info(request: ExtractRequest):
             logger.error(f"Domain not allowed for URL: {url}")
             raise HTTPException(status_code=400, detail="Domain not allowed")
         
-        with yt_dlp.YoutubeDL(get_ytdl_opts()) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            # Check if extraction was successful
-            if info is None:
-                raise Exception("Failed to extract video information. The video may be private, restricted, or temporarily unavailable.")
-            
-            # Log available qualities
-            available_qualities = []
-            for fmt in info.get('formats', []):
-                if fmt.get('vcodec') != 'none' and fmt.get('resolution'):
-                    available_qualities.append(fmt.get('resolution'))
-            
-            if available_qualities:
-                max_quality = max(available_qualities, key=lambda x: int(x.split('x')[1]) if 'x' in x else 0)
-                logger.info(f"Available qualities: {sorted(set(available_qualities), key=lambda x: int(x.split('x')[1]) if 'x' in x else 0, reverse=True)}")
-                logger.info(f"Will download in: {max_quality}")
-            
-            # Filter and format available formats
-            formats = []
-            for fmt in info.get('formats', []):
-                if fmt.get('vcodec') != 'none' or fmt.get('acodec') != 'none':  # Has video or audio
-                    format_info = FormatInfo(
-                        format_id=fmt['format_id'],
-                        ext=fmt.get('ext', 'unknown'),
-                        resolution=fmt.get('resolution'),
-                        fps=fmt.get('fps'),
-                        vcodec=fmt.get('vcodec'),
-                        acodec=fmt.get('acodec'),
-                        filesize=fmt.get('filesize'),
-                        quality=fmt.get('quality')
-                    )
-                    formats.append(format_info)
-            
-            # Sort formats by quality (resolution first, then filesize)
-            formats.sort(key=lambda x: (
-                -int(x.resolution.split('x')[1]) if x.resolution and 'x' in x.resolution else 0,
-                -(x.filesize or 0)
-            ))
-            
-            # Log the top 5 formats for debugging
-            logger.info(f"Top 5 available formats:")
-            for i, fmt in enumerate(formats[:5]):
-                logger.info(f"  {i+1}. {fmt.format_id} - {fmt.resolution} - {fmt.ext} - {fmt.vcodec}")
-            
-            return ExtractResponse(
-                title=info.get('title', 'Unknown'),
-                thumbnail=info.get('thumbnail'),
-                duration=info.get('duration'),
-                formats=formats
-            )
-            
+        info = metadata_cache.get(url)
+        if info is not None:
+            return build_extract_response(info)
+        
+        # Serve persisted results, refreshing stale ones after the response is sent
+        stored = await storage_pool.run(extraction_store.get, url)
+        if stored is not None:
+            response_data, is_stale = stored
+            if is_stale:
+                logger.info(f"Serving stale extraction for URL: {url}")
+                background_tasks.add_task(_refresh_extraction, url)
+            return ExtractResponse(**response_data)
+        
+        # Run yt-dlp in the extraction pool; identical concurrent requests share it
+        info = await extract_flight.do_async(normalize_url(url), extract_pool.run, get_video_info, url)
+        
+        # Check if extraction was successful
+        if info is None:
+            raise Exception("Failed to extract video information. The video may be private, restricted, or temporarily unavailable.")
+        
+        response = build_extract_response(info)
+        await _persist_extraction(url, response)
+        return response
+        
     except HTTPException:
         # Re-raise HTTPExceptions (like domain not allowed) without modification
         raise
+    except PoolSaturatedError as e:
+        raise pool_saturated_error(e)
     except Exception as e:
         logger.error(f"Extract error: {e}")
         logger.error(f"Extract error type: {type(e)}")
@@ -1082,9 +1001,270 @@ async def extract_video_info(request: ExtractRequest):
         
         raise HTTPException(status_code=400, detail=f"Failed to extract video info: {error_msg}")
 
-@app.post("/download", response_model=DownloadResponse)
-async def download_video(request: DownloadRequest, background_tasks: BackgroundTasks):
-    """Download video in specified format"""
+def _make_progress_hook(progress_callback: Optional[Callable], max_progress: float = 90.0) -> Callable:
+    """Build a yt-dlp progress hook that maps download progress onto 0..max_progress"""
+    def progress_hook(d):
+        if progress_callback is None:
+            return
+        try:
+            if d.get('status') == 'downloading':
+                total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                downloaded = d.get('downloaded_bytes') or 0
+                if total and downloaded:
+                    progress_callback(min(1.0, downloaded / total) * max_progress, 'Downloading...',
+                                      d.get('speed'), d.get('eta'))
+            elif d.get('status') == 'finished':
+                progress_callback(max_progress, 'Processing...')
+        except Exception:
+            pass
+    return progress_hook
+
+def download_section(url: str, download_opts: Dict, start_time: float, end_time: float) -> bool:
+    """Download only [start_time, end_time] of a video using yt-dlp's range support.
+    
+    yt-dlp hands the direct media URL to FFmpeg with input seeking, so only the bytes
+    covering the section are fetched. Returns False when the source could not be
+    range-downloaded so callers can fall back to a full download.
+    """
+    if not RANGE_DOWNLOADS_ENABLED:
+        return False
+    
+    section_opts = dict(download_opts)
+    section_opts['download_ranges'] = download_range_func(None, [(start_time, end_time)])
+    with tracer.span("yt_dlp.download_section", **{"segment.start": start_time, "segment.end": end_time}) as span:
+        try:
+            with yt_dlp.YoutubeDL(section_opts) as ydl:
+                retcode = ydl.download([url])
+            if retcode == 0:
+                logger.info(f"Range download of {start_time}s-{end_time}s succeeded")
+                return True
+            logger.warning(f"Range download returned {retcode}, falling back to full download")
+            span.set_error(f"yt-dlp returned {retcode}")
+        except Exception as e:
+            logger.warning(f"Range download failed, falling back to full download: {e}")
+            span.record_exception(e)
+    return False
+
+def _download_to_storage(url: str, request: DownloadRequest, device_type: str,
+                         progress_callback: Optional[Callable] = None, job_id: Optional[str] = None) -> Path:
+    """Download a video into STORAGE_DIR and return the final file path"""
+    start_time = request.start_time
+    end_time = request.end_time
+    is_segment = start_time is not None and end_time is not None
+    progress_hook = _make_progress_hook(progress_callback)
+    
+    # Generate unique filename with device info
+    base_filename = new_base_filename(device_type, start_time, end_time)
+    source_template = storage_layout.path(f"{base_filename}_src.%(ext)s", create=True)
+    
+    if is_audio_format(request.output_format):
+        format_selector = audio_format_selector(request.output_format)
+    else:
+        format_selector = request.format_id
+        logger.info(f"Using format selector: {format_selector}")
+    
+    # yt-dlp reports where the download ended up, so there is no need to search for it
+    recorder = OutputRecorder()
+    download_opts = get_download_opts(str(source_template), format_selector, device_type)
+    download_opts['progress_hooks'] = [progress_hook]
+    recorder.install(download_opts)
+    _merge_while_downloading(download_opts, url, format_selector, device_type)
+    
+    # Fetch only the requested section when possible
+    download_started = time.perf_counter()
+    ranged = False
+    with tracer.span("yt_dlp.download", **{"url.domain": url_domain(url), "format_id": format_selector}) as span:
+        try:
+            ranged = is_segment and download_section(url, download_opts, start_time, end_time) and recorder.final_path is not None
+            if not ranged:
+                with yt_dlp.YoutubeDL(download_opts) as ydl:
+                    ydl.download([url])
+        except Exception as e:
+            logger.error(f"Download error: {e}")
+            DOWNLOAD_FAILURES.labels(kind="range" if ranged else "full").inc()
+            raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
+        
+        source_path = recorder.final_path
+        if source_path is None:
+            DOWNLOAD_FAILURES.labels(kind="range" if ranged else "full").inc()
+            raise HTTPException(status_code=500, detail="No file was downloaded")
+        source_size = source_path.stat().st_size
+        span.set_attributes(**{"download.kind": "range" if ranged else "full", "download.bytes": source_size})
+    observe_download("range" if ranged else "full", time.perf_counter() - download_started, source_size)
+    logger.info(f"Downloaded: {source_path.name}")
+    
+    cut_start, cut_end = (start_time, end_time) if is_segment and not ranged else (None, None)
+    try:
+        if is_audio_format(request.output_format):
+            # Cut and encode (or copy) the native audio in one ffmpeg pass
+            final_path = storage_layout.path(f"{base_filename}.{request.output_format}", create=True)
+            final_path = process_audio(source_path, final_path, request.output_format, cut_start, cut_end)
+            logger.info(f"Audio successfully extracted to: {final_path}")
+        else:
+            # Convert the container, cut the segment (unless only the range was downloaded) and,
+            # for Mac, strip metadata so it opens in QuickTime/Photos - all in one ffmpeg pass
+            final_path = storage_layout.path(f"{base_filename}.{device_container(device_type)}", create=True)
+            final_path = process_video(source_path, final_path, cut_start, cut_end, device_type == "mac")
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # Check file size
+    file_size = final_path.stat().st_size
+    logger.info(f"Final file size: {file_size} bytes")
+    
+    if file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
+        final_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=413, detail="File too large")
+    
+    file_manifest.register(final_path, job_id)
+    return final_path
+
+def _client_key(http_request: Request) -> str:
+    """Identify the requesting client for fair scheduling"""
+    forwarded = http_request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return http_request.client.host if http_request.client else "unknown"
+
+def _download_key(request: DownloadRequest, device_type: str) -> Tuple:
+    """Everything that determines a download's output file"""
+    return (
+        normalize_url(str(request.url)), request.format_id, request.output_format,
+        device_type, request.start_time, request.end_time,
+    )
+
+def _cache_key(request: DownloadRequest, device_type: str, streamed: bool = False) -> str:
+    """Download cache key; stream copies (fragmented MP4, keyframe-aligned cuts) are kept apart from /download outputs"""
+    key = _download_key(request, device_type)
+    return make_key(key + ("stream",) if streamed else key)
+
+def _file_result(file_path: Path) -> Dict:
+    """Status fields describing a finished file"""
+    return {
+        'filename': file_path.name,
+        'download_url': f"/files/{file_path.name}",
+        'filesize': file_path.stat().st_size,
+    }
+
+def _reuse_cached_download(request: DownloadRequest, device_type: str, job_id: Optional[str] = None,
+                           streamed: bool = False) -> Optional[Path]:
+    """Hard-link a cached output for an identical earlier request into STORAGE_DIR"""
+    cache_key = _cache_key(request, device_type, streamed)
+    stem = new_base_filename(device_type, request.start_time, request.end_time)
+    path = download_cache.link(cache_key, storage_layout.shard_dir(shard_key(stem), create=True), stem)
+    if path is not None:
+        # The cache already knows the content hash; don't rehash on the event loop
+        file_manifest.register(path, job_id, download_cache.content_hash(cache_key))
+    return path
+
+def _find_output(filename: str) -> Optional[Path]:
+    """Resolve a served filename through the manifest (files from before it existed are checked directly)"""
+    file_path = file_manifest.lookup(filename)
+    if file_path is None:
+        file_path = storage_layout.locate(filename)
+    return file_path
+
+def _served_file(filename: str) -> Optional[Tuple[Path, Optional[Tuple[str, int]]]]:
+    """Resolve a file for /files, record the access and read its recorded (SHA-256, size)"""
+    file_path = _find_output(filename)
+    if file_path is None:
+        return None
+    file_manifest.touch(filename)
+    return file_path, file_manifest.lookup_hash(filename)
+
+def _cache_download(request: DownloadRequest, device_type: str, file_path: Path, streamed: bool = False) -> None:
+    """Record a finished output so identical requests can reuse it"""
+    try:
+        recorded = file_manifest.lookup_hash(file_path.name)
+        download_cache.store(_cache_key(request, device_type, streamed), file_path,
+                             recorded[0] if recorded else None)
+    except Exception as e:
+        logger.warning(f"Could not cache download {file_path.name}: {e}")
+
+def _run_download_job(job, report: Callable) -> Dict:
+    """Job queue runner for /download jobs"""
+    request = DownloadRequest(**job.payload['request'])
+    device_type = job.payload['device_type']
+    # Continue the trace of the request that queued the job
+    with tracer.span("job.download", parent=job.payload.get('traceparent'),
+                     **{"job.id": job.job_id, "device_type": device_type, "output_format": request.output_format}) as span:
+        # A job resumed after a restart may already have produced its file
+        final_path = file_manifest.lookup_job(job.job_id) or _reuse_cached_download(request, device_type, job.job_id)
+        if final_path is None:
+            final_path = _download_to_storage(str(request.url), request, device_type, report, job.job_id)
+            _cache_download(request, device_type, final_path)
+        span.set_attribute("file.bytes", final_path.stat().st_size)
+        return _file_result(final_path)
+
+def _resolve_formats(url: str, format_selector: str, device_type: str) -> Optional[Dict]:
+    """Let yt-dlp pick the formats for a selector from the cached extraction, without downloading them"""
+    info = get_video_info(url)
+    if info is None:
+        return None
+    # Format selection mutates the info dict, so run it on a copy of the cached one,
+    # without the formats picked when it was extracted
+    info = copy.deepcopy(info)
+    for key in ('requested_formats', 'requested_downloads', 'requested_subtitles'):
+        info.pop(key, None)
+    with yt_dlp.YoutubeDL(get_download_opts("-", format_selector, device_type)) as ydl:
+        return ydl.process_ie_result(info, download=False)
+
+def _resolve_stream_formats(url: str, request: DownloadRequest, device_type: str) -> Optional[Dict]:
+    """The formats yt-dlp would download for a request"""
+    format_id = audio_format_selector(request.output_format) if is_audio_format(request.output_format) else request.format_id
+    return _resolve_formats(url, format_id, device_type)
+
+def _merge_while_downloading(download_opts: Dict, url: str, format_selector: str, device_type: str) -> Dict:
+    """Have ffmpeg mux separate video and audio formats as it downloads them.
+
+    Otherwise yt-dlp downloads each format to its own file and runs an ffmpeg
+    merge pass over them before media_pipeline's pass.
+    """
+    try:
+        info = _resolve_formats(url, format_selector, device_type)
+    except Exception as e:
+        logger.warning(f"Format resolution failed, downloading with yt-dlp's merger: {e}")
+        return download_opts
+    if info is not None and len(info.get('requested_formats') or []) > 1:
+        download_opts['external_downloader'] = {'default': 'ffmpeg'}
+    return download_opts
+
+async def _stream_download(request: DownloadRequest, device_type: str) -> StreamingResponse:
+    """Pipe ffmpeg's fragmented MP4 / audio output to the client as it is produced"""
+    slot = check_stream_capacity()
+    try:
+        url = str(request.url)
+        info = await extract_pool.run(_resolve_stream_formats, url, request, device_type)
+        inputs = stream_inputs(info or {})
+        if not inputs:
+            raise HTTPException(status_code=500, detail="No streamable format found")
+        
+        output_format = request.output_format if is_audio_format(request.output_format) else "mp4"
+        cmd = build_stream_command(inputs, output_format, request.start_time, request.end_time)
+        
+        filename = f"{new_base_filename(device_type, request.start_time, request.end_time)}.{output_format}"
+        
+        # The saved copy is fragmented and cut at keyframes, so it is only reused for repeat streams
+        save_path = storage_layout.path(filename, create=True) if request.save_copy else None
+        
+        async def on_saved(path: Path):
+            await storage_pool.run(file_manifest.register, path)
+            await storage_pool.run(_cache_download, request, device_type, path, True)
+        
+        logger.info(f"Streaming {output_format} for {url}")
+        return StreamingResponse(
+            stream_ffmpeg(cmd, slot, save_path, on_saved if save_path else None),
+            media_type=MEDIA_TYPES[output_format],
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+        )
+    except BaseException:
+        # The stream never started, so stream_ffmpeg will not release the slot
+        slot.release()
+        raise
+
+@app.post("/download", response_model=Union[DownloadResponse, DownloadJobResponse])
+async def download_video(request: DownloadRequest, background_tasks: BackgroundTasks, http_request: Request):
+    """Queue a download job; with wait=true, block until the file is ready; with stream=true, send the file as it downloads"""
     try:
         url = str(request.url)
         device_type = request.device_type or "unknown"
@@ -1101,268 +1281,251 @@ async def download_video(request: DownloadRequest, background_tasks: BackgroundT
             if end_time - start_time > 3600:  # Max 1 hour segment
                 raise HTTPException(status_code=400, detail="Segment too long (max 1 hour)")
         
-        logger.info(f"Downloading for device type: {device_type}")
+        logger.info(f"Queueing download for device type: {device_type}")
         if start_time is not None and end_time is not None:
             logger.info(f"Segment extraction: {start_time}s to {end_time}s")
         
-        # Generate unique filename with device info
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        segment_suffix = f"_segment_{int(start_time)}_{int(end_time)}" if start_time is not None and end_time is not None else ""
-        base_filename = f"download_{device_type}_{timestamp}{segment_suffix}"
+        payload = {'request': jsonable_encoder(request), 'device_type': device_type, 'traceparent': current_traceparent()}
+        priority = job_priority(request.output_format, start_time, end_time)
         
-        if request.output_format == "mp3":
-            # For MP3, we need to download audio first, then convert
-            temp_audio_path = STORAGE_DIR / f"{base_filename}_temp.%(ext)s"
-            final_path = STORAGE_DIR / f"{base_filename}.mp3"
-            
-            # Use best audio format for MP3 conversion
-            audio_format = "bestaudio"
-            
-            # Create audio-specific download options
-            audio_opts = get_download_opts(str(temp_audio_path), audio_format, device_type)
-            audio_opts.update({
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                'outtmpl': str(final_path),
-            })
-            
-            # Download audio
-            try:
-                with yt_dlp.YoutubeDL(audio_opts) as ydl:
-                    ydl.download([url])
-                
-                # Check if MP3 file was created
-                if not final_path.exists():
-                    raise HTTPException(status_code=500, detail="Failed to extract audio to MP3")
-                    
-                logger.info(f"Audio successfully extracted to: {final_path}")
-                
-                # If segment extraction is requested, extract segment from the MP3
-                if start_time is not None and end_time is not None:
-                    temp_segment_path = STORAGE_DIR / f"{base_filename}_segment_temp.mp3"
-                    if extract_segment(str(final_path), str(temp_segment_path), start_time, end_time, "mp3"):
-                        # Replace original with segment
-                        os.replace(str(temp_segment_path), str(final_path))
-                        logger.info(f"Segment extracted successfully: {final_path}")
-                    else:
-                        # Clean up temp file
-                        if temp_segment_path.exists():
-                            temp_segment_path.unlink()
-                        raise HTTPException(status_code=500, detail="Failed to extract audio segment")
-                
-            except Exception as e:
-                logger.error(f"Audio download error: {e}")
-                raise HTTPException(status_code=500, detail=f"Audio extraction failed: {str(e)}")
-            
-        else:  # Video format - use the format's native extension
-            # Handle yt-dlp format selection strings
-            if '/' in request.format_id or '[' in request.format_id or request.format_id == 'best' or 'bestvideo' in request.format_id:
-                # This is a yt-dlp format selection string, let yt-dlp handle it
-                final_path = STORAGE_DIR / f"{base_filename}.%(ext)s"
-                
-                # Use the provided format selector
-                format_selector = request.format_id
-                logger.info(f"Using format selector: {format_selector}")
-                
-                # Get download options with the format selector
-                download_opts = get_download_opts(str(final_path), format_selector, device_type)
-                
-                with yt_dlp.YoutubeDL(download_opts) as ydl:
-                    ydl.download([url])
-                
-                # Find the downloaded file
-                downloaded_files = list(STORAGE_DIR.glob(f"{base_filename}.*"))
-                logger.info(f"Looking for files matching: {base_filename}.*")
-                logger.info(f"Found files: {[f.name for f in downloaded_files]}")
-                
-                if downloaded_files:
-                    final_path = downloaded_files[0]
-                    logger.info(f"Selected file: {final_path.name}")
-                else:
-                    # Try to find any recently created files in the downloads directory
-                    all_files = list(STORAGE_DIR.glob("*"))
-                    recent_files = [f for f in all_files if f.stat().st_mtime > (datetime.now().timestamp() - 60)]
-                    logger.info(f"Recent files in downloads: {[f.name for f in recent_files]}")
-                    
-                    if recent_files:
-                        final_path = recent_files[0]
-                        logger.info(f"Using recent file: {final_path.name}")
-                    else:
-                        raise HTTPException(status_code=500, detail="No file was downloaded")
-                
-                # If segment extraction is requested, extract segment from the video
-                if start_time is not None and end_time is not None:
-                    temp_segment_path = STORAGE_DIR / f"{base_filename}_segment_temp{final_path.suffix}"
-                    if extract_segment(str(final_path), str(temp_segment_path), start_time, end_time, "mp4"):
-                        # Replace original with segment
-                        os.replace(str(temp_segment_path), str(final_path))
-                        logger.info(f"Video segment extracted successfully: {final_path}")
-                    else:
-                        # Clean up temp file
-                        if temp_segment_path.exists():
-                            temp_segment_path.unlink()
-                        raise HTTPException(status_code=500, detail="Failed to extract video segment")
-            else:
-                # Specific format ID - get the format info to determine the correct extension
-                with yt_dlp.YoutubeDL(get_ytdl_opts()) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    formats = info.get('formats', [])
-                    format_info = next((f for f in formats if f['format_id'] == request.format_id), None)
-                    
-                    if format_info:
-                        ext = format_info.get('ext', 'mp4')
-                    else:
-                        ext = 'mp4'  # fallback
-                
-                final_path = STORAGE_DIR / f"{base_filename}.{ext}"
-                
-                with yt_dlp.YoutubeDL(get_download_opts(str(final_path), request.format_id, device_type)) as ydl:
-                    ydl.download([url])
+        # Serve an identical earlier download from the cache without queueing
+        # Linking (or, across filesystems, copying) and indexing the cached file is disk work
+        cached_path = await storage_pool.run(_reuse_cached_download, request, device_type)
+        if cached_path is None and request.stream:
+            # A copy saved by an earlier identical stream is good enough to stream again
+            cached_path = await storage_pool.run(_reuse_cached_download, request, device_type, None, True)
+        if cached_path is not None:
+            result = await storage_pool.run(_file_result, cached_path)
+            if request.stream:
+                return RangeFileResponse(path=str(cached_path), filename=cached_path.name,
+                                         media_type=MEDIA_TYPES.get(cached_path.suffix.lstrip('.'), 'application/octet-stream'))
+            if request.wait:
+                return DownloadResponse(**url_signer.sign_status(result))
+            job_id = await storage_pool.run(job_queue.add_completed, payload, _client_key(http_request), priority, result)
+            await storage_pool.run(file_manifest.register, cached_path, job_id)
+            return DownloadJobResponse(job_id=job_id, progress_id=job_id, status='completed')
         
-        # Clean video metadata for Mac to ensure it opens in QuickTime/Photos
-        if device_type == "mac" and (str(final_path).endswith('.mp4') or str(final_path).endswith('.mov')):
-            logger.info(f"Cleaning metadata for Mac file: {final_path.name}")
-            clean_video_for_mac(str(final_path))
+        # Shed load before starting anything new; queued jobs are still accepted while throttled
+        admission.check(immediate=request.stream)
         
-        # Check file size
-        file_size = final_path.stat().st_size
-        logger.info(f"Final file size: {file_size} bytes")
+        if request.stream:
+            return await _stream_download(request, device_type)
         
-        if file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
-            final_path.unlink(missing_ok=True)
-            raise HTTPException(status_code=413, detail="File too large")
+        # Identical requests attach to the job that is already queued or running;
+        # queuing writes the job to SQLite, so it happens in the storage pool
+        job_id = await storage_pool.run(
+            job_queue.submit,
+            payload,
+            user_key=_client_key(http_request),
+            priority=priority,
+            dedupe_key=_download_key(request, device_type),
+        )
         
-        # Schedule cleanup
-        background_tasks.add_task(cleanup_old_files)
+        # Free space for the new job if the disk is filling up (at most once per STORAGE_CHECK_INTERVAL)
+        background_tasks.add_task(storage_cleaner.check)
         
-        logger.info(f"Returning download response for: {final_path.name}")
+        if not request.wait:
+            return DownloadJobResponse(job_id=job_id, progress_id=job_id, status='queued')
+        
+        job_status = await job_queue.wait(job_id)
+        if job_status is None or job_status['status'] != 'completed':
+            error = job_status.get('error') if job_status else "Job not found"
+            raise HTTPException(status_code=500, detail=f"Download failed: {error}")
+        
+        logger.info(f"Returning download response for: {job_status['filename']}")
+        job_status = url_signer.sign_status(job_status)
         return DownloadResponse(
-            download_url=f"/files/{final_path.name}",
-            filename=final_path.name,
-            filesize=file_size
+            download_url=job_status['download_url'],
+            filename=job_status['filename'],
+            filesize=job_status['filesize']
         )
         
+    except PoolSaturatedError as e:
+        raise pool_saturated_error(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Download error: {e}")
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
-@app.get("/files/{filename}")
-async def serve_file(filename: str):
-    """Serve downloaded files"""
-    file_path = STORAGE_DIR / filename
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Get status of a download job (same shape as /segment-progress)"""
+    # Finished jobs may only be in SQLite
+    job_status = await _store_call(job_queue.get_status, job_id)
+    if job_status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return url_signer.sign_status(job_status)
+
+@app.api_route("/files/{filename}", methods=["GET", "HEAD"])
+async def serve_file(filename: str, expires: Optional[str] = None, signature: Optional[str] = None):
+    """Serve downloaded files, with byte ranges so players can seek and clients can resume"""
+    # Signed links are checked before anything touches the manifest or disk
+    max_age = None
+    if url_signer.enabled:
+        try:
+            max_age = url_signer.verify(f"/files/{filename}", expires, signature)
+        except InvalidSignatureError as e:
+            raise HTTPException(status_code=403, detail=str(e))
+    
+    # Manifest reads and the last-access write run in the storage pool, off the event loop
+    try:
+        served = await storage_pool.run(_served_file, filename)
+    except PoolSaturatedError as e:
+        raise pool_saturated_error(e)
     
-    if not file_path.exists():
+    if served is None:
         raise HTTPException(status_code=404, detail="File not found")
+    file_path, recorded = served
     
-    return FileResponse(
-        path=str(file_path),
-        filename=filename,
-        media_type='application/octet-stream'
-    )
+    # Let the front proxy push the bytes when it is set up to
+    offloaded = offload_response(file_path, STORAGE_DIR, filename, immutable_headers(None, max_age))
+    if offloaded is not None:
+        return offloaded
+    
+    # Outputs are immutable under unique names: the hash taken when the file was written is its ETag
+    try:
+        stat_result = file_path.stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    content_hash = recorded[0] if recorded and recorded[1] == stat_result.st_size else None
+    return RangeFileResponse(path=str(file_path), filename=filename, stat_result=stat_result,
+                             headers=immutable_headers(content_hash, max_age))
 
 @app.get("/")
 async def root():
     """Redirect to Next.js frontend"""
     return RedirectResponse(url="http://localhost:3000")
 
-# Global progress tracking for segment downloads
-segment_progress = {}
 
-def _perform_segment_download(progress_id: str, url: str, request: DownloadRequest, device_type: str, base_filename: str):
-    """Worker that downloads full video then extracts segment, updating progress dict."""
+# Segment jobs currently running, keyed by (URL, format_id, output_format, device, segment)
+active_segment_jobs: Dict[Tuple, str] = {}
+
+def _release_segment_job(progress_id: str) -> None:
+    """Stop routing new identical segment requests to a finished job"""
+    for job_key, job_progress_id in list(active_segment_jobs.items()):
+        if job_progress_id == progress_id:
+            active_segment_jobs.pop(job_key, None)
+
+def _update_segment(progress_id: str, **fields) -> None:
+    """Update a segment job's progress and push it to stream subscribers"""
+    status = progress_store.update(progress_id, **fields)
+    if status is not None:
+        progress_broker.publish(progress_id, status)
+
+def _progress_status(progress_id: str) -> Optional[Dict]:
+    """Current status of a segment job or download job"""
+    # Download jobs share the same status shape
+    return progress_store.get(progress_id) or job_queue.get_status(progress_id)
+
+async def _store_call(fn: Callable, *args, **kwargs):
+    """Run a progress or job store call (SQLite or Redis) from the event loop.
+
+    Status reads and writes are small and must not be lost, so when the storage
+    pool is saturated they run on a plain thread instead of failing.
+    """
     try:
-        segment_progress[progress_id]['status'] = 'downloading'
-        segment_progress[progress_id]['message'] = 'Downloading full video...'
-        segment_progress[progress_id]['progress'] = 0
-
-        temp_video_path = STORAGE_DIR / f"{base_filename}_temp.%(ext)s"
-        final_path = STORAGE_DIR / f"{base_filename}.{request.output_format}"
-
-        # Use yt-dlp progress hook to update percentage up to 50%
-        def progress_hook(d):
-            try:
-                if d.get('status') == 'downloading':
-                    total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
-                    downloaded = d.get('downloaded_bytes') or 0
-                    if total and downloaded:
-                        pct = max(0.0, min(100.0, (downloaded / total) * 50.0))
-                        segment_progress[progress_id]['progress'] = pct
-                        segment_progress[progress_id]['message'] = 'Downloading full video...'
-                elif d.get('status') == 'finished':
-                    segment_progress[progress_id]['progress'] = 50.0
-                    segment_progress[progress_id]['message'] = 'Download complete. Extracting segment...'
-            except Exception:
-                pass
-
-        download_opts = get_download_opts(str(temp_video_path), request.format_id, device_type)
-        download_opts['progress_hooks'] = [progress_hook]
-
-        with yt_dlp.YoutubeDL(download_opts) as ydl:
-            ydl.download([url])
-
-        # Locate downloaded temp file
-        downloaded_files = list(STORAGE_DIR.glob(f"{base_filename}_temp.*"))
-        if not downloaded_files:
+        return await storage_pool.run(fn, *args, **kwargs)
+    except PoolSaturatedError:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+def _download_segment_source(progress_id: str, url: str, request: DownloadRequest, device_type: str,
+                             base_filename: str) -> Tuple[Path, bool]:
+    """Download-pool worker fetching the segment (or the full video as a fallback).
+
+    Returns the downloaded file and whether it holds only the requested range.
+    """
+    temp_video_path = storage_layout.path(f"{base_filename}_temp.%(ext)s", create=True)
+
+    # Use yt-dlp progress hook to update percentage up to 50%
+    def progress_hook(d):
+        try:
+            if d.get('status') == 'downloading':
+                total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                downloaded = d.get('downloaded_bytes') or 0
+                if total and downloaded:
+                    pct = max(0.0, min(100.0, (downloaded / total) * 50.0))
+                    _update_segment(progress_id, progress=pct, message='Downloading...',
+                                    speed=d.get('speed'), eta=d.get('eta'))
+            elif d.get('status') == 'finished':
+                _update_segment(progress_id, progress=50.0, message='Download complete. Extracting segment...',
+                                speed=None, eta=None)
+        except Exception:
+            pass
+
+    format_id = audio_format_selector(request.output_format) if is_audio_format(request.output_format) else request.format_id
+    recorder = OutputRecorder()
+    download_opts = get_download_opts(str(temp_video_path), format_id, device_type)
+    download_opts['progress_hooks'] = [progress_hook]
+    recorder.install(download_opts)
+    _merge_while_downloading(download_opts, url, format_id, device_type)
+
+    # Fetch only the requested section; fall back to the full video for sources that can't seek
+    download_started = time.perf_counter()
+    with tracer.span("yt_dlp.download", **{"url.domain": url_domain(url), "format_id": format_id}) as span:
+        ranged = (
+            download_section(url, download_opts, request.start_time or 0, request.end_time or 0)
+            and recorder.final_path is not None
+        )
+        if not ranged:
+            _update_segment(progress_id, message='Downloading full video...')
+            with yt_dlp.YoutubeDL(download_opts) as ydl:
+                ydl.download([url])
+
+        # The hooks recorded where the temp file was written
+        temp_file = recorder.final_path
+        if temp_file is None:
+            DOWNLOAD_FAILURES.labels(kind="range" if ranged else "full").inc()
             raise Exception("Failed to download video")
+        temp_size = temp_file.stat().st_size
+        span.set_attributes(**{"download.kind": "range" if ranged else "full", "download.bytes": temp_size})
+    observe_download("range" if ranged else "full", time.perf_counter() - download_started, temp_size)
+    return temp_file, ranged
 
-        temp_file = downloaded_files[0]
+async def _perform_segment_download(progress_id: str, url: str, request: DownloadRequest, device_type: str, base_filename: str):
+    """Download the segment in the download pool, then cut it on the ffmpeg runner, updating progress."""
+    try:
+        await _store_call(_update_segment, progress_id, status='downloading', message='Downloading segment...', progress=0)
+        final_path = storage_layout.path(f"{base_filename}.{request.output_format}", create=True)
+        temp_file, ranged = await download_pool.run(
+            _download_segment_source, progress_id, url, request, device_type, base_filename
+        )
 
         # Extract segment with progress (second half 50->100)
-        segment_progress[progress_id]['status'] = 'extracting'
-        segment_progress[progress_id]['message'] = 'Extracting segment...'
-        segment_progress[progress_id]['progress'] = max(50.0, segment_progress[progress_id].get('progress', 50.0))
+        downloaded = await _store_call(progress_store.get, progress_id) or {}
+        await _store_call(_update_segment, progress_id, status='extracting', message='Extracting segment...',
+                          progress=max(50.0, downloaded.get('progress', 50.0)))
 
-        # Build ffmpeg command with progress output
         seg_start = request.start_time or 0
         seg_end = request.end_time or 0
-        seg_duration = max(0.1, seg_end - seg_start)
-
-        if request.output_format == "mp3":
-            cmd = [
-                'ffmpeg', '-i', str(temp_file),
-                '-ss', str(seg_start),
-                '-t', str(seg_duration),
-                '-vn',
-                '-acodec', 'mp3',
-                '-ab', '192k',
-                '-ar', '44100',
-                '-progress', 'pipe:1',
-                '-y', str(final_path)
-            ]
-        else:
-            cmd = [
-                'ffmpeg', '-i', str(temp_file),
-                '-ss', str(seg_start),
-                '-t', str(seg_duration),
-                '-c', 'copy',
-                '-avoid_negative_ts', 'make_zero',
-                '-progress', 'pipe:1',
-                '-y', str(final_path)
-            ]
-
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        while True:
-            line = proc.stdout.readline()
-            if line == '' and proc.poll() is not None:
-                break
-            if not line:
-                continue
-            line = line.strip()
-            if 'out_time_ms=' in line:
+        if ranged:
+            # The temp file already starts at the segment start
+            seg_start, seg_end = 0, seg_end - seg_start
+
+        # Called on the ffmpeg runner's loop: each tick is written in the storage pool, and
+        # ticks arriving while the previous write is in flight are dropped (the next one is newer)
+        tick = None
+        def on_progress(fraction: float):
+            nonlocal tick
+            if tick is None or tick.done():
                 try:
-                    out_ms = int(line.split('out_time_ms=')[1])
-                    out_s = out_ms / 1000000.0
-                    frac = min(1.0, max(0.0, out_s / seg_duration))
-                    segment_progress[progress_id]['progress'] = 50.0 + (frac * 50.0)
-                except Exception:
+                    tick = storage_pool.submit(_update_segment, progress_id, progress=50.0 + (fraction * 50.0))
+                except PoolSaturatedError:
                     pass
 
-        stdout, stderr = proc.communicate()
-        success = proc.returncode == 0
+        # Cut plus encode/container conversion (and Mac metadata cleanup) in one ffmpeg pass;
+        # awaiting the runner holds no thread while ffmpeg works
+        try:
+            if is_audio_format(request.output_format):
+                await process_audio_async(temp_file, final_path, request.output_format, seg_start, seg_end, on_progress)
+            else:
+                await process_video_async(temp_file, final_path, seg_start, seg_end, device_type == "mac", on_progress)
+            success = True
+        except RuntimeError:
+            success = False
+        if tick is not None:
+            # Let the last tick land before the final status
+            await asyncio.wait([asyncio.wrap_future(tick)])
 
         # Cleanup temp
         try:
@@ -1373,18 +1536,25 @@ def _perform_segment_download(progress_id: str, url: str, request: DownloadReque
         if not success:
             raise Exception("Failed to extract segment")
 
+        # Hashing the output for its ETag reads the whole file, so keep it off the event loop
+        await storage_pool.run(file_manifest.register, final_path, progress_id)
+        await storage_pool.run(_cache_download, request, device_type, final_path)
         filesize = final_path.stat().st_size
-        segment_progress[progress_id]['status'] = 'completed'
-        segment_progress[progress_id]['progress'] = 100.0
-        segment_progress[progress_id]['message'] = 'Segment ready'
-        segment_progress[progress_id]['filename'] = final_path.name
-        segment_progress[progress_id]['download_url'] = f"/files/{final_path.name}"
-        segment_progress[progress_id]['filesize'] = filesize
+        await _store_call(
+            _update_segment, progress_id, status='completed', progress=100.0, message='Segment ready',
+            filename=final_path.name, download_url=f"/files/{final_path.name}", filesize=filesize,
+        )
 
     except Exception as e:
-        segment_progress[progress_id]['status'] = 'error'
-        segment_progress[progress_id]['error'] = str(e)
+        await _store_call(_update_segment, progress_id, status='error', error=str(e))
+    finally:
+        _release_segment_job(progress_id)
 
+async def _run_segment_job(progress_id: str, url: str, request: DownloadRequest, device_type: str, base_filename: str):
+    """Run a segment download without blocking the event loop"""
+    with tracer.span("job.segment", **{"job.id": progress_id, "device_type": device_type,
+                                       "output_format": request.output_format}):
+        await _perform_segment_download(progress_id, url, request, device_type, base_filename)
 
 @app.post("/download-segment", response_model=DownloadSegmentStartResponse)
 async def download_segment(request: DownloadRequest, background_tasks: BackgroundTasks):
@@ -1411,27 +1581,42 @@ async def download_segment(request: DownloadRequest, background_tasks: Backgroun
         logger.info(f"Downloading segment for device type: {device_type}")
         logger.info(f"Segment: {start_time}s to {end_time}s")
         
+        # Attach to an identical segment job that is already running
+        job_key = _download_key(request, device_type)
+        existing_progress_id = active_segment_jobs.get(job_key)
+        if existing_progress_id and await _store_call(progress_store.get, existing_progress_id) is not None:
+            logger.info(f"Joining in-flight segment job: {existing_progress_id}")
+            return DownloadSegmentStartResponse(progress_id=existing_progress_id)
+        
         # Generate unique filename and progress id
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        segment_suffix = f"_segment_{int(start_time)}_{int(end_time)}"
-        base_filename = f"download_{device_type}_{timestamp}{segment_suffix}"
-
-        progress_id = f"{base_filename}_{int(time.time())}"
-        segment_progress[progress_id] = {
-            'status': 'queued',
-            'progress': 0.0,
-            'message': 'Queued',
-            'filename': None,
-            'download_url': None,
-            'filesize': None,
-            'error': None,
-        }
+        base_filename = new_base_filename(device_type, start_time, end_time)
+        progress_id = base_filename
+        await _store_call(progress_store.create, progress_id)
+        
+        # Serve an identical earlier segment from the cache
+        cached_path = await storage_pool.run(_reuse_cached_download, request, device_type, progress_id)
+        if cached_path is not None:
+            await _store_call(_update_segment, progress_id, status='completed', progress=100.0,
+                              message='Segment ready', **await storage_pool.run(_file_result, cached_path))
+            return DownloadSegmentStartResponse(progress_id=progress_id)
 
-        # Kick off background worker
-        background_tasks.add_task(_perform_segment_download, progress_id, url, request, device_type, base_filename)
+        try:
+            admission.check(immediate=True)
+            if download_pool.is_saturated():
+                raise PoolSaturatedError(download_pool.name)
+        except PoolSaturatedError:
+            await _store_call(progress_store.delete, progress_id)
+            raise
+        
+        active_segment_jobs[job_key] = progress_id
+        
+        # Kick off background worker in the download pool
+        background_tasks.add_task(_run_segment_job, progress_id, url, request, device_type, base_filename)
 
         return DownloadSegmentStartResponse(progress_id=progress_id)
         
+    except PoolSaturatedError as e:
+        raise pool_saturated_error(e)
     except Exception as e:
         logger.error(f"Segment download error: {e}")
         raise HTTPException(status_code=500, detail=f"Segment download failed: {str(e)}")
@@ -1439,15 +1624,121 @@ async def download_segment(request: DownloadRequest, background_tasks: Backgroun
 @app.get("/segment-progress/{progress_id}")
 async def get_segment_progress(progress_id: str):
     """Get progress of a segment download"""
-    if progress_id not in segment_progress:
+    status = await _store_call(_progress_status, progress_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="Progress not found")
+    return url_signer.sign_status(status)
+
+@app.get("/progress/{progress_id}/events")
+async def stream_progress_events(progress_id: str):
+    """Server-Sent Events stream of a segment or download job's progress, ending when it finishes"""
+    if await _store_call(_progress_status, progress_id) is None:
+        raise HTTPException(status_code=404, detail="Progress not found")
+    
+    async def events():
+        async for progress in progress_broker.subscribe(progress_id, lambda: _store_call(_progress_status, progress_id),
+                                                     progress_store.shared):
+            if progress is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: progress\ndata: {json.dumps(url_signer.sign_status(progress))}\n\n"
     
-    return segment_progress[progress_id]
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.websocket("/ws/progress/{progress_id}")
+async def websocket_progress(websocket: WebSocket, progress_id: str):
+    """WebSocket variant of /progress/{progress_id}/events"""
+    await websocket.accept()
+    if await _store_call(_progress_status, progress_id) is None:
+        await websocket.close(code=4404, reason="Progress not found")
+        return
+    try:
+        async for progress in progress_broker.subscribe(progress_id, lambda: _store_call(_progress_status, progress_id),
+                                                     progress_store.shared):
+            if progress is not None:
+                await websocket.send_json(url_signer.sign_status(progress))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+# Gauges read when /metrics is scraped
+storage_usage = DirectoryUsage(STORAGE_DIR)
+JOBS_QUEUED.set_function(lambda: job_queue.stats()["queued"])
+JOBS_RUNNING.set_function(lambda: job_queue.stats()["running"])
+POOL_QUEUED.set_function(lambda: {(name,): pool["queued"] for name, pool in get_pool_stats().items()})
+POOL_ACTIVE.set_function(lambda: {(name,): pool["active"] for name, pool in get_pool_stats().items()})
+ACTIVE_STREAMS.set_function(active_streams)
+STORAGE_DIR_BYTES.set_function(lambda: storage_usage.usage()[0])
+STORAGE_DIR_FILES.set_function(lambda: storage_usage.usage()[1])
+STORAGE_FREE_BYTES.set_function(storage_usage.free_bytes)
+READY.set_function(lambda: 1 if admission.is_ready() else 0)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    # Rendering may rescan STORAGE_DIR, so keep it off the event loop
+    body = await asyncio.to_thread(render_metrics)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Last storage-backed stats for /health, and when they were taken (monotonic)
+_storage_stats: Dict = {}
+_storage_stats_at = 0.0
+
+def _collect_storage_stats() -> Dict:
+    """Stats that query SQLite, Redis or the filesystem"""
+    return {
+        "download_cache": download_cache.stats(),
+        "progress_store": progress_store.stats(),
+        "storage": storage_cleaner.stats(),
+    }
+
+async def _cached_storage_stats() -> Dict:
+    """Storage stats at most HEALTH_STATS_TTL old, gathered in the storage pool.
+
+    When the pool is saturated the last snapshot is served, so /health never
+    waits behind disk work.
+    """
+    global _storage_stats, _storage_stats_at
+    if time.monotonic() - _storage_stats_at >= HEALTH_STATS_TTL:
+        try:
+            _storage_stats = await storage_pool.run(_collect_storage_stats)
+            _storage_stats_at = time.monotonic()
+        except PoolSaturatedError:
+            logger.warning("Storage pool saturated, serving the previous storage stats")
+    return _storage_stats
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "executors": get_pool_stats(),
+        "jobs": job_queue.stats(),
+        "progress_streams": progress_broker.stats(),
+        "tracing": tracer.stats(),
+        "admission": admission.stats(),
+        "signed_urls": url_signer.stats(),
+        **await _cached_storage_stats(),
+    }
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe for load balancers: 503 while admission control is shedding load"""
+    admission_stats = admission.stats()
+    body = {
+        "ready": admission_stats["ready"],
+        "state": admission_stats["state"],
+        "reasons": admission_stats["reasons"],
+    }
+    if not admission_stats["ready"]:
+        return JSONResponse(body, status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+    return body
 
 if __name__ == "__main__":
     import uvicorn
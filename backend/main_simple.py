@@ -12,19 +12,21 @@ import yt_dlp
 import subprocess
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, status, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, HttpUrl, EmailStr
 from dotenv import load_dotenv
 import aiofiles
 import logging
 import io
-from storage_manager_simple import storage_manager
 
-# Load environment variables
+# Load environment variables before the local modules read their configuration
 load_dotenv()
 
+from storage_manager_simple import storage_manager
+from file_serving import RangeFileResponse
+from storage_layout import StorageLayout
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -48,6 +50,7 @@ security = HTTPBearer()
 # Storage directory
 STORAGE_DIR = Path("downloads")
 STORAGE_DIR.mkdir(exist_ok=True)
+storage_layout = StorageLayout(STORAGE_DIR)
 
 # User management (simplified)
 def load_users() -> Dict:
@@ -292,8 +295,8 @@ async def download_video(request: DownloadRequest):
         
         if output_format == "mp3":
             # Audio download
-            final_path = STORAGE_DIR / f"{base_filename}.mp3"
-            temp_audio_path = STORAGE_DIR / f"{base_filename}_temp.%(ext)s"
+            final_path = storage_layout.path(f"{base_filename}.mp3", create=True)
+            temp_audio_path = storage_layout.path(f"{base_filename}_temp.%(ext)s", create=True)
             
             audio_opts = get_download_opts(str(temp_audio_path), "bestaudio", device_type)
             audio_opts.update({
@@ -316,8 +319,8 @@ async def download_video(request: DownloadRequest):
             
         else:
             # Video download
-            final_path = STORAGE_DIR / f"{base_filename}.{output_format}"
-            temp_path = STORAGE_DIR / f"{base_filename}_temp.%(ext)s"
+            final_path = storage_layout.path(f"{base_filename}.{output_format}", create=True)
+            temp_path = storage_layout.path(f"{base_filename}_temp.%(ext)s", create=True)
             
             download_opts = get_download_opts(str(temp_path), format_id, device_type)
             download_opts['outtmpl'] = str(final_path)
@@ -346,22 +349,25 @@ async def download_video(request: DownloadRequest):
             error=str(e)
         )
 
-@app.get("/downloads/{filename}")
+@app.api_route("/downloads/{filename}", methods=["GET", "HEAD"])
 async def serve_download(filename: str):
-    """Serve downloaded files"""
-    file_path = STORAGE_DIR / filename
+    """Serve downloaded files, with byte ranges so players can seek and clients can resume"""
+    file_path = storage_layout.locate(filename)
     
-    if not file_path.exists():
+    if file_path is None:
         raise HTTPException(status_code=404, detail="File not found")
     
-    return FileResponse(
-        path=str(file_path),
-        filename=filename,
-        media_type='application/octet-stream'
-    )
+    return RangeFileResponse(path=str(file_path), filename=filename)
 
-# Mount static files
-app.mount("/downloads", StaticFiles(directory=str(STORAGE_DIR)), name="downloads")
+@app.api_route("/downloads/{user_id}/{filename}", methods=["GET", "HEAD"])
+async def serve_user_file(user_id: str, filename: str):
+    """Serve files saved by the local storage provider (their directories are sharded by user id)"""
+    file_path = storage_manager.get_local_path(filename, user_id)
+    
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    return RangeFileResponse(path=str(file_path), filename=filename)
 
 if __name__ == "__main__":
     import uvicorn
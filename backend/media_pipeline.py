@@ -0,0 +1,112 @@
+import os
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ffmpeg_runner import ffmpeg_runner, fraction_progress
+from smart_cut import SMART_CUT_CRF, SMART_CUT_PRESET, cut_segment_async
+from metrics import timed_ffmpeg
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# Codecs QuickTime, iOS and Android play natively from MP4/MOV; anything else is transcoded
+MP4_VIDEO_CODECS = {"h264", "hevc", "mpeg4"}
+MP4_AUDIO_CODECS = {"aac", "mp3", "alac", "ac3", "eac3"}
+
+def device_container(device_type: str) -> str:
+    """Output container for a device profile: MOV for QuickTime on Mac, MP4 elsewhere"""
+    return "mov" if device_type == "mac" else "mp4"
+
+@traced("ffprobe.codecs")
+async def probe_codecs(input_path: str) -> Dict[str, str]:
+    """Codec of the first video and first audio stream, keyed by 'video' / 'audio'"""
+    result = await ffmpeg_runner.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_name,codec_type',
+         '-of', 'csv=p=0', input_path],
+    )
+    codecs: Dict[str, str] = {}
+    for line in result.stdout.splitlines():
+        codec_name, _, codec_type = line.partition(",")
+        if codec_type in ("video", "audio") and codec_type not in codecs:
+            codecs[codec_type] = codec_name
+    return codecs
+
+def codec_args(codecs: Dict[str, str]) -> List[str]:
+    """Stream-copy each stream the MP4/MOV target supports and transcode the rest"""
+    args = ['-c', 'copy']
+    if codecs.get("video") and codecs["video"] not in MP4_VIDEO_CODECS:
+        args += ['-c:v', 'libx264', '-crf', SMART_CUT_CRF, '-preset', SMART_CUT_PRESET, '-pix_fmt', 'yuv420p']
+    if codecs.get("audio") and codecs["audio"] not in MP4_AUDIO_CODECS:
+        args += ['-c:a', 'aac', '-b:a', '192k']
+    return args
+
+def build_command(input_path: str, output_path: str, start_time: Optional[float] = None,
+                  end_time: Optional[float] = None, strip_metadata: bool = False,
+                  codecs: Optional[Dict[str, str]] = None) -> List[str]:
+    """One ffmpeg invocation that cuts, converts the container, strips metadata and adds faststart"""
+    cmd = ['ffmpeg', '-v', 'error']
+    if start_time is not None:
+        cmd += ['-ss', str(start_time)]
+    cmd += ['-i', input_path]
+    if end_time is not None:
+        cmd += ['-t', str(end_time - (start_time or 0))]
+    cmd += ['-map', '0:v:0?', '-map', '0:a:0?']
+    cmd += codec_args(codecs or {})
+    if start_time is not None:
+        cmd += ['-avoid_negative_ts', 'make_zero']
+    if strip_metadata:
+        cmd += ['-map_metadata', '-1']
+    if Path(output_path).suffix.lower() in (".mp4", ".mov", ".m4v"):
+        cmd += ['-movflags', '+faststart']
+    return cmd + ['-y', output_path]
+
+@traced("ffmpeg.process_video")
+@timed_ffmpeg("process_video")
+async def process_video_async(input_path: Path, output_path: Path, start_time: Optional[float] = None,
+                  end_time: Optional[float] = None, strip_metadata: bool = False,
+                  progress_callback: Optional[Callable[[float], None]] = None) -> Path:
+    """Turn a downloaded file into the final output with at most one ffmpeg pass.
+
+    Container conversion, metadata stripping, faststart and segment cutting are
+    combined into a single invocation (smart_cut's final mux for segments). When
+    nothing is needed the source is just renamed. The source file is removed and
+    the path of the finished file is returned.
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    is_segment = start_time is not None and end_time is not None
+    codecs = await probe_codecs(str(input_path))
+    transcode = codec_args(codecs) != ['-c', 'copy']
+
+    if not is_segment and not strip_metadata and not transcode and input_path.suffix == output_path.suffix:
+        os.replace(input_path, output_path)
+        return output_path
+
+    if is_segment and not transcode:
+        output_args = ['-map_metadata', '-1'] if strip_metadata else []
+        ok = await cut_segment_async(str(input_path), str(output_path), start_time, end_time, "mp4",
+                                     progress_callback, output_args)
+    else:
+        cmd = build_command(str(input_path), str(output_path), start_time, end_time, strip_metadata, codecs)
+        logger.info(f"Post-processing {input_path.name} -> {output_path.name} in one pass")
+        duration = end_time - start_time if is_segment else None
+        result = await ffmpeg_runner.run(cmd, duration, fraction_progress(progress_callback if is_segment else None))
+        ok = result.ok
+        if not ok:
+            logger.error(f"ffmpeg post-processing failed: {result.stderr.strip()[-500:]}")
+
+    if not ok:
+        output_path.unlink(missing_ok=True)
+        raise RuntimeError(f"Post-processing failed for {input_path.name}")
+    input_path.unlink(missing_ok=True)
+    if progress_callback:
+        progress_callback(1.0)
+    return output_path
+
+def process_video(input_path: Path, output_path: Path, start_time: Optional[float] = None,
+                  end_time: Optional[float] = None, strip_metadata: bool = False,
+                  progress_callback: Optional[Callable[[float], None]] = None) -> Path:
+    """Blocking process_video_async for worker threads"""
+    return ffmpeg_runner.call(
+        process_video_async(input_path, output_path, start_time, end_time, strip_metadata, progress_callback)
+    )
@@ -0,0 +1,181 @@
+import os
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import anyio
+import aiofiles
+
+from audio_pipeline import AUDIO_FORMATS
+from executors import PoolSaturatedError
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+STREAM_MAX_CONCURRENT = int(os.getenv("STREAM_MAX_CONCURRENT", "8"))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Source codecs (as reported by yt-dlp) that can be stream-copied into fragmented MP4
+FMP4_VIDEO_PREFIXES = ("avc1", "avc3", "h264", "hev1", "hvc1", "hevc")
+FMP4_AUDIO_PREFIXES = ("mp4a", "aac", "mp3")
+
+# Audio outputs: source codec prefixes that are copied, encoder arguments, streamable container
+AUDIO_STREAM_FORMATS = {
+    "mp3": (("mp3",), AUDIO_FORMATS["mp3"]["encode"], ['-f', 'mp3']),
+    "m4a": (("mp4a", "aac"), AUDIO_FORMATS["m4a"]["encode"],
+            ['-movflags', 'empty_moov+default_base_moof', '-frag_duration', '1000000', '-f', 'ipod']),
+    "opus": (("opus",), AUDIO_FORMATS["opus"]["encode"], ['-f', 'opus']),
+}
+
+MEDIA_TYPES = {
+    "mp4": "video/mp4",
+    "mp3": "audio/mpeg",
+    "m4a": "audio/mp4",
+    "opus": "audio/ogg",
+}
+
+_active_streams = 0
+_slots_lock = threading.RLock()
+
+def _header_args(headers: Optional[Dict[str, str]]) -> List[str]:
+    if not headers:
+        return []
+    return ['-headers', "".join(f"{key}: {value}\r\n" for key, value in headers.items())]
+
+def stream_inputs(info: Dict) -> List[Dict]:
+    """The direct media URLs yt-dlp selected: one muxed format or separate video and audio"""
+    formats = info.get('requested_formats') or [info]
+    return [f for f in formats if f.get('url')]
+
+def build_stream_command(inputs: List[Dict], output_format: str,
+                         start_time: Optional[float] = None, end_time: Optional[float] = None) -> List[str]:
+    """ffmpeg command that writes a progressively playable container to stdout.
+
+    MP4 output is fragmented (empty moov, a fragment per keyframe) so it can be
+    written without seeking back; compatible streams are copied, others transcoded.
+    Audio formats copy a matching native track and otherwise encode it.
+    Segments use input seeking.
+    """
+    cmd = ['ffmpeg', '-v', 'error', '-nostdin']
+    for source in inputs:
+        if start_time is not None:
+            cmd += ['-ss', str(start_time)]
+        cmd += _header_args(source.get('http_headers'))
+        cmd += ['-i', source['url']]
+    if start_time is not None and end_time is not None:
+        cmd += ['-t', str(end_time - start_time)]
+
+    video_index = next((i for i, f in enumerate(inputs) if f.get('vcodec') not in (None, 'none')), 0)
+    audio_index = next((i for i, f in enumerate(inputs) if f.get('acodec') not in (None, 'none')), video_index)
+
+    if output_format in AUDIO_STREAM_FORMATS:
+        acodec = (inputs[audio_index].get('acodec') or '').lower()
+        copy_prefixes, encode_args, container_args = AUDIO_STREAM_FORMATS[output_format]
+        codec_args = ['-c:a', 'copy'] if acodec.startswith(copy_prefixes) else encode_args
+        return cmd + ['-map', f'{audio_index}:a:0', '-vn', *codec_args, *container_args, 'pipe:1']
+
+    vcodec = (inputs[video_index].get('vcodec') or '').lower()
+    acodec = (inputs[audio_index].get('acodec') or '').lower()
+    cmd += ['-map', f'{video_index}:v:0?', '-map', f'{audio_index}:a:0?']
+    # Unknown codecs (e.g. direct links) are copied; fragmented MP4 accepts most of them
+    if not vcodec or vcodec.startswith(FMP4_VIDEO_PREFIXES):
+        cmd += ['-c:v', 'copy']
+    else:
+        cmd += ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20', '-pix_fmt', 'yuv420p']
+    if not acodec or acodec.startswith(FMP4_AUDIO_PREFIXES):
+        cmd += ['-c:a', 'copy']
+    else:
+        cmd += ['-c:a', 'aac', '-b:a', '192k']
+    return cmd + [
+        '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+        '-f', 'mp4', 'pipe:1',
+    ]
+
+class StreamSlot:
+    """One of the STREAM_MAX_CONCURRENT stream slots, held from the capacity check until the stream ends"""
+
+    def __init__(self):
+        self._released = False
+
+    def release(self) -> None:
+        """Give the slot back (only the first call counts)"""
+        global _active_streams
+        with _slots_lock:
+            if not self._released:
+                self._released = True
+                _active_streams -= 1
+
+    # A response dropped before its body is iterated never runs stream_ffmpeg's cleanup
+    __del__ = release
+
+def check_stream_capacity() -> StreamSlot:
+    """Reserve a stream slot, raising PoolSaturatedError when all STREAM_MAX_CONCURRENT are taken.
+
+    The slot is taken before the (slow) format resolution, so a burst of
+    requests cannot all pass the check. Pass it to stream_ffmpeg, or release it
+    if setup fails before the stream starts.
+    """
+    global _active_streams
+    with _slots_lock:
+        if _active_streams >= STREAM_MAX_CONCURRENT:
+            raise PoolSaturatedError("stream")
+        _active_streams += 1
+        return StreamSlot()
+
+def active_streams() -> int:
+    return _active_streams
+
+async def stream_ffmpeg(cmd: List[str], slot: StreamSlot, save_path: Optional[Path] = None,
+                        on_saved: Optional[Callable[[Path], Awaitable]] = None) -> AsyncIterator[bytes]:
+    """Yield ffmpeg's stdout as it is produced, optionally teeing it to save_path.
+
+    The saved copy is kept only if ffmpeg finishes successfully, and on_saved is
+    then called with its path. If the client disconnects, ffmpeg is killed and
+    the partial copy removed. slot is released when the stream ends.
+    """
+    process = None
+    stderr_task = None
+    save_file = None
+    completed = False
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        # Read stderr alongside stdout so a chatty ffmpeg never blocks on a full pipe
+        stderr_task = asyncio.ensure_future(process.stderr.read())
+        if save_path is not None:
+            save_file = await aiofiles.open(save_path, 'wb')
+        while True:
+            chunk = await process.stdout.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            if save_file is not None:
+                await save_file.write(chunk)
+            yield chunk
+        stderr = await stderr_task
+        returncode = await process.wait()
+        if returncode == 0:
+            completed = True
+        else:
+            logger.error(f"Stream ffmpeg failed ({returncode}): {stderr.decode(errors='replace').strip()[-500:]}")
+    finally:
+        # Starlette cancels the response task when the client disconnects; shield
+        # the cleanup so the awaits below are not cancelled with it
+        with anyio.CancelScope(shield=True):
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+            if stderr_task is not None and not stderr_task.done():
+                stderr_task.cancel()
+            if save_file is not None:
+                await save_file.close()
+                if completed and on_saved is not None:
+                    try:
+                        await on_saved(save_path)
+                    except Exception as e:
+                        logger.warning(f"Could not register streamed copy {save_path.name}: {e}")
+                elif not completed:
+                    Path(save_path).unlink(missing_ok=True)
+            slot.release()
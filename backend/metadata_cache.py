@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Configuration
+METADATA_CACHE_TTL_SECONDS = int(os.getenv("METADATA_CACHE_TTL_SECONDS", "1800"))
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "1000"))
+METADATA_CACHE_MAX_MB = int(os.getenv("METADATA_CACHE_MAX_MB", "64"))
+
+# Query parameters that never change which video a URL points at
+TRACKING_PARAMS = {
+    "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content",
+    "fbclid", "gclid", "si", "feature", "pp", "igshid", "ref", "ref_src",
+}
+
+def normalize_url(url: str) -> str:
+    """Normalize a video URL so equivalent links share one cache entry"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "https"
+    if scheme == "http":
+        scheme = "https"
+    netloc = parts.netloc.lower()
+    for prefix in ("www.", "m.", "mobile."):
+        if netloc.startswith(prefix):
+            netloc = netloc[len(prefix):]
+            break
+    path = parts.path.rstrip("/") or "/"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, netloc, path, urlencode(query), ""))
+
+def estimate_size(info: Dict) -> int:
+    """Approximate memory footprint of an info dict in bytes"""
+    try:
+        return len(json.dumps(info, default=str))
+    except Exception:
+        return 0
+
+class MetadataCache:
+    """Thread-safe TTL + LRU cache for yt-dlp extraction results"""
+
+    def __init__(self, ttl_seconds: int = METADATA_CACHE_TTL_SECONDS,
+                 max_entries: int = METADATA_CACHE_MAX_ENTRIES,
+                 max_bytes: int = METADATA_CACHE_MAX_MB * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Return cached info for a URL, or None if missing or expired"""
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, info = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return info
+
+    def put(self, url: str, info: Dict) -> None:
+        """Store info for a URL, evicting least recently used entries as needed"""
+        if not info or self.ttl_seconds <= 0:
+            return
+        key = normalize_url(url)
+        size = estimate_size(info)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl_seconds, size, info)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def invalidate(self, url: str) -> None:
+        """Drop the cached entry for a URL"""
+        key = normalize_url(url)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        """Get cache statistics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _remove(self, key: str) -> None:
+        """Remove an entry; caller must hold the lock"""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+# Global metadata cache instance
+metadata_cache = MetadataCache()
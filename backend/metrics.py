@@ -0,0 +1,332 @@
+import os
+import time
+import math
+import shutil
+import inspect
+import functools
+import threading
+from urllib.parse import urlparse
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Configuration
+METRICS_DISK_SCAN_INTERVAL = float(os.getenv("METRICS_DISK_SCAN_INTERVAL", "60"))
+
+# Bucket upper bounds (seconds) for stage latencies, from a fast ffprobe to a long full download
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# Bucket upper bounds (bytes/s) for download throughput, 64 KB/s to 1 GB/s
+THROUGHPUT_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(8))
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Metric:
+    """A named metric family with optional labels, rendered in Prometheus text format"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def labels(self, **labels):
+        """The child metric for one combination of label values"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _default(self):
+        """Child for a metric declared without labels"""
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[Tuple[str, Tuple[str, ...], str, float]]:
+        """(suffix, label values, extra label, value) for every sample"""
+        with self._lock:
+            children = list(self._children.items())
+        samples = []
+        for key, child in children:
+            samples.extend((suffix, key, extra, value) for suffix, extra, value in child.samples())
+        return samples
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [("_total", "", self.value)]
+
+class Counter(_Metric):
+    """Monotonically increasing count (exported with a _total suffix)"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self):
+        return [("", "", self.value)]
+
+class Gauge(_Metric):
+    """Value that goes up and down, either set directly or read at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable] = None
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], Union[float, Dict[Tuple[str, ...], float]]]) -> None:
+        """Read the value at scrape time; labelled gauges return {label values: value}"""
+        self._function = function
+
+    def _samples(self):
+        if self._function is None:
+            return super()._samples()
+        result = self._function()
+        if not self.labelnames:
+            return [("", (), "", result)]
+        return [("", tuple(str(v) for v in key), "", value) for key, value in result.items()]
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the wall time of a block (also when it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self):
+        with self._lock:
+            samples, cumulative = [], 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                samples.append(("_bucket", f'le="{_format_value(bound)}"', cumulative))
+            samples.append(("_bucket", 'le="+Inf"', self.count))
+            samples.append(("_sum", "", self.sum))
+            samples.append(("_count", "", self.count))
+            return samples
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+REGISTRY: List[_Metric] = []
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format (0.0.4)"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+# Pipeline stage metrics
+EXTRACT_SECONDS = Histogram(
+    "infinityhole_extract_seconds", "yt-dlp metadata extraction time", ["domain"])
+EXTRACT_FAILURES = Counter(
+    "infinityhole_extract_failures", "yt-dlp metadata extractions that failed", ["domain"])
+DOWNLOAD_SECONDS = Histogram(
+    "infinityhole_download_seconds", "yt-dlp download time", ["kind"])
+DOWNLOAD_THROUGHPUT = Histogram(
+    "infinityhole_download_bytes_per_second", "yt-dlp download throughput", ["kind"], THROUGHPUT_BUCKETS)
+DOWNLOAD_BYTES = Counter(
+    "infinityhole_download_bytes", "Bytes downloaded by yt-dlp", ["kind"])
+DOWNLOAD_FAILURES = Counter(
+    "infinityhole_download_failures", "yt-dlp downloads that failed", ["kind"])
+FFMPEG_SECONDS = Histogram(
+    "infinityhole_ffmpeg_seconds", "Wall time of each ffmpeg operation", ["operation"])
+FFMPEG_FAILURES = Counter(
+    "infinityhole_ffmpeg_failures", "ffmpeg operations that failed", ["operation"])
+STORAGE_UPLOAD_SECONDS = Histogram(
+    "infinityhole_storage_upload_seconds", "Cloud storage upload latency", ["provider"])
+STORAGE_UPLOAD_FAILURES = Counter(
+    "infinityhole_storage_upload_failures", "Cloud storage uploads that failed", ["provider"])
+ADMISSION_REJECTIONS = Counter(
+    "infinityhole_admission_rejections", "Requests refused by admission control", ["state"])
+FILES_REMOVED = Counter(
+    "infinityhole_files_removed", "Output files deleted from STORAGE_DIR", ["reason"])
+
+# Service state, read at scrape time (wired up by main.py)
+JOBS_QUEUED = Gauge("infinityhole_jobs_queued", "Download jobs waiting for a worker")
+JOBS_RUNNING = Gauge("infinityhole_jobs_running", "Download jobs being processed")
+POOL_QUEUED = Gauge("infinityhole_pool_queued", "Tasks waiting in each worker pool", ["pool"])
+POOL_ACTIVE = Gauge("infinityhole_pool_active", "Tasks running in each worker pool", ["pool"])
+ACTIVE_STREAMS = Gauge("infinityhole_active_streams", "Downloads being streamed to clients")
+STORAGE_DIR_BYTES = Gauge("infinityhole_storage_dir_bytes", "Bytes used by files in STORAGE_DIR")
+STORAGE_DIR_FILES = Gauge("infinityhole_storage_dir_files", "Files in STORAGE_DIR")
+STORAGE_FREE_BYTES = Gauge("infinityhole_storage_free_bytes", "Free bytes on the STORAGE_DIR filesystem")
+READY = Gauge("infinityhole_ready", "1 while admission control accepts new work, 0 while shedding load")
+
+class DirectoryUsage:
+    """Size and file count of a directory, rescanned at most every interval seconds.
+
+    Scrapes come every few seconds, and walking a large STORAGE_DIR each time
+    would cost more than the scrape is worth.
+    """
+
+    def __init__(self, path, interval: float = METRICS_DISK_SCAN_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._scanned_at = 0.0
+        self._usage = (0, 0)
+
+    def _scan(self) -> Tuple[int, int]:
+        total = files = 0
+        stack = [str(self.path)]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False):
+                                total += entry.stat(follow_symlinks=False).st_size
+                                files += 1
+                        except OSError:
+                            # Removed by cleanup mid-scan
+                            continue
+            except OSError:
+                continue
+        return total, files
+
+    def usage(self) -> Tuple[int, int]:
+        """(bytes, files), from the last scan if it is recent enough"""
+        with self._lock:
+            if time.monotonic() - self._scanned_at >= self.interval:
+                self._usage = self._scan()
+                self._scanned_at = time.monotonic()
+            return self._usage
+
+    def free_bytes(self) -> int:
+        try:
+            return shutil.disk_usage(self.path).free
+        except OSError:
+            return 0
+
+def url_domain(url: str) -> str:
+    """Host of a URL without port or www., used as the per-extractor label"""
+    host = (urlparse(url).hostname or "unknown").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def observe_download(kind: str, seconds: float, size: int) -> None:
+    """Record a finished yt-dlp download (kind is "full" or "range")"""
+    DOWNLOAD_SECONDS.labels(kind=kind).observe(seconds)
+    DOWNLOAD_BYTES.labels(kind=kind).inc(size)
+    if seconds > 0:
+        DOWNLOAD_THROUGHPUT.labels(kind=kind).observe(size / seconds)
+
+@contextmanager
+def track(histogram: Histogram, failures: Counter, **labels) -> Iterator[None]:
+    """Time a stage into histogram and count it in failures if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        failures.labels(**labels).inc()
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+def timed_ffmpeg(operation: str) -> Callable:
+    """Decorator recording an ffmpeg operation's time; a False or raising result counts as a failure"""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track(FFMPEG_SECONDS, FFMPEG_FAILURES, operation=operation):
+                    result = await func(*args, **kwargs)
+                if result is False:
+                    FFMPEG_FAILURES.labels(operation=operation).inc()
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(FFMPEG_SECONDS, FFMPEG_FAILURES, operation=operation):
+                result = func(*args, **kwargs)
+            if result is False:
+                FFMPEG_FAILURES.labels(operation=operation).inc()
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,130 @@
+import os
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+PROGRESS_STREAM_INTERVAL = float(os.getenv("PROGRESS_STREAM_INTERVAL", "0.5"))
+PROGRESS_STREAM_HEARTBEAT = float(os.getenv("PROGRESS_STREAM_HEARTBEAT", "15"))
+
+TERMINAL_STATUSES = ("completed", "error")
+
+class _Subscription:
+    """One listener: an event on its own loop, set at most once per wake-up"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.finished = asyncio.Event()
+        self.pending = False
+
+    def notify(self, terminal: bool) -> None:
+        # Caller holds the broker lock
+        if not self.pending:
+            self.pending = True
+            self.loop.call_soon_threadsafe(self.event.set)
+        if terminal:
+            self.loop.call_soon_threadsafe(self.finished.set)
+
+class ProgressBroker:
+    """Fans job progress out to SSE / WebSocket subscribers.
+
+    Workers publish from their own threads as yt-dlp and ffmpeg hooks fire. Only
+    the latest status per job is kept, and each subscriber is woken at most once
+    per interval, so a burst of hook calls becomes a single event; the final
+    status is delivered immediately. Jobs nobody is watching cost one
+    dictionary lookup per publish.
+    """
+
+    def __init__(self, interval: float = PROGRESS_STREAM_INTERVAL,
+                 heartbeat: float = PROGRESS_STREAM_HEARTBEAT):
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._latest: Dict[str, Dict] = {}
+        self._subscribers: Dict[str, List[_Subscription]] = {}
+
+    def publish(self, progress_id: str, status: Dict) -> None:
+        """Record a job's new status and wake its subscribers"""
+        with self._lock:
+            subscribers = self._subscribers.get(progress_id)
+            if not subscribers:
+                return
+            self._latest[progress_id] = dict(status)
+            terminal = status.get('status') in TERMINAL_STATUSES
+            for subscription in subscribers:
+                subscription.notify(terminal)
+
+    async def subscribe(self, progress_id: str, get_status: Callable[[], Awaitable[Optional[Dict]]],
+                        poll: bool = False) -> AsyncIterator[Optional[Dict]]:
+        """Yield a job's status on every (coalesced) change until it finishes.
+
+        get_status is a coroutine function reading the current status from its
+        source of truth; it seeds the stream and is re-read on every wake-up
+        timeout. With poll=True (the job may be running in another worker
+        process) that happens every interval rather than only on heartbeats.
+        None is yielded as a keep-alive when nothing changed for a heartbeat.
+        """
+        subscription = _Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(progress_id, []).append(subscription)
+        wait_timeout = self.interval if poll else self.heartbeat
+        try:
+            # Read after registering so no update between the two is lost
+            status = await get_status()
+            last_sent = None
+            idle = 0.0
+            while status is not None:
+                if status != last_sent:
+                    yield status
+                    last_sent = status
+                    idle = 0.0
+                    if status.get('status') in TERMINAL_STATUSES:
+                        return
+                    # Rate limit, but deliver the final status without waiting out the interval
+                    try:
+                        await asyncio.wait_for(subscription.finished.wait(), self.interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    if poll:
+                        status = await get_status()
+                        if status != last_sent:
+                            continue
+                try:
+                    await asyncio.wait_for(subscription.event.wait(), wait_timeout)
+                except asyncio.TimeoutError:
+                    status = await get_status()
+                    if status == last_sent:
+                        idle += wait_timeout
+                        if idle >= self.heartbeat:
+                            idle = 0.0
+                            yield None
+                    continue
+                subscription.event.clear()
+                with self._lock:
+                    subscription.pending = False
+                    status = self._latest.get(progress_id)
+                if status is None:
+                    status = await get_status()
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(progress_id, [])
+                if subscription in subscribers:
+                    subscribers.remove(subscription)
+                if not subscribers:
+                    self._subscribers.pop(progress_id, None)
+                    self._latest.pop(progress_id, None)
+
+    def stats(self) -> Dict:
+        """Jobs being watched and open subscriptions"""
+        with self._lock:
+            return {
+                "watched_jobs": len(self._subscribers),
+                "subscribers": sum(len(subs) for subs in self._subscribers.values()),
+            }
+
+# Global progress broker instance
+progress_broker = ProgressBroker()
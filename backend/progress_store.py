@@ -0,0 +1,399 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+PROGRESS_STORE_BACKEND = os.getenv("PROGRESS_STORE_BACKEND", "memory")
+PROGRESS_STORE_PATH = Path(os.getenv("PROGRESS_STORE_PATH", "./progress.db"))
+PROGRESS_STORE_URL = os.getenv("PROGRESS_STORE_URL", "redis://localhost:6379/0")
+PROGRESS_TTL_SECONDS = int(os.getenv("PROGRESS_TTL_SECONDS", "3600"))
+PROGRESS_MAX_ENTRIES = int(os.getenv("PROGRESS_MAX_ENTRIES", "10000"))
+
+# Longer error strings (e.g. yt-dlp tracebacks) are cut to this many characters
+MAX_ERROR_LENGTH = 300
+
+TERMINAL_STATUSES = ("completed", "error")
+
+# The SQLite store checks its entry cap on every this many creates (and on each purge)
+CAP_CHECK_INTERVAL = 100
+
+class ProgressRecord:
+    """Fixed-field progress of one segment job (same shape as /segment-progress)"""
+
+    __slots__ = ('status', 'progress', 'message', 'speed', 'eta',
+                 'filename', 'download_url', 'filesize', 'error', 'updated_at', 'finished_at')
+
+    FIELDS = ('status', 'progress', 'message', 'speed', 'eta', 'filename', 'download_url', 'filesize', 'error')
+
+    def __init__(self, status: str = 'queued', progress: float = 0.0, message: Optional[str] = 'Queued',
+                 speed: Optional[float] = None, eta: Optional[float] = None, filename: Optional[str] = None,
+                 download_url: Optional[str] = None, filesize: Optional[int] = None, error: Optional[str] = None,
+                 updated_at: Optional[float] = None, finished_at: Optional[float] = None):
+        self.status = status
+        self.progress = progress
+        self.message = message
+        self.speed = speed
+        self.eta = eta
+        self.filename = filename
+        self.download_url = download_url
+        self.filesize = filesize
+        self.error = error
+        self.updated_at = updated_at or time.time()
+        self.finished_at = finished_at
+
+    def apply(self, fields: Dict) -> None:
+        """Set known fields (unknown keys are ignored), trimming errors and stamping completion"""
+        for key, value in fields.items():
+            if key in self.FIELDS:
+                if key == 'error' and value is not None:
+                    value = str(value)[:MAX_ERROR_LENGTH]
+                setattr(self, key, value)
+        self.updated_at = time.time()
+        if self.status in TERMINAL_STATUSES and self.finished_at is None:
+            self.finished_at = self.updated_at
+
+    def to_dict(self) -> Dict:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+class ProgressStore(ABC):
+    """Abstract base class for segment progress backends.
+
+    Finished records expire after ttl_seconds and at most max_entries are
+    kept; beyond that the oldest finished records go first, then the oldest
+    running ones.
+    """
+
+    # Whether other processes can update records (readers should poll rather than wait)
+    shared = False
+
+    def __init__(self, ttl_seconds: int = PROGRESS_TTL_SECONDS, max_entries: int = PROGRESS_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    @abstractmethod
+    def create(self, progress_id: str) -> None:
+        """Add a queued record"""
+        pass
+
+    @abstractmethod
+    def update(self, progress_id: str, **fields) -> Optional[Dict]:
+        """Update a record and return its new state, or None if it does not exist"""
+        pass
+
+    @abstractmethod
+    def get(self, progress_id: str) -> Optional[Dict]:
+        """Current state of a record, or None"""
+        pass
+
+    @abstractmethod
+    def delete(self, progress_id: str) -> None:
+        """Remove a record"""
+        pass
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Drop finished records older than the TTL and return how many were removed"""
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """Backend name and record count"""
+        pass
+
+    def __contains__(self, progress_id: str) -> bool:
+        return self.get(progress_id) is not None
+
+class MemoryProgressStore(ProgressStore):
+    """In-process store; each uvicorn worker sees only its own jobs"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[str, ProgressRecord]" = OrderedDict()
+
+    def create(self, progress_id: str) -> None:
+        with self._lock:
+            self._records[progress_id] = ProgressRecord()
+            self._enforce_cap()
+
+    def update(self, progress_id: str, **fields) -> Optional[Dict]:
+        with self._lock:
+            record = self._records.get(progress_id)
+            if record is None:
+                return None
+            record.apply(fields)
+            return record.to_dict()
+
+    def get(self, progress_id: str) -> Optional[Dict]:
+        with self._lock:
+            record = self._records.get(progress_id)
+            if record is None or self._expired(record, time.time()):
+                return None
+            return record.to_dict()
+
+    def delete(self, progress_id: str) -> None:
+        with self._lock:
+            self._records.pop(progress_id, None)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [key for key, record in self._records.items() if self._expired(record, now)]
+            for key in expired:
+                del self._records[key]
+        return len(expired)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._records), "max_entries": self.max_entries}
+
+    def _expired(self, record: ProgressRecord, now: float) -> bool:
+        return record.finished_at is not None and now - record.finished_at > self.ttl_seconds
+
+    def _enforce_cap(self) -> None:
+        """Evict down to max_entries, oldest finished first; caller holds the lock"""
+        excess = len(self._records) - self.max_entries
+        if excess <= 0:
+            return
+        finished = [key for key, record in self._records.items() if record.finished_at is not None]
+        for key in finished[:excess]:
+            del self._records[key]
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+
+class SQLiteProgressStore(ProgressStore):
+    """Progress shared by all workers on a host through one SQLite file"""
+
+    shared = True
+
+    def __init__(self, db_path: Path = PROGRESS_STORE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._creates = 0
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS progress (
+                progress_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL,
+                message TEXT,
+                speed REAL,
+                eta REAL,
+                filename TEXT,
+                download_url TEXT,
+                filesize INTEGER,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_progress_finished_at ON progress (finished_at)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, conn: sqlite3.Connection, progress_id: str) -> Optional[ProgressRecord]:
+        row = conn.execute(
+            "SELECT status, progress, message, speed, eta, filename, download_url, filesize, error, "
+            "updated_at, finished_at FROM progress WHERE progress_id = ?", (progress_id,)
+        ).fetchone()
+        return ProgressRecord(*row) if row else None
+
+    def _save(self, conn: sqlite3.Connection, progress_id: str, record: ProgressRecord) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO progress (progress_id, status, progress, message, speed, eta, filename, "
+            "download_url, filesize, error, updated_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (progress_id, *(getattr(record, key) for key in ProgressRecord.__slots__)),
+        )
+
+    def create(self, progress_id: str) -> None:
+        conn = self._connect()
+        self._save(conn, progress_id, ProgressRecord())
+        # Counting is a scan of the table, so the cap is only checked now and then
+        self._creates += 1
+        if self._creates % CAP_CHECK_INTERVAL == 0:
+            self._enforce_cap(conn)
+        conn.commit()
+
+    def _enforce_cap(self, conn: sqlite3.Connection) -> None:
+        """Evict down to max_entries, oldest finished first; the caller commits"""
+        count = conn.execute("SELECT COUNT(*) FROM progress").fetchone()[0]
+        if count > self.max_entries:
+            # Finished records sort before running ones, oldest first within each
+            conn.execute(
+                "DELETE FROM progress WHERE progress_id IN (SELECT progress_id FROM progress "
+                "ORDER BY finished_at IS NULL, COALESCE(finished_at, updated_at) LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def update(self, progress_id: str, **fields) -> Optional[Dict]:
+        conn = self._connect()
+        # BEGIN IMMEDIATE so concurrent read-modify-write from other workers can't interleave
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            record = self._load(conn, progress_id)
+            if record is None:
+                return None
+            record.apply(fields)
+            self._save(conn, progress_id, record)
+            return record.to_dict()
+        finally:
+            conn.commit()
+
+    def get(self, progress_id: str) -> Optional[Dict]:
+        record = self._load(self._connect(), progress_id)
+        if record is None:
+            return None
+        if record.finished_at is not None and time.time() - record.finished_at > self.ttl_seconds:
+            return None
+        return record.to_dict()
+
+    def delete(self, progress_id: str) -> None:
+        conn = self._connect()
+        conn.execute("DELETE FROM progress WHERE progress_id = ?", (progress_id,))
+        conn.commit()
+
+    def purge_expired(self) -> int:
+        conn = self._connect()
+        cursor = conn.execute(
+            "DELETE FROM progress WHERE finished_at IS NOT NULL AND finished_at < ?",
+            (time.time() - self.ttl_seconds,),
+        )
+        removed = cursor.rowcount
+        self._enforce_cap(conn)
+        conn.commit()
+        return removed
+
+    def stats(self) -> Dict:
+        count = self._connect().execute("SELECT COUNT(*) FROM progress").fetchone()[0]
+        return {"backend": "sqlite", "entries": count, "max_entries": self.max_entries}
+
+class RedisProgressStore(ProgressStore):
+    """Progress shared across hosts through any Redis-protocol server.
+
+    Each record is a JSON string; finished records get a Redis TTL. A sorted
+    set of ids by creation time counts the records and a second one holds
+    finished ids by completion time, so the entry cap evicts the oldest
+    finished records before any running one.
+    """
+
+    shared = True
+
+    INDEX_KEY = "progress:index"
+    FINISHED_KEY = "progress:finished"
+
+    def __init__(self, url: str = PROGRESS_STORE_URL, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("PROGRESS_STORE_BACKEND=redis requires the 'redis' package")
+        self._redis = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def _key(self, progress_id: str) -> str:
+        return f"progress:{progress_id}"
+
+    def _write(self, progress_id: str, record: ProgressRecord, pipe=None) -> None:
+        target = pipe if pipe is not None else self._redis
+        value = json.dumps([getattr(record, key) for key in ProgressRecord.__slots__])
+        if record.finished_at is not None:
+            target.set(self._key(progress_id), value, ex=self.ttl_seconds)
+            target.zadd(self.FINISHED_KEY, {progress_id: record.finished_at})
+        else:
+            target.set(self._key(progress_id), value)
+
+    def _read(self, progress_id: str) -> Optional[ProgressRecord]:
+        value = self._redis.get(self._key(progress_id))
+        return ProgressRecord(*json.loads(value)) if value else None
+
+    def create(self, progress_id: str) -> None:
+        pipe = self._redis.pipeline()
+        self._write(progress_id, ProgressRecord(), pipe)
+        pipe.zadd(self.INDEX_KEY, {progress_id: time.time()})
+        pipe.execute()
+        excess = self._redis.zcard(self.INDEX_KEY) - self.max_entries
+        if excess > 0:
+            # Oldest finished first; running records only if that is not enough
+            oldest = self._redis.zrange(self.FINISHED_KEY, 0, excess - 1)
+            if len(oldest) < excess:
+                finished = set(oldest)
+                oldest += [key for key in self._redis.zrange(self.INDEX_KEY, 0, excess - 1 + len(oldest))
+                           if key not in finished][:excess - len(oldest)]
+            if oldest:
+                self._remove(*oldest)
+
+    def _remove(self, *progress_ids) -> None:
+        pipe = self._redis.pipeline()
+        pipe.delete(*(self._key(key.decode() if isinstance(key, bytes) else key) for key in progress_ids))
+        pipe.zrem(self.INDEX_KEY, *progress_ids)
+        pipe.zrem(self.FINISHED_KEY, *progress_ids)
+        pipe.execute()
+
+    def update(self, progress_id: str, **fields) -> Optional[Dict]:
+        key = self._key(progress_id)
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    # Optimistic transaction: retried if another worker updates the record meanwhile
+                    pipe.watch(key)
+                    value = pipe.get(key)
+                    if not value:
+                        return None
+                    record = ProgressRecord(*json.loads(value))
+                    record.apply(fields)
+                    pipe.multi()
+                    self._write(progress_id, record, pipe)
+                    pipe.execute()
+                    return record.to_dict()
+                except self._watch_error:
+                    continue
+
+    def get(self, progress_id: str) -> Optional[Dict]:
+        record = self._read(progress_id)
+        return record.to_dict() if record else None
+
+    def delete(self, progress_id: str) -> None:
+        self._remove(progress_id)
+
+    def purge_expired(self) -> int:
+        # Redis expires the records themselves; drop the index entries of those past the TTL
+        stale = self._redis.zrangebyscore(self.FINISHED_KEY, 0, time.time() - self.ttl_seconds)
+        if stale:
+            self._remove(*stale)
+        return len(stale)
+
+    def stats(self) -> Dict:
+        return {"backend": "redis", "entries": self._redis.zcard(self.INDEX_KEY), "max_entries": self.max_entries}
+
+def create_progress_store(backend: str = PROGRESS_STORE_BACKEND) -> ProgressStore:
+    """Build the progress store selected by PROGRESS_STORE_BACKEND"""
+    if backend == "sqlite":
+        return SQLiteProgressStore()
+    if backend == "redis":
+        return RedisProgressStore()
+    if backend != "memory":
+        logger.warning(f"Unknown PROGRESS_STORE_BACKEND '{backend}', using memory")
+    return MemoryProgressStore()
+
+# Global progress store instance
+progress_store = create_progress_store()
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class _Call:
+    """A single in-flight call shared by every caller with the same key"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+class _AsyncCall:
+    """An in-flight coroutine call and how many callers are awaiting it"""
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running block until it finishes and receive the same result (or the
+    same exception). Nothing is cached once the call completes.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, _AsyncCall] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) once per key among concurrent callers"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Await fn(*args, **kwargs) once per key among concurrent coroutines.
+
+        Waiting callers only hold an event-loop future, not a worker thread, so
+        a burst of identical requests occupies a single slot in the executors.
+        fn runs in a task owned by no single caller: a caller that is cancelled
+        just stops waiting, and the call is cancelled once nobody is left.
+        """
+        call = self._tasks.get(key)
+        if call is not None:
+            self.coalesced += 1
+        else:
+            call = _AsyncCall(asyncio.ensure_future(fn(*args, **kwargs)))
+            self._tasks[key] = call
+            self.executed += 1
+            call.task.add_done_callback(lambda task: self._finish_async(key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.task.cancelled():
+                raise
+            # Only this caller was cancelled; the others keep waiting on the task
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._finish_async(key, call)
+            raise
+
+    def _finish_async(self, key: Hashable, call: "_AsyncCall") -> None:
+        if self._tasks.get(key) is call:
+            del self._tasks[key]
+        if call.task.done() and not call.task.cancelled():
+            # Mark the exception as retrieved when nobody was left waiting
+            call.task.exception()
+
+    def in_flight(self) -> int:
+        """Number of keys currently executing"""
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
+
+    def stats(self) -> Dict:
+        """Get coalescing statistics"""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls) + len(self._tasks),
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+            }
+
+# Shared group for yt-dlp extractions
+extract_flight = SingleFlight("extract")
@@ -0,0 +1,305 @@
+import os
+import logging
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ffmpeg_runner import FFmpegTimeoutError, ffmpeg_runner, fraction_progress
+from tracing import traced, tracer
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SMART_CUT_ENABLED = os.getenv("SMART_CUT_ENABLED", "true").lower() == "true"
+SMART_CUT_CRF = os.getenv("SMART_CUT_CRF", "18")
+SMART_CUT_PRESET = os.getenv("SMART_CUT_PRESET", "veryfast")
+
+# Source codecs whose boundary GOPs we can re-encode
+SMART_CUT_ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+}
+
+# Codecs whose re-encoded pieces can be spliced to stream-copied GOPs. The
+# concat demuxer rewrites H.264 parameter sets per piece; HEVC's are not,
+# so HEVC clips are re-encoded in one piece instead.
+SPLICE_CODECS = {"h264"}
+
+# ffprobe H.264 profile names -> libx264 -profile:v
+X264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+
+# Seconds decoded either side of each splice point to check the result
+SPLICE_CHECK_WINDOW = 1.0
+
+# Cut points closer than this to a keyframe are treated as landing on it
+KEYFRAME_TOLERANCE = 0.001
+
+async def _run(cmd: List[str], duration: Optional[float] = None,
+               progress_callback: Optional[Callable[[float], None]] = None) -> bool:
+    """Run an ffmpeg command on the shared runner, logging stderr on failure"""
+    with tracer.span(cmd[0], **{"process.command_line": " ".join(cmd)[:1000]}) as span:
+        result = await ffmpeg_runner.run(cmd, duration, fraction_progress(progress_callback))
+        if not result.ok:
+            logger.error(f"{cmd[0]} failed: {result.stderr.strip()[-500:]}")
+            span.set_error(f"{cmd[0]} exited with {result.returncode}")
+    return result.ok
+
+@traced("ffprobe.video_stream")
+async def probe_video_stream(input_path: str) -> Optional[Dict[str, str]]:
+    """codec_name, pix_fmt, profile and level of the first video stream, or None if there is none"""
+    try:
+        result = await ffmpeg_runner.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+             '-show_entries', 'stream=codec_name,pix_fmt,profile,level',
+             '-of', 'default=noprint_wrappers=1', input_path],
+        )
+    except FileNotFoundError:
+        logger.warning("ffprobe not found, smart cut disabled")
+        return None
+    if result.returncode != 0:
+        return None
+    fields = {}
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition("=")
+        if value and value not in ("unknown", "N/A"):
+            fields[key.strip()] = value.strip()
+    return fields if fields.get("codec_name") else None
+
+@traced("ffprobe.keyframes")
+async def probe_keyframes(input_path: str, start_time: float, end_time: float) -> List[float]:
+    """Keyframe timestamps of the first video stream between start_time and end_time.
+
+    Only packet headers inside the interval are read (no decoding), so the cost
+    depends on the clip length rather than where it sits in the source.
+    """
+    result = await ffmpeg_runner.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-read_intervals', f"{start_time}%{end_time}",
+         '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', input_path],
+    )
+    keyframes = set()
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" not in flags:
+            continue
+        try:
+            pts = float(pts_time)
+        except ValueError:
+            continue
+        if start_time - KEYFRAME_TOLERANCE <= pts <= end_time + KEYFRAME_TOLERANCE:
+            keyframes.add(pts)
+    return sorted(keyframes)
+
+def _container_flags(output_path: str) -> List[str]:
+    if Path(output_path).suffix.lower() in (".mp4", ".m4v", ".mov"):
+        return ['-movflags', '+faststart']
+    return []
+
+async def cut_audio(input_path: str, output_path: str, start_time: float, end_time: float,
+                    progress_callback: Optional[Callable[[float], None]] = None) -> bool:
+    """Cut and encode an MP3 segment, seeking the input so only the clip is decoded"""
+    # audio_pipeline imports this module (through media_pipeline), so import it here
+    from audio_pipeline import AUDIO_FORMATS
+
+    return await _run([
+        'ffmpeg', '-v', 'error',
+        '-ss', str(start_time), '-i', input_path,
+        '-t', str(end_time - start_time),
+        '-vn',
+        *AUDIO_FORMATS["mp3"]["encode"],
+        '-y', output_path,
+    ], end_time - start_time, progress_callback)
+
+async def cut_copy(input_path: str, output_path: str, start_time: float, end_time: float,
+                   output_args: Optional[List[str]] = None,
+                   progress_callback: Optional[Callable[[float], None]] = None) -> bool:
+    """Stream-copy a segment with input seeking; the start snaps to the previous keyframe"""
+    return await _run([
+        'ffmpeg', '-v', 'error',
+        '-ss', str(start_time), '-i', input_path,
+        '-t', str(end_time - start_time),
+        '-map', '0:v?', '-map', '0:a?',
+        '-c', 'copy',
+        '-avoid_negative_ts', 'make_zero',
+        *(output_args or []),
+        *_container_flags(output_path),
+        '-y', output_path,
+    ], end_time - start_time, progress_callback)
+
+def _piece_progress(progress_callback: Optional[Callable[[float], None]], offset: float,
+                    share: float) -> Optional[Callable[[float], None]]:
+    """Report a piece's progress as its share of the whole cut, starting at offset"""
+    if progress_callback is None:
+        return None
+    return lambda fraction: progress_callback(min(0.95, offset + fraction * share))
+
+def _encoder_args(stream: Dict[str, str]) -> List[str]:
+    """Encoder options for re-encoded pieces, matching the source's profile, level and pixel format"""
+    args = ['-c:v', SMART_CUT_ENCODERS[stream["codec_name"]], '-crf', SMART_CUT_CRF, '-preset', SMART_CUT_PRESET]
+    if stream["codec_name"] == "h264":
+        # No B-frames, so the piece's DTS never dips below the previous piece's at the splice
+        args += ['-bf', '0']
+        profile = X264_PROFILES.get(stream.get("profile", ""))
+        if profile:
+            args += ['-profile:v', profile]
+        if stream.get("level", "").isdigit() and int(stream["level"]) > 0:
+            args += ['-level', stream["level"]]
+    if stream.get("pix_fmt"):
+        args += ['-pix_fmt', stream["pix_fmt"]]
+    return args
+
+async def _encode_video(input_path: str, output_path: str, start_time: float, duration: float,
+                        encoder_args: List[str],
+                        progress_callback: Optional[Callable[[float], None]] = None) -> bool:
+    """Frame-accurately re-encode [start_time, start_time + duration) of the video stream"""
+    return await _run([
+        'ffmpeg', '-v', 'error',
+        '-ss', str(start_time), '-i', input_path, '-t', str(duration),
+        '-map', '0:v:0', '-an',
+        *encoder_args,
+        '-f', 'matroska', '-y', output_path,
+    ], duration, progress_callback)
+
+async def _copy_video(input_path: str, output_path: str, start_time: float, duration: float,
+                      progress_callback: Optional[Callable[[float], None]] = None) -> bool:
+    """Stream-copy whole GOPs starting at the keyframe at start_time"""
+    return await _run([
+        'ffmpeg', '-v', 'error',
+        '-ss', str(start_time), '-i', input_path, '-t', str(duration),
+        '-map', '0:v:0', '-an', '-c:v', 'copy',
+        '-f', 'matroska', '-y', output_path,
+    ], duration, progress_callback)
+
+@traced("ffprobe.verify_splices")
+async def verify_splices(output_path: str, splice_points: List[float]) -> bool:
+    """Decode the video around each splice point and report whether it decodes cleanly"""
+    intervals = ",".join(
+        f"{max(0.0, point - SPLICE_CHECK_WINDOW)}%{point + SPLICE_CHECK_WINDOW}" for point in splice_points
+    ) or "%+#1"
+    result = await ffmpeg_runner.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-read_intervals', intervals,
+         '-show_entries', 'frame=pts_time', '-of', 'csv=p=0', output_path],
+    )
+    if result.returncode != 0 or result.stderr.strip() or not result.stdout.strip():
+        logger.warning(f"Smart cut output does not decode cleanly: {result.stderr.strip()[-300:]}")
+        return False
+    return True
+
+async def smart_cut(input_path: str, output_path: str, start_time: float, end_time: float,
+              progress_callback: Optional[Callable[[float], None]] = None,
+              output_args: Optional[List[str]] = None) -> bool:
+    """Frame-accurate video cut that re-encodes only the boundary GOPs.
+
+    The partial GOP before the first keyframe inside the range and the partial
+    GOP after the last one are re-encoded, with the source's profile and
+    level; whole GOPs in between are stream-copied. The video pieces are
+    joined with the concat demuxer and the audio is stream-copied from the
+    source over the same range. output_args are added to that final mux (e.g.
+    audio codec or metadata options). Codecs that cannot be spliced (HEVC)
+    are re-encoded in one piece. Spliced output is decoded around each splice
+    before it is accepted; False means the caller should fall back.
+    """
+    stream = await probe_video_stream(input_path)
+    if stream is None or stream["codec_name"] not in SMART_CUT_ENCODERS:
+        return False
+    encoder_args = _encoder_args(stream)
+    duration = end_time - start_time
+
+    keyframes = await probe_keyframes(input_path, start_time, end_time)
+    first = next((k for k in keyframes if k >= start_time - KEYFRAME_TOLERANCE), None)
+    last = next((k for k in reversed(keyframes) if k <= end_time + KEYFRAME_TOLERANCE), None)
+
+    with tempfile.TemporaryDirectory(prefix="smartcut_", dir=str(Path(output_path).parent)) as tmp:
+        pieces: List[Tuple[str, float, float, bool]] = []
+        if (stream["codec_name"] not in SPLICE_CODECS or first is None or last is None
+                or last - first <= KEYFRAME_TOLERANCE):
+            # No complete GOP inside the range, or a codec that cannot be spliced: re-encode the whole clip
+            pieces.append(("all.mkv", start_time, duration, True))
+        else:
+            if first - start_time > KEYFRAME_TOLERANCE:
+                pieces.append(("head.mkv", start_time, first - start_time, True))
+            pieces.append(("middle.mkv", first, last - first, False))
+            if end_time - last > KEYFRAME_TOLERANCE:
+                pieces.append(("tail.mkv", last, end_time - last, True))
+
+        logger.info(
+            f"Smart cut {start_time}s-{end_time}s: "
+            + ", ".join(f"{name} {'encode' if encode else 'copy'} {length:.3f}s" for name, _, length, encode in pieces)
+        )
+
+        done = 0.0
+        concat_list = Path(tmp) / "pieces.txt"
+        with open(concat_list, "w") as f:
+            for name, piece_start, length, encode in pieces:
+                piece_path = str((Path(tmp) / name).resolve())
+                piece_progress = _piece_progress(progress_callback, done / duration, length / duration)
+                if encode:
+                    ok = await _encode_video(input_path, piece_path, piece_start, length, encoder_args, piece_progress)
+                else:
+                    ok = await _copy_video(input_path, piece_path, piece_start, length, piece_progress)
+                if not ok:
+                    return False
+                # Explicit durations keep splice offsets exact despite container rounding
+                f.write(f"file '{piece_path}'\nduration {length:.6f}\n")
+                done += length
+
+        ok = await _run([
+            'ffmpeg', '-v', 'error',
+            '-f', 'concat', '-safe', '0', '-i', str(concat_list),
+            '-ss', str(start_time), '-t', str(duration), '-i', input_path,
+            '-map', '0:v:0', '-map', '1:a?',
+            '-c', 'copy',
+            *(output_args or []),
+            *_container_flags(output_path),
+            '-y', output_path,
+        ])
+    if ok and len(pieces) > 1:
+        # Where pieces meet in the output
+        splice_points = []
+        offset = 0.0
+        for _, _, length, _ in pieces[:-1]:
+            offset += length
+            splice_points.append(offset)
+        ok = await verify_splices(output_path, splice_points)
+        if not ok:
+            Path(output_path).unlink(missing_ok=True)
+    if ok and progress_callback:
+        progress_callback(1.0)
+    return ok
+
+async def cut_segment_async(input_path: str, output_path: str, start_time: float, end_time: float,
+                            output_format: str = "mp4",
+                            progress_callback: Optional[Callable[[float], None]] = None,
+                            output_args: Optional[List[str]] = None) -> bool:
+    """Cut [start_time, end_time] from a media file.
+
+    MP3 output is re-encoded from an input-seeked source. Video uses smart_cut
+    when enabled and the codec is supported, and otherwise (or if it fails)
+    falls back to a keyframe-aligned stream copy.
+    """
+    if output_format == "mp3":
+        ok = await cut_audio(input_path, output_path, start_time, end_time, progress_callback)
+    else:
+        ok = False
+        if SMART_CUT_ENABLED:
+            try:
+                ok = await smart_cut(input_path, output_path, start_time, end_time, progress_callback, output_args)
+            except FFmpegTimeoutError:
+                raise
+            except Exception as e:
+                logger.warning(f"Smart cut error, falling back to stream copy: {e}")
+            if not ok:
+                logger.info("Smart cut not possible, using keyframe-aligned stream copy")
+        if not ok:
+            ok = await cut_copy(input_path, output_path, start_time, end_time, output_args, progress_callback)
+    if ok and progress_callback:
+        progress_callback(1.0)
+    return ok
@@ -0,0 +1,186 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from download_cache import DownloadCache
+from file_manifest import FileManifest, file_manifest
+from metrics import FILES_REMOVED
+from storage_layout import StorageLayout
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+STORAGE_LOW_WATERMARK_MB = int(os.getenv("STORAGE_LOW_WATERMARK_MB", "2048"))
+STORAGE_HIGH_WATERMARK_MB = int(os.getenv("STORAGE_HIGH_WATERMARK_MB", "4096"))
+STORAGE_CHECK_INTERVAL = float(os.getenv("STORAGE_CHECK_INTERVAL", "30"))
+STORAGE_ADOPT_INTERVAL_HOURS = float(os.getenv("STORAGE_ADOPT_INTERVAL_HOURS", "24"))
+STORAGE_ADOPT_GRACE_SECONDS = float(os.getenv("STORAGE_ADOPT_GRACE_SECONDS", "300"))
+
+# Files removed per index query, so no pass holds a long write transaction
+BATCH_SIZE = 256
+
+# yt-dlp's names for downloads still being written
+IN_PROGRESS_SUFFIXES = (".part", ".ytdl", ".temp")
+
+# Sources that ffmpeg is still reading while it builds the final file
+INTERMEDIATE_MARKERS = ("_src.", "_temp.")
+
+class StorageCleaner:
+    """Removes output files through the file manifest instead of sweeping STORAGE_DIR.
+
+    Expired files come straight off the manifest's expiry index, so a pass with
+    nothing due is one indexed query, however many files are stored. When free
+    space on STORAGE_DIR drops below the low watermark, the least recently
+    served files are deleted until it is back above the high watermark, then
+    the download cache is shrunk if that was not enough. Deleting a file that
+    is also hard-linked from the cache frees nothing, so progress is measured
+    with statvfs rather than by adding up sizes. Files the manifest has never
+    seen (from before it existed, or left behind by a crash) are picked up by
+    a directory scan every STORAGE_ADOPT_INTERVAL_HOURS.
+    """
+
+    def __init__(self, storage_dir: Path, cache: DownloadCache, manifest: FileManifest = file_manifest,
+                 low_watermark_mb: int = STORAGE_LOW_WATERMARK_MB,
+                 high_watermark_mb: int = STORAGE_HIGH_WATERMARK_MB, interval: float = STORAGE_CHECK_INTERVAL,
+                 adopt_interval_hours: float = STORAGE_ADOPT_INTERVAL_HOURS):
+        self.storage_dir = Path(storage_dir)
+        self.layout = StorageLayout(self.storage_dir)
+        self.manifest = manifest
+        self.cache = cache
+        self.low_watermark = low_watermark_mb * 1024 * 1024
+        self.high_watermark = max(high_watermark_mb, low_watermark_mb) * 1024 * 1024
+        self.interval = interval
+        self.adopt_interval = adopt_interval_hours * 3600
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._adopted_at: Optional[float] = None
+        self.expired_removed = 0
+        self.evicted = 0
+        self.adopted = 0
+        self.pressure_events = 0
+
+    def free_bytes(self) -> Optional[int]:
+        try:
+            return shutil.disk_usage(self.storage_dir).free
+        except OSError:
+            return None
+
+    def _delete(self, rows: List[Tuple[str, str, int]], reason: str) -> int:
+        """Delete indexed files and drop their manifest entries"""
+        removed = 0
+        for filename, path, _ in rows:
+            try:
+                os.unlink(path)
+                removed += 1
+                logger.info(f"Removed {reason} file: {filename}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Forgotten anyway; the next adopt scan indexes it again if it is still there
+                logger.warning(f"Could not remove {path}: {e}")
+        self.manifest.remove_many(filename for filename, _, _ in rows)
+        if removed:
+            FILES_REMOVED.labels(reason=reason).inc(removed)
+        return removed
+
+    def purge_expired(self) -> int:
+        """Delete every file past its expiry time"""
+        removed = 0
+        now = time.time()
+        while True:
+            rows = self.manifest.expired(BATCH_SIZE, now)
+            if rows:
+                removed += self._delete(rows, "expired")
+            if len(rows) < BATCH_SIZE:
+                break
+        self.expired_removed += removed
+        return removed
+
+    def relieve_pressure(self) -> int:
+        """Below the low watermark, evict least recently served files until above the high one"""
+        free = self.free_bytes()
+        if free is None or free >= self.low_watermark:
+            return 0
+        self.pressure_events += 1
+        logger.warning(f"Only {free // (1024 * 1024)} MB free on {self.storage_dir}, evicting least recently used files")
+        evicted = 0
+        while free is not None and free < self.high_watermark:
+            rows = self.manifest.least_recently_used(BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                evicted += self._delete([row], "disk_pressure")
+                free = self.free_bytes()
+                if free is None or free >= self.high_watermark:
+                    break
+        if free is not None and free < self.high_watermark:
+            # What is left is held by cached objects that outlive the links to them
+            target = max(0, self.cache.total_bytes() - (self.high_watermark - free))
+            self.cache.evict(max_bytes=target)
+        self.evicted += evicted
+        return evicted
+
+    def adopt_untracked(self) -> int:
+        """Index files in STORAGE_DIR that were never registered (a full directory scan)"""
+        found = []
+        now = time.time()
+        stale_before = now - self.manifest.retention_seconds
+        if not self.storage_dir.is_dir():
+            logger.error(f"Could not scan {self.storage_dir}: not a directory")
+            return 0
+        for entry in self.layout.iter_files():
+            try:
+                stat_result = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            # A download still being written, or a source still being read, is left alone until it has gone stale
+            in_flight = entry.name.endswith(IN_PROGRESS_SUFFIXES) or any(m in entry.name for m in INTERMEDIATE_MARKERS)
+            if in_flight and stat_result.st_mtime > stale_before:
+                continue
+            # Outputs written moments ago (or still being streamed to disk) are about to be registered
+            if stat_result.st_mtime > now - STORAGE_ADOPT_GRACE_SECONDS:
+                continue
+            found.append((Path(entry.path), stat_result.st_size, stat_result.st_mtime))
+        adopted = self.manifest.adopt(found)
+        if adopted:
+            logger.info(f"Indexed {adopted} untracked files in {self.storage_dir}")
+        self.adopted += adopted
+        return adopted
+
+    def run(self) -> None:
+        """One cleanup pass; skipped if another thread is already running one"""
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._adopted_at is None or time.monotonic() - self._adopted_at >= self.adopt_interval:
+                self._adopted_at = time.monotonic()
+                self.adopt_untracked()
+            self.purge_expired()
+            self.relieve_pressure()
+            self._checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def check(self) -> None:
+        """Run a pass if the last one was more than interval seconds ago"""
+        if time.monotonic() - self._checked_at >= self.interval:
+            self.run()
+
+    def stats(self) -> Dict:
+        """Manifest totals, free space and what has been removed"""
+        free = self.free_bytes()
+        stats = self.manifest.stats()
+        stats.update({
+            "free_mb": free // (1024 * 1024) if free is not None else None,
+            "low_watermark_mb": self.low_watermark // (1024 * 1024),
+            "high_watermark_mb": self.high_watermark // (1024 * 1024),
+            "expired_removed": self.expired_removed,
+            "evicted": self.evicted,
+            "adopted": self.adopted,
+            "pressure_events": self.pressure_events,
+        })
+        return stats
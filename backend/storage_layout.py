@@ -0,0 +1,158 @@
+import os
+import sys
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+STORAGE_SHARDING = os.getenv("STORAGE_SHARDING", "true").lower() == "true"
+
+# Two levels of 256 directories: 65,536 leaves, about 15 entries each at 1M files
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+def shard_key(name: str) -> str:
+    """The part of a filename that picks its directory: everything before the first dot.
+
+    A yt-dlp template like name.%(ext)s therefore resolves to the same
+    directory whatever extension the download ends up with.
+    """
+    return name.split(".", 1)[0]
+
+def is_safe_name(name: str) -> bool:
+    """Whether a client-supplied file or user name stays inside its directory"""
+    return bool(name) and name not in (".", "..") and "/" not in name and os.sep not in name and "\0" not in name
+
+def _is_shard_name(name: str) -> bool:
+    return len(name) == SHARD_WIDTH and all(c in "0123456789abcdef" for c in name)
+
+class StorageLayout:
+    """Where files live under a storage root: root/ab/cd/<name>, with ab/cd from an MD5 of the name.
+
+    ext4 and overlayfs directory lookups, creates and listings slow down as a
+    single directory grows, so files are spread over two levels of 256
+    directories. Per-user directories (cloud uploads) are sharded by user id
+    the same way and keep their files together, so a user's listing is still
+    one directory read. Reads fall back to the flat layout, so files from
+    before sharding stay reachable until `python storage_layout.py` has moved
+    them.
+    """
+
+    def __init__(self, root: Path, sharded: bool = STORAGE_SHARDING):
+        self.root = Path(root)
+        self.sharded = sharded
+
+    def shard_dir(self, key: str, create: bool = False) -> Path:
+        """Leaf directory for a shard key"""
+        directory = self.root
+        if self.sharded:
+            digest = hashlib.md5(key.encode("utf-8")).hexdigest()
+            directory = directory.joinpath(*(digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)))
+        if create:
+            directory.mkdir(parents=True, exist_ok=True)
+        return directory
+
+    def path(self, name: str, create: bool = False) -> Path:
+        """Where a file called name is written (create makes its directory)"""
+        return self.shard_dir(shard_key(name), create) / name
+
+    def locate(self, name: str) -> Optional[Path]:
+        """The existing file called name, in its shard or still in the flat layout, or None"""
+        if not is_safe_name(name):
+            return None
+        for candidate in (self.path(name), self.root / name):
+            if candidate.is_file():
+                return candidate
+        return None
+
+    def user_dir(self, user_id: str, create: bool = False) -> Path:
+        """Directory holding one user's files (the flat one while it has not been migrated)"""
+        sharded = self.shard_dir(user_id) / user_id
+        flat = self.root / user_id
+        if self.sharded and not sharded.is_dir() and flat.is_dir():
+            return flat
+        if create:
+            sharded.mkdir(parents=True, exist_ok=True)
+        return sharded
+
+    def iter_files(self) -> Iterator[os.DirEntry]:
+        """Files stored by path(): shard leaves plus anything left at the top level (not user directories)"""
+        stack = [(str(self.root), 0)]
+        while stack:
+            directory, depth = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_file(follow_symlinks=False):
+                                if depth in (0, SHARD_LEVELS):
+                                    yield entry
+                            elif depth < SHARD_LEVELS and _is_shard_name(entry.name) and entry.is_dir(follow_symlinks=False):
+                                stack.append((entry.path, depth + 1))
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+    def migrate(self, users: bool = False, dry_run: bool = False) -> Dict[str, int]:
+        """Move flat-layout files (and, with users, per-user directories) into their shards.
+
+        Files are renamed, so this must stay on one filesystem; hard links from
+        the download cache are unaffected. Dot-directories (the cache) and
+        directories that are already shards are left alone.
+        """
+        moved = {"files": 0, "user_dirs": 0, "skipped": 0}
+        if not self.sharded:
+            return moved
+        with os.scandir(self.root) as entries:
+            top_level = list(entries)
+        for entry in top_level:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_file(follow_symlinks=False):
+                kind, dest = "files", self.path(entry.name)
+            elif users and entry.is_dir(follow_symlinks=False) and not _is_shard_name(entry.name):
+                kind, dest = "user_dirs", self.shard_dir(entry.name) / entry.name
+            else:
+                continue
+            if dest.exists():
+                logger.warning(f"Not moving {entry.path}: {dest} already exists")
+                moved["skipped"] += 1
+                continue
+            if not dry_run:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(entry.path, dest)
+            moved[kind] += 1
+        return moved
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Move a flat storage directory into the sharded layout")
+    parser.add_argument("roots", nargs="+", help="Storage roots, e.g. ./downloads ./cloud_storage")
+    parser.add_argument("--users", action="store_true",
+                        help="Also move per-user directories (LocalStorageProvider uploads)")
+    parser.add_argument("--manifest", default=os.getenv("FILE_MANIFEST_DB_PATH", "./file_manifest.db"),
+                        help="File manifest whose recorded paths are updated (skipped if it does not exist)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would move")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if not STORAGE_SHARDING:
+        sys.exit("❌ STORAGE_SHARDING is false; nothing to migrate to")
+    for root in args.roots:
+        layout = StorageLayout(Path(root))
+        moved = layout.migrate(users=args.users, dry_run=args.dry_run)
+        print(f"{'🔎 Would move' if args.dry_run else '📦 Moved'} in {root}: {moved}")
+
+    if not args.dry_run and Path(args.manifest).exists():
+        from file_manifest import FileManifest
+
+        manifest = FileManifest(Path(args.manifest))
+        updated = manifest.relocate(lambda path: StorageLayout(path.parent).locate(path.name))
+        print(f"🗂️  Updated {updated} manifest paths")
+
+if __name__ == "__main__":
+    main_cli()
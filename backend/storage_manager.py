@@ -12,6 +12,9 @@ import cloudinary.api
 from google.cloud import storage as gcs
 import boto3
 from botocore.exceptions import ClientError
+from metrics import STORAGE_UPLOAD_FAILURES, STORAGE_UPLOAD_SECONDS, track
+from storage_layout import StorageLayout
+from tracing import tracer
 
 class StorageProvider(ABC):
     """Abstract base class for storage providers"""
@@ -298,6 +301,7 @@ class LocalStorageProvider(StorageProvider):
     
     def __init__(self):
         self.base_path = "cloud_storage"
+        self.layout = StorageLayout(self.base_path)
         self.quota_limit_mb = 1000  # 1GB local storage
         self.available = True
         
@@ -307,8 +311,7 @@ class LocalStorageProvider(StorageProvider):
     def upload_file(self, file_content: bytes, filename: str, user_id: str) -> Tuple[str, str]:
         try:
             # Create user directory
-            user_dir = os.path.join(self.base_path, user_id)
-            os.makedirs(user_dir, exist_ok=True)
+            user_dir = self.layout.user_dir(user_id, create=True)
             
             # Create unique filename
             timestamp = int(time.time())
@@ -327,7 +330,7 @@ class LocalStorageProvider(StorageProvider):
     
     def delete_file(self, file_id: str, user_id: str) -> bool:
         try:
-            file_path = os.path.join(self.base_path, user_id, file_id)
+            file_path = os.path.join(self.layout.user_dir(user_id), file_id)
             if os.path.exists(file_path):
                 os.remove(file_path)
                 return True
@@ -338,7 +341,7 @@ class LocalStorageProvider(StorageProvider):
     
     def get_file_info(self, file_id: str, user_id: str) -> Optional[Dict]:
         try:
-            file_path = os.path.join(self.base_path, user_id, file_id)
+            file_path = os.path.join(self.layout.user_dir(user_id), file_id)
             if not os.path.exists(file_path):
                 return None
             
@@ -357,7 +360,7 @@ class LocalStorageProvider(StorageProvider):
     
     def list_files(self, user_id: str) -> List[Dict]:
         try:
-            user_dir = os.path.join(self.base_path, user_id)
+            user_dir = self.layout.user_dir(user_id)
             if not os.path.exists(user_dir):
                 return []
             
@@ -493,7 +496,9 @@ class MultiStorageManager:
         file_size_mb = len(file_content) / (1024 * 1024)
         
         # Find available provider
-        provider_idx = self._find_available_provider(user_id, file_size_mb)
+        with tracer.span("storage.select_provider", **{"file.bytes": len(file_content)}) as span:
+            provider_idx = self._find_available_provider(user_id, file_size_mb)
+            span.set_attribute("storage.provider_index", provider_idx)
         if provider_idx is None:
             raise Exception("No storage providers available or quota exceeded")
         
@@ -501,7 +506,10 @@ class MultiStorageManager:
         provider_name = provider.__class__.__name__.replace("StorageProvider", "")
         
         try:
-            download_url, file_id = provider.upload_file(file_content, filename, user_id)
+            with tracer.span("storage.upload", **{"storage.provider": provider.__class__.__name__,
+                                                  "file.bytes": len(file_content)}), \
+                    track(STORAGE_UPLOAD_SECONDS, STORAGE_UPLOAD_FAILURES, provider=provider.__class__.__name__):
+                download_url, file_id = provider.upload_file(file_content, filename, user_id)
             
             # Update user storage info
             user_info = self._get_user_storage_info(user_id)
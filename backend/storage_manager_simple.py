@@ -2,8 +2,11 @@ import os
 import json
 import hashlib
 import time
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Optional, Tuple
 from abc import ABC, abstractmethod
+from metrics import STORAGE_UPLOAD_FAILURES, STORAGE_UPLOAD_SECONDS, track
+from storage_layout import StorageLayout, is_safe_name
+from tracing import tracer
 
 class StorageProvider(ABC):
     """Abstract base class for storage providers"""
@@ -28,14 +31,14 @@ class LocalStorageProvider(StorageProvider):
     
     def __init__(self, base_path: str = "downloads"):
         self.base_path = base_path
+        self.layout = StorageLayout(base_path)
         os.makedirs(base_path, exist_ok=True)
     
     def upload_file(self, file_content: bytes, filename: str, user_id: str) -> Tuple[str, str]:
         """Upload file to local storage"""
         try:
             # Create user directory
-            user_dir = os.path.join(self.base_path, user_id)
-            os.makedirs(user_dir, exist_ok=True)
+            user_dir = self.layout.user_dir(user_id, create=True)
             
             # Generate unique filename
             file_id = hashlib.md5(f"{user_id}_{filename}_{time.time()}".encode()).hexdigest()
@@ -55,7 +58,7 @@ class LocalStorageProvider(StorageProvider):
     def delete_file(self, file_id: str, user_id: str) -> bool:
         """Delete file from local storage"""
         try:
-            user_dir = os.path.join(self.base_path, user_id)
+            user_dir = self.layout.user_dir(user_id)
             for filename in os.listdir(user_dir):
                 if filename.startswith(file_id):
                     file_path = os.path.join(user_dir, filename)
@@ -68,7 +71,7 @@ class LocalStorageProvider(StorageProvider):
     def get_file_info(self, file_id: str, user_id: str) -> Optional[Dict]:
         """Get file information from local storage"""
         try:
-            user_dir = os.path.join(self.base_path, user_id)
+            user_dir = self.layout.user_dir(user_id)
             for filename in os.listdir(user_dir):
                 if filename.startswith(file_id):
                     file_path = os.path.join(user_dir, filename)
@@ -83,6 +86,13 @@ class LocalStorageProvider(StorageProvider):
             return None
         except Exception:
             return None
+    
+    def local_path(self, filename: str, user_id: str) -> Optional[str]:
+        """Path of a stored file named as in its download_url, or None"""
+        if not is_safe_name(user_id) or not is_safe_name(filename):
+            return None
+        file_path = os.path.join(self.layout.user_dir(user_id), filename)
+        return file_path if os.path.isfile(file_path) else None
 
 class StorageManager:
     """Simplified storage manager for basic functionality"""
@@ -125,7 +135,10 @@ class StorageManager:
     def upload_file(self, file_content: bytes, filename: str, user_id: str) -> Tuple[str, str]:
         """Upload file using user's preferred provider"""
         provider = self.get_user_provider(user_id)
-        return provider.upload_file(file_content, filename, user_id)
+        provider_name = provider.__class__.__name__
+        with tracer.span("storage.upload", **{"storage.provider": provider_name, "file.bytes": len(file_content)}), \
+                track(STORAGE_UPLOAD_SECONDS, STORAGE_UPLOAD_FAILURES, provider=provider_name):
+            return provider.upload_file(file_content, filename, user_id)
     
     def delete_file(self, file_id: str, user_id: str) -> bool:
         """Delete file using user's preferred provider"""
@@ -136,6 +149,10 @@ class StorageManager:
         """Get file information using user's preferred provider"""
         provider = self.get_user_provider(user_id)
         return provider.get_file_info(file_id, user_id)
+    
+    def get_local_path(self, filename: str, user_id: str) -> Optional[str]:
+        """Path of a file saved by the local provider, for serving its download_url"""
+        return self.providers["local"].local_path(filename, user_id)
 
 # Create global storage manager instance
 storage_manager = StorageManager()
@@ -0,0 +1,359 @@
+import os
+import json
+import time
+import random
+import atexit
+import logging
+import secrets
+import inspect
+import functools
+import threading
+import contextvars
+import urllib.request
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()  # none | file | otlp
+TRACE_FILE_PATH = os.getenv("TRACE_FILE_PATH", "./traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "infinityhole-backend")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2"))
+
+# Finished spans held for export; beyond this they are dropped rather than growing memory
+MAX_QUEUED_SPANS = 8192
+EXPORT_BATCH_SIZE = 512
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+def _attribute_value(value: Any) -> Dict:
+    """An attribute in OTLP/JSON AnyValue form"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _encode_attributes(attributes: Dict[str, Any]) -> List[Dict]:
+    return [{"key": key, "value": _attribute_value(value)} for key, value in attributes.items() if value is not None]
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent span_id, sampled) from a W3C traceparent header, or None if invalid"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+class Span:
+    """One timed operation in a trace, exported in OTLP form when it ends"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict] = []
+        self.status_code = 0
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def set_error(self, message: str) -> None:
+        """Mark the span failed without an exception (e.g. a non-zero exit code)"""
+        self.status_code = STATUS_ERROR
+        self.status_message = message[:500]
+
+    def end(self) -> None:
+        """Stop the span's clock (export still waits for its block to exit)"""
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.events.append({
+            "name": "exception",
+            "timeUnixNano": str(time.time_ns()),
+            "attributes": _encode_attributes({
+                "exception.type": type(exc).__name__,
+                "exception.message": str(exc)[:500],
+            }),
+        })
+        self.set_error(str(exc) or type(exc).__name__)
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent header value for continuing this trace elsewhere"""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": _encode_attributes(self.attributes),
+            "status": {"code": self.status_code, "message": self.status_message} if self.status_code else {},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = self.events
+        return span
+
+class SpanExporter(ABC):
+    """Destination for batches of finished spans"""
+
+    @abstractmethod
+    def export(self, payload: Dict) -> None:
+        """Send one OTLP/JSON ExportTraceServiceRequest"""
+        pass
+
+class FileSpanExporter(SpanExporter):
+    """Appends one OTLP/JSON request per line, the collector file exporter's format"""
+
+    def __init__(self, path: str = TRACE_FILE_PATH):
+        self.path = path
+
+    def export(self, payload: Dict) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+class OTLPHttpSpanExporter(SpanExporter):
+    """POSTs OTLP/JSON to a collector's /v1/traces endpoint"""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, payload: Dict) -> None:
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+class Tracer:
+    """Creates spans and exports finished ones from a background thread.
+
+    The current span lives in a context variable, so nesting follows the call
+    stack and carries into pool workers (executors copy the context). Export is
+    batched off the request path; when the exporter falls behind, spans are
+    dropped instead of queueing without bound.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter], service_name: str = TRACE_SERVICE_NAME,
+                 sample_rate: float = TRACE_SAMPLE_RATE, interval: float = TRACE_EXPORT_INTERVAL):
+        self.exporter = exporter
+        self.service_name = service_name
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._queue: deque = deque(maxlen=MAX_QUEUED_SPANS)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.exported = 0
+        self.dropped = 0
+        self.failed_exports = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[str] = None, kind: int = SPAN_KIND_INTERNAL,
+             **attributes) -> Iterator[Span]:
+        """Run a block inside a new span, the child of the current one.
+
+        parent is a traceparent header for continuing a trace started elsewhere
+        (an incoming request or a queued job); it is used only when there is no
+        current span. Exceptions are recorded on the span and re-raised.
+        """
+        current = _current_span.get()
+        remote = parse_traceparent(parent) if current is None else None
+        if current is not None:
+            span = Span(name, current.trace_id, current.span_id, current.sampled, kind, attributes)
+        elif remote is not None:
+            span = Span(name, remote[0], remote[1], remote[2], kind, attributes)
+        else:
+            sampled = self.enabled and random.random() < self.sample_rate
+            span = Span(name, secrets.token_hex(16), None, sampled, kind, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            if span.sampled and self.enabled:
+                self._enqueue(span)
+
+    def _enqueue(self, span: Span) -> None:
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(span)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                self._thread.start()
+            if len(self._queue) >= EXPORT_BATCH_SIZE:
+                self._wake.set()
+
+    def _export_loop(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """Export every queued span now"""
+        while True:
+            with self._lock:
+                batch = [self._queue.popleft() for _ in range(min(EXPORT_BATCH_SIZE, len(self._queue)))]
+            if not batch:
+                return
+            try:
+                self.exporter.export(self._payload(batch))
+                self.exported += len(batch)
+            except Exception as e:
+                self.failed_exports += 1
+                self.dropped += len(batch)
+                logger.warning(f"Trace export failed, dropped {len(batch)} spans: {e}")
+                return
+
+    def _payload(self, spans: List[Span]) -> Dict:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _encode_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": "infinityhole.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }],
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "exporter": type(self.exporter).__name__ if self.exporter else None,
+                "queued": len(self._queue),
+                "exported": self.exported,
+                "dropped": self.dropped,
+                "failed_exports": self.failed_exports,
+            }
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def current_traceparent() -> Optional[str]:
+    """traceparent of the current span, for handing work to another process or job"""
+    span = _current_span.get()
+    return span.traceparent if span is not None else None
+
+def traced(name: str) -> Callable:
+    """Decorator running a function (or coroutine function) inside a span"""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span per HTTP request.
+
+    The span lasts until the last body chunk is sent, so streamed responses
+    are covered, and continues an incoming W3C traceparent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        parent = headers.get(b"traceparent", b"").decode("latin-1") or None
+        with tracer.span(f"HTTP {scope['method']}", parent=parent, kind=SPAN_KIND_SERVER,
+                         **{"http.method": scope["method"], "http.target": scope["path"]}) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_error(f"HTTP {message['status']}")
+                    message.setdefault("headers", [])
+                    message["headers"] = [*message["headers"], (b"traceparent", span.traceparent.encode("latin-1"))]
+                await send(message)
+                if message["type"] == "http.response.body" and not message.get("more_body", False):
+                    # Background tasks run after this and get their own child spans
+                    span.end()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # The router records the matched route in the scope; name the span after its template
+                route = scope.get("route")
+                if route is not None and getattr(route, "path", None):
+                    span.name = f"HTTP {scope['method']} {route.path}"
+                    span.set_attribute("http.route", route.path)
+
+def create_tracer() -> Tracer:
+    """Build the tracer selected by TRACE_EXPORTER"""
+    if TRACE_EXPORTER == "file":
+        exporter: Optional[SpanExporter] = FileSpanExporter()
+    elif TRACE_EXPORTER == "otlp":
+        exporter = OTLPHttpSpanExporter()
+    elif TRACE_EXPORTER in ("", "none"):
+        exporter = None
+    else:
+        raise ValueError(f"Unknown TRACE_EXPORTER: {TRACE_EXPORTER}")
+    return Tracer(exporter)
+
+# Global tracer instance
+tracer = create_tracer()
+atexit.register(lambda: tracer.flush() if tracer.enabled else None)
@@ -0,0 +1,86 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import logging
+from typing import Dict, Optional
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SIGNED_URLS_ENABLED = os.getenv("SIGNED_URLS_ENABLED", "true").lower() == "true"
+SIGNED_URL_TTL = int(os.getenv("SIGNED_URL_TTL", "3600"))
+URL_SIGNING_KEY = os.getenv("URL_SIGNING_KEY") or os.getenv("SECRET_KEY", "")
+
+# Expiry times are rounded up to this many seconds, so a client polling a job
+# keeps getting the same URL (and a CDN the same cache key) for a while
+EXPIRY_GRANULARITY = 60
+
+# Only links to our own output files are signed
+SIGNED_PREFIX = "/files/"
+
+class InvalidSignatureError(Exception):
+    """Raised when a signed link is missing, tampered with or expired"""
+
+class URLSigner:
+    """HMAC-SHA256 signed, expiring links to output files.
+
+    A link is /files/<name>?expires=<unix time>&signature=<mac>, where the MAC
+    covers the path and the expiry. Checking one is a single HMAC with no
+    lookup, so every worker (or a proxy holding the same key) can verify it.
+    Without a configured key, signing is off rather than per-process.
+    Statuses are stored with plain paths and signed as they are returned, so a
+    job polled an hour after it finished still hands out a fresh link.
+    """
+
+    def __init__(self, key: str = URL_SIGNING_KEY, ttl: int = SIGNED_URL_TTL, enabled: bool = SIGNED_URLS_ENABLED):
+        if enabled and not key:
+            # A per-process random key would break links across workers and restarts
+            logger.warning("No URL_SIGNING_KEY or SECRET_KEY set; /files links are not signed. "
+                           "Set a key shared by every worker to enable signing")
+            enabled = False
+        self.key = key.encode("utf-8")
+        self.ttl = max(1, ttl)
+        self.enabled = enabled
+        self.rejected = 0
+
+    def _mac(self, path: str, expires: int) -> str:
+        digest = hmac.new(self.key, f"{path}\n{expires}".encode("utf-8"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+    def sign(self, path: str, ttl: Optional[int] = None) -> str:
+        """Signed URL for path, valid for at least ttl seconds"""
+        expires = int(time.time()) + (ttl or self.ttl)
+        expires += -expires % EXPIRY_GRANULARITY
+        return f"{quote(path)}?expires={expires}&signature={self._mac(path, expires)}"
+
+    def verify(self, path: str, expires: Optional[str], signature: Optional[str]) -> int:
+        """Check a link to path and return the seconds it stays valid; raises InvalidSignatureError"""
+        if not expires or not signature or not expires.isdigit():
+            self.rejected += 1
+            raise InvalidSignatureError("Missing or malformed link signature")
+        if not hmac.compare_digest(self._mac(path, int(expires)), signature):
+            self.rejected += 1
+            raise InvalidSignatureError("Invalid link signature")
+        remaining = int(expires) - int(time.time())
+        if remaining <= 0:
+            self.rejected += 1
+            raise InvalidSignatureError("Download link expired")
+        return remaining
+
+    def sign_status(self, status: Optional[Dict]) -> Optional[Dict]:
+        """A job/progress status with its download_url signed (the stored status is not modified)"""
+        if not self.enabled or not status:
+            return status
+        download_url = status.get('download_url')
+        if not download_url or not download_url.startswith(SIGNED_PREFIX) or "?" in download_url:
+            return status
+        return {**status, 'download_url': self.sign(download_url)}
+
+    def stats(self) -> Dict:
+        return {"enabled": self.enabled, "ttl_seconds": self.ttl, "rejected": self.rejected}
+
+# Global URL signer instance
+url_signer = URLSigner()
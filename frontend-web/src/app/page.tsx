@@ -252,7 +252,8 @@ export default function Home() {
           url: videoInfo.url || '',
           format_id: device.quality, // Use device-optimized quality
           output_format: format === 'audio' ? 'mp3' : (device.format === 'mov' ? 'mp4' : device.format), // Use selected format
-          device_type: device.type
+          device_type: device.type,
+          wait: true // Block until the file is ready instead of returning a job id
         }),
         signal: controller.signal
       });
@@ -425,7 +426,8 @@ export default function Home() {
           url: videoInfo.url || '',
           format_id: device.quality, // Use device-optimized quality
           output_format: format === 'audio' ? 'mp3' : (device.format === 'mov' ? 'mp4' : device.format), // Use selected format
-          device_type: device.type
+          device_type: device.type,
+          wait: true // Block until the file is ready instead of returning a job id
         }),
         signal: controller.signal
       });
@@ -664,7 +666,8 @@ export default function Home() {
           url: videoInfo.url || '', // We need to store the original URL
           format_id: formatId,
           output_format: outputFormat,
-          device_type: device.type
+          device_type: device.type,
+          wait: true // Block until the file is ready instead of returning a job id
         }),
         signal: controller.signal
       });